@@ -1,6 +1,16 @@
 from pyramid.config import Configurator
+from pyramid.settings import asbool
 
+import fanscribed.audiojobs
+import fanscribed.bans
+import fanscribed.compaction
+import fanscribed.gitaccounting
+import fanscribed.livestats
+import fanscribed.maintenance
+import fanscribed.metrics
 import fanscribed.mp3
+import fanscribed.profiling
+import fanscribed.writer
 from fanscribed.resources import Root
 
 
@@ -10,9 +20,79 @@ def main(global_config, **settings):
     # Override mp3splt location as needed.
     if 'fanscribed.mp3splt' in settings:
         fanscribed.mp3.MP3SPLT = settings['fanscribed.mp3splt']
-        
+    # Override lame location, and low-bitrate snippet bitrate, as needed.
+    if 'fanscribed.lame' in settings:
+        fanscribed.mp3.LAME = settings['fanscribed.lame']
+    if 'fanscribed.low_bitrate_kbps' in settings:
+        fanscribed.mp3.LOW_BITRATE_KBPS = int(settings['fanscribed.low_bitrate_kbps'])
+    # Without lame, only offer full-quality snippets.
+    fanscribed.mp3.LOW_BITRATE_AVAILABLE = fanscribed.mp3.lame_available()
+    # Cut snippets with mp3splt (default), or in-process using frame indexes.
+    if 'fanscribed.snippet_cutter' in settings:
+        fanscribed.mp3.SNIPPET_CUTTER = settings['fanscribed.snippet_cutter']
+    # Limit how much snippet audio is cut at once.
+    fanscribed.audiojobs.scheduler = fanscribed.audiojobs.Scheduler(
+        workers=int(settings.get(
+            'fanscribed.audio_workers', fanscribed.audiojobs.DEFAULT_WORKERS)),
+        queue_limit=int(settings.get(
+            'fanscribed.audio_queue_limit', fanscribed.audiojobs.DEFAULT_QUEUE_LIMIT)),
+        retry_after=int(settings.get(
+            'fanscribed.audio_retry_after', fanscribed.audiojobs.DEFAULT_RETRY_AFTER)),
+    )
+    # Ban lists, kept in memory and reloaded when their files change.
+    if settings.get('fanscribed.ip_address_bans'):
+        fanscribed.bans.ip_address_bans = fanscribed.bans.BanList(
+            settings['fanscribed.ip_address_bans'], ranges=True)
+    if settings.get('fanscribed.email_bans'):
+        fanscribed.bans.email_bans = fanscribed.bans.BanList(settings['fanscribed.email_bans'])
+    # Keep author and transcript leaderboards up to date in process.
+    if asbool(settings.get('fanscribed.live_stats', False)):
+        fanscribed.livestats.engine = fanscribed.livestats.LiveStats(
+            repos_path=settings['fanscribed.repos'],
+            snippet_ms=int(settings['fanscribed.snippet_seconds']) * 1000,
+            poll_interval=int(settings.get('fanscribed.live_stats_poll', 5)),
+            store=settings.get('fanscribed.live_stats_store') or None,
+        )
+    # Send writes to the writer daemon, so that several workers can serve.
+    if settings.get('fanscribed.writer_socket'):
+        fanscribed.writer.socket_path = settings['fanscribed.writer_socket']
+        if 'fanscribed.writer_timeout' in settings:
+            fanscribed.writer.timeout = int(settings['fanscribed.writer_timeout'])
+    # Repack repositories with many loose objects, from the process that
+    # makes writes: this one, or the writer's.
+    if 'fanscribed.maintenance_loose_objects' in settings:
+        fanscribed.maintenance.loose_objects_threshold = int(settings['fanscribed.maintenance_loose_objects'])
+    if 'fanscribed.maintenance_packs' in settings:
+        fanscribed.maintenance.packs_threshold = int(settings['fanscribed.maintenance_packs'])
+    if int(settings.get('fanscribed.maintenance_interval', 0)):
+        fanscribed.maintenance.scheduler = fanscribed.maintenance.Scheduler(
+            repos_path=settings['fanscribed.repos'],
+            interval=int(settings['fanscribed.maintenance_interval']),
+        )
+        if fanscribed.writer.socket_path is None:
+            fanscribed.maintenance.scheduler.start()
+
     config = Configurator(root_factory=Root, settings=settings)
 
+    # Time requests and their phases, for /metrics.
+    if asbool(settings.get('fanscribed.metrics', False)):
+        fanscribed.metrics.enabled = True
+        config.add_tween('fanscribed.metrics.metrics_tween_factory')
+    # Count git subprocesses and object reads per request, logging heavy ones.
+    if asbool(settings.get('fanscribed.git_accounting', False)):
+        fanscribed.gitaccounting.enabled = True
+        if 'fanscribed.git_accounting_threshold' in settings:
+            fanscribed.gitaccounting.threshold = int(settings['fanscribed.git_accounting_threshold'])
+        config.add_tween('fanscribed.gitaccounting.git_accounting_tween_factory')
+    # Profile requests asked for by administrators, and a sample of the rest.
+    if settings.get('fanscribed.profile_dir'):
+        fanscribed.profiling.directory = settings['fanscribed.profile_dir']
+        fanscribed.profiling.secret = settings.get('fanscribed.profile_secret') or None
+        fanscribed.profiling.sample = int(settings.get('fanscribed.profile_sample', 0))
+        fanscribed.profiling.keep = int(settings.get(
+            'fanscribed.profile_keep', fanscribed.profiling.keep))
+        config.add_tween('fanscribed.profiling.profiling_tween_factory')
+
     # Routes
     config.add_route('robots_txt', '/robots.txt')
 
@@ -37,6 +117,11 @@ def main(global_config, **settings):
 
     config.add_route('snippet_mp3', '/snippet.mp3')
 
+    config.add_route('live_stats_authors', '/stats/authors.json')
+    config.add_route('live_stats_transcripts', '/stats/transcripts.json')
+
+    config.add_route('metrics', '/metrics')
+
     config.add_route('rss_basic', '/rss/basic')
     config.add_route('rss_completion', '/rss/completion')
     config.add_route('rss_kudos', '/rss/kudos')
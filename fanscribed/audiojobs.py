@@ -0,0 +1,120 @@
+"""Bounded pool of worker threads for generating snippet audio.
+
+Jobs are keyed by the file they produce, so concurrent requests for the
+same snippet wait on a single job instead of each running mp3splt.
+"""
+
+import Queue
+import sys
+import threading
+
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_LIMIT = 20
+DEFAULT_RETRY_AFTER = 5  # seconds
+
+
+class QueueFull(Exception):
+    """Raised when too many audio jobs are already waiting for a worker."""
+
+    def __init__(self, retry_after):
+        Exception.__init__(self, 'Audio job queue is full; retry after {0}s'.format(retry_after))
+        self.retry_after = retry_after
+
+
+class Job(object):
+    """A single call to ``function``, whose result any number of threads may wait for."""
+
+    def __init__(self, key, function, args, kwargs):
+        self.key = key
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.exc_info = None
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            self.result = self.function(*self.args, **self.kwargs)
+        except Exception:
+            self.exc_info = sys.exc_info()
+        self._done.set()
+
+    def wait(self):
+        """Wait for the job to finish; return its result, or re-raise its exception."""
+        self._done.wait()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+
+class Scheduler(object):
+    """Runs jobs on a fixed number of worker threads, started on first use."""
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_limit=DEFAULT_QUEUE_LIMIT,
+                 retry_after=DEFAULT_RETRY_AFTER):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.retry_after = retry_after
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs = {
+            # key: Job(),  (waiting or running)
+        }
+        self._waiting = 0
+        self._threads = []
+
+    def submit(self, key, function, *args, **kwargs):
+        """Return the in-flight Job for ``key``, or queue a new one that calls
+        ``function(*args, **kwargs)``.
+
+        Raise QueueFull if ``queue_limit`` jobs are already waiting.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                # Someone else asked for it first; share their job.
+                return job
+            if self._waiting >= self.queue_limit:
+                raise QueueFull(self.retry_after)
+            job = self._jobs[key] = Job(key, function, args, kwargs)
+            self._waiting += 1
+            if not self._threads:
+                self._start_workers()
+        self._queue.put(job)
+        return job
+
+    def prefetch(self, key, function, *args, **kwargs):
+        """Like ``submit``, but only queue a new job while fewer than half of
+        ``queue_limit`` jobs are waiting, leaving room for jobs that someone
+        is waiting on.  Return the Job, or None if it was not queued."""
+        with self._lock:
+            if key not in self._jobs and self._waiting * 2 >= self.queue_limit:
+                return None
+        try:
+            return self.submit(key, function, *args, **kwargs)
+        except QueueFull:
+            return None
+
+    def _start_workers(self):
+        for x in xrange(self.workers):
+            thread = threading.Thread(target=self._work, name='audiojobs-{0}'.format(x))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._waiting -= 1
+            try:
+                job.run()
+            finally:
+                with self._lock:
+                    del self._jobs[job.key]
+
+
+# May be replaced, based on app settings.
+scheduler = Scheduler()
@@ -0,0 +1,143 @@
+"""Ban lists of IP addresses and email addresses.
+
+Each ban list file has one ban per line, as ``address;reason``.  Lines
+without a ``;`` are ignored.  IP address bans may also be CIDR ranges,
+such as ``192.0.2.0/24;reason`` or ``2001:db8::/32;reason``; an address
+in more than one range gets the reason of the narrowest.
+
+Files are read into memory the first time they are needed, and again only
+when they change, so checking a ban takes the same time however long the
+list grows.
+"""
+
+import logging
+import os
+import socket
+import threading
+
+
+# Set by ``fanscribed.main`` from fanscribed.ip_address_bans and
+# fanscribed.email_bans.
+ip_address_bans = None
+email_bans = None
+
+
+log = logging.getLogger(__name__)
+
+
+def _address_bits(address):
+    """Return (family, bits as a string of '0' and '1') for an IP address,
+    or (None, None) if it is not one."""
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            packed = socket.inet_pton(family, address)
+        except (socket.error, ValueError):
+            continue
+        return family, ''.join(bin(ord(byte))[2:].zfill(8) for byte in packed)
+    return None, None
+
+
+class PrefixTrie(object):
+    """Reasons for bit-string prefixes, looked up by longest match."""
+
+    def __init__(self):
+        # Each node is [child for '0', child for '1', reason or None].
+        self._root = [None, None, None]
+
+    def add(self, prefix, reason):
+        node = self._root
+        for bit in prefix:
+            index = bit == '1'
+            if node[index] is None:
+                node[index] = [None, None, None]
+            node = node[index]
+        node[2] = reason
+
+    def longest_match(self, bits):
+        """Return the reason of the longest prefix of ``bits``, or None."""
+        node = self._root
+        reason = node[2]
+        for bit in bits:
+            node = node[bit == '1']
+            if node is None:
+                break
+            if node[2] is not None:
+                reason = node[2]
+        return reason
+
+
+class BanList(object):
+    """The bans in ``filename``, reloaded when it changes.  With ``ranges``,
+    entries containing '/' are CIDR ranges of IP addresses."""
+
+    def __init__(self, filename, ranges=False):
+        self.filename = filename
+        self.allow_ranges = ranges
+        self._lock = threading.Lock()
+        self._stat = None
+        self._exact = {
+            # address: reason,
+        }
+        self._ranges = {
+            # family: PrefixTrie,
+        }
+
+    def _reload_if_changed(self):
+        try:
+            stat = os.stat(self.filename)
+            stat = (stat.st_mtime, stat.st_size)
+        except OSError:
+            # No file, no bans.
+            stat = None
+        if stat == self._stat:
+            return
+        with self._lock:
+            if stat == self._stat:
+                # Reloaded by another thread in the meantime.
+                return
+            exact, ranges = {}, {}
+            if stat is not None:
+                with open(self.filename, 'rU') as f:
+                    for line in f:
+                        if ';' in line:
+                            address, reason = line.strip().split(';', 1)
+                            self._add(exact, ranges, address.strip(), reason.strip())
+            # Replace, rather than update, so lookups never see a partial list.
+            self._exact, self._ranges = exact, ranges
+            self._stat = stat
+
+    def _add(self, exact, ranges, address, reason):
+        if not self.allow_ranges or '/' not in address:
+            exact[address] = reason
+            return
+        address, prefix_length = address.split('/', 1)
+        family, bits = _address_bits(address)
+        if family is None or not prefix_length.isdigit() or int(prefix_length) > len(bits):
+            log.warning('%s: ignoring invalid range %s/%s', self.filename, address, prefix_length)
+            return
+        trie = ranges.get(family)
+        if trie is None:
+            trie = ranges[family] = PrefixTrie()
+        trie.add(bits[:int(prefix_length)], reason)
+
+    def reason(self, address):
+        """Return why ``address`` is banned, or None if it isn't."""
+        self._reload_if_changed()
+        reason = self._exact.get(address)
+        if reason is None and self._ranges:
+            family, bits = _address_bits(address)
+            trie = self._ranges.get(family)
+            if trie is not None:
+                reason = trie.longest_match(bits)
+        return reason
+
+
+def banned_message(ip_address, email=None):
+    """Return why a visitor from ``ip_address`` with ``email`` is banned,
+    or None if they aren't."""
+    if ip_address_bans is not None:
+        reason = ip_address_bans.reason(ip_address)
+        if reason is not None:
+            return reason
+    if email and email_bans is not None:
+        return email_bans.reason(email)
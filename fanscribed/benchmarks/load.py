@@ -0,0 +1,261 @@
+"""Load-test the web app in process, with a concurrent mix of requests.
+
+A synthetic transcript repository is generated (see ``synthrepo``), then
+worker threads drive the WSGI app directly, without a server in between,
+reading the transcript, polling progress and updates, fetching RSS feeds,
+and locking, saving, and cancelling snippets and reviews.  Latency and
+throughput are reported per endpoint.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from webob import Request
+
+import git
+
+import fanscribed
+from fanscribed.benchmarks.synthrepo import generate_repo
+
+
+HOST_NAME = 'bench.example.com'
+
+
+# Relative weight of each kind of client action.
+DEFAULT_MIX = {
+    'read': 30,
+    'progress': 20,
+    'snippets_updated': 20,
+    'transcribe': 20,
+    'rss': 10,
+}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Drive the web app in process, and report latency per endpoint.',
+    )
+    parser.add_argument(
+        '--threads', '-t',
+        metavar='COUNT',
+        type=int,
+        default=8,
+        help='number of concurrent clients',
+    )
+    parser.add_argument(
+        '--actions', '-n',
+        metavar='COUNT',
+        type=int,
+        default=1000,
+        help='total number of client actions; one transcribe action makes two requests',
+    )
+    parser.add_argument(
+        '--mix', '-m',
+        metavar='ACTION:WEIGHT',
+        type=str,
+        nargs='*',
+        default=[],
+        help='relative weight of an action ({0})'.format(
+            ', '.join('{0}:{1}'.format(*item) for item in sorted(DEFAULT_MIX.iteritems()))),
+    )
+    parser.add_argument(
+        '--duration', '-d',
+        metavar='SECONDS',
+        type=int,
+        default=3600,
+        help='length of the synthetic transcript',
+    )
+    parser.add_argument(
+        '--commits', '-c',
+        metavar='COUNT',
+        type=int,
+        default=500,
+        help='depth of the synthetic transcript history',
+    )
+    parser.add_argument(
+        '--authors', '-a',
+        metavar='COUNT',
+        type=int,
+        default=10,
+        help='number of authors in the synthetic transcript history',
+    )
+    parser.add_argument(
+        '--seed',
+        metavar='SEED',
+        type=int,
+        default=None,
+        help='random seed, for repeatable runs',
+    )
+    return parser
+
+
+class Client(object):
+    """One simulated visitor, timing each request it makes by route."""
+
+    def __init__(self, app, rnd, since_rev):
+        self.app = app
+        self.rnd = rnd
+        self.since_rev = since_rev
+        self.email = 'load{0}@example.com'.format(rnd.randint(0, 99))
+        self.timings = {
+            # route: [seconds, ...],
+        }
+
+    def request(self, route, path, **post):
+        request = Request.blank(
+            path,
+            POST=post or None,
+            headers={'Host': HOST_NAME},
+            environ={'REMOTE_ADDR': '127.0.0.1'},
+        )
+        start = time.time()
+        response = request.get_response(self.app)
+        self.timings.setdefault(route, []).append(time.time() - start)
+        if response.status_int >= 500:
+            raise IOError('{0} returned {1}'.format(path, response.status))
+        return response
+
+    def read(self):
+        self.request('read', '/')
+
+    def progress(self):
+        self.request('progress', '/progress')
+
+    def snippets_updated(self):
+        self.request('snippets_updated', '/snippets_updated?since={0}'.format(self.since_rev))
+
+    def rss(self):
+        feed = self.rnd.choice(['basic', 'completion', 'kudos'])
+        self.request('rss_' + feed, '/rss/' + feed)
+
+    def transcribe(self):
+        identity = dict(identity_name='Load Tester', identity_email=self.email)
+        for lock_type in ['snippet', 'review']:
+            response = self.request('lock_' + lock_type, '/lock_' + lock_type, **identity)
+            info = json.loads(response.body)
+            if info['lock_acquired']:
+                break
+        else:
+            # Nothing left to lock.
+            return
+        unlock = dict(identity, lock_secret=info['lock_secret'],
+                      starting_point=str(info['starting_point']))
+        if self.rnd.random() < 0.1:
+            self.request('cancel_' + lock_type, '/cancel_' + lock_type, **unlock)
+        elif lock_type == 'snippet':
+            self.request('save_snippet', '/save_snippet',
+                         snippet_text=info['snippet_text'] + ' load', **unlock)
+        else:
+            self.request('save_review', '/save_review',
+                         review_text_1=info['review_text_1'] + ' load',
+                         review_text_2=info['review_text_2'], **unlock)
+
+
+def percentile(timings, fraction):
+    """Return the value ``fraction`` of the way through sorted ``timings``."""
+    return timings[min(int(len(timings) * fraction), len(timings) - 1)]
+
+
+def run(app, actions, threads, mix, since_rev, seed=None):
+    """Have ``threads`` clients perform ``actions`` actions chosen by weight
+    from ``mix``; return ({route: [seconds, ...]}, elapsed seconds)."""
+    rnd = random.Random(seed)
+    choices = []
+    for action, weight in sorted(mix.iteritems()):
+        choices.extend([action] * weight)
+    queue = [rnd.choice(choices) for x in xrange(actions)]
+    queue_lock = threading.Lock()
+    clients = [Client(app, random.Random(rnd.random()), since_rev) for x in xrange(threads)]
+    errors = []
+
+    def work(client):
+        while True:
+            with queue_lock:
+                if not queue:
+                    return
+                action = queue.pop()
+            try:
+                getattr(client, action)()
+            except Exception as e:
+                errors.append(e)
+                return
+
+    workers = [threading.Thread(target=work, args=(client,)) for client in clients]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+    if errors:
+        raise errors[0]
+    timings = {}
+    for client in clients:
+        for route, route_timings in client.timings.iteritems():
+            timings.setdefault(route, []).extend(route_timings)
+    return timings, elapsed
+
+
+def report(timings, elapsed):
+    print '{0:>18} {1:>7} {2:>10} {3:>10} {4:>10}'.format('endpoint', 'count', 'p50', 'p99', 'req/s')
+    for route, route_timings in sorted(timings.iteritems()):
+        route_timings.sort()
+        print '{0:>18} {1:7d} {2:8.2f}ms {3:8.2f}ms {4:10.1f}'.format(
+            route,
+            len(route_timings),
+            percentile(route_timings, 0.50) * 1000,
+            percentile(route_timings, 0.99) * 1000,
+            len(route_timings) / elapsed,
+        )
+    total = sum(len(route_timings) for route_timings in timings.itervalues())
+    print '{0:>18} {1:7d} in {2:.2f}s, {3:.1f} req/s'.format('total', total, elapsed, total / elapsed)
+
+
+def main():
+    options = get_parser().parse_args()
+    mix = dict(DEFAULT_MIX)
+    for item in options.mix:
+        action, weight = item.split(':')
+        if action not in DEFAULT_MIX:
+            raise SystemExit('Unknown action {0!r}'.format(action))
+        mix[action] = int(weight)
+    path = tempfile.mkdtemp(prefix='fanscribed-load-')
+    try:
+        repos_path = os.path.join(path, 'repos')
+        os.makedirs(repos_path)
+        repo_path = os.path.join(repos_path, HOST_NAME)
+        start = time.time()
+        generate_repo(repo_path, duration=options.duration * 1000, commits=options.commits,
+                      authors=options.authors, seed=options.seed)
+        print 'Generated {0} commits in {1:.2f}s'.format(options.commits, time.time() - start)
+        # Ask for updates since about halfway through the history.
+        since_rev = git.Repo(repo_path).commit('master~{0}'.format(options.commits / 2)).hexsha
+        # The views commit as the configured git user; don't depend on one.
+        os.environ.setdefault('GIT_COMMITTER_NAME', 'Fanscribed')
+        os.environ.setdefault('GIT_COMMITTER_EMAIL', 'fanscribed@example.com')
+        app = fanscribed.main(
+            {},
+            **{
+                'fanscribed.audio': os.path.join(path, 'audio'),
+                'fanscribed.cache': os.path.join(path, 'cache'),
+                'fanscribed.repos': repos_path,
+                'fanscribed.repo_templates': os.path.join(path, 'templates'),
+                'fanscribed.snippet_cache': os.path.join(path, 'snippets'),
+                'fanscribed.snippet_url_prefix': '/static/snippets/',
+                'fanscribed.snippet_seconds': '30',
+                'fanscribed.snippet_padding_seconds': '2.5',
+                # Don't cut audio for locked snippets; there is none.
+                'fanscribed.prefetch_snippets': '-1',
+                'mako.directories': 'fanscribed:templates',
+            }
+        )
+        timings, elapsed = run(app, options.actions, options.threads, mix, since_rev, options.seed)
+        report(timings, elapsed)
+    finally:
+        shutil.rmtree(path)
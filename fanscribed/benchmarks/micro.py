@@ -0,0 +1,300 @@
+"""Micro-benchmarks of hot functions, compared against stored baselines.
+
+Each benchmark times one function over generated inputs of increasing
+size.  Results are saved as JSON, in seconds per call, keyed by
+'name/size'.  ``baseline.json`` next to this module holds the results the
+current code is expected to match; compare a run against it to see
+whether a change made things faster or slower::
+
+    $ fanscribed-bench-micro run --output after.json
+    $ fanscribed-bench-micro compare after.json
+
+Timings depend on the machine, so regenerate the baseline (``run
+--save-baseline``) on the machine you compare on, before making changes.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+import git
+
+from pyramid import testing
+
+from fanscribed.benchmarks.synthrepo import generate_repo, WORDS
+
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Flag results more than this fraction slower than the baseline.
+DEFAULT_THRESHOLD = 0.25
+
+# Time each benchmark in runs of at least this many seconds.
+MIN_RUN_TIME = 0.1
+RUNS = 7
+
+SNIPPET_SECONDS = 30
+
+
+BENCHMARKS = [
+    # (name, sizes, setup),
+]
+
+
+def benchmark(*sizes):
+    """Register a benchmark.  The decorated ``setup(size, path)`` returns a
+    function of no arguments to time; ``path`` is a scratch directory."""
+    def register(setup):
+        BENCHMARKS.append((setup.__name__, sizes, setup))
+        return setup
+    return register
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Run micro-benchmarks, or compare their results with a baseline.',
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='run benchmarks')
+    run_parser.add_argument(
+        'names',
+        metavar='NAME',
+        type=str,
+        nargs='*',
+        help='only run these benchmarks (default: all of {0})'.format(
+            ', '.join(name for name, sizes, setup in BENCHMARKS)),
+    )
+    run_parser.add_argument(
+        '--output', '-o',
+        metavar='FILE',
+        type=str,
+        default=None,
+        help='write results to FILE',
+    )
+    run_parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        default=False,
+        help='write results to {0}'.format(BASELINE),
+    )
+    compare_parser = subparsers.add_parser('compare', help='compare results with a baseline')
+    compare_parser.add_argument(
+        'results',
+        metavar='FILE',
+        type=str,
+        help='results of a run',
+    )
+    compare_parser.add_argument(
+        '--baseline', '-b',
+        metavar='FILE',
+        type=str,
+        default=BASELINE,
+        help='results to compare with (default: the stored baseline)',
+    )
+    compare_parser.add_argument(
+        '--threshold', '-t',
+        metavar='FRACTION',
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help='flag results this much slower than the baseline (default: %(default)s)',
+    )
+    return parser
+
+
+# ===================================================================
+# inputs
+
+
+def _dialogue(lines, speakers=5):
+    """Return ``lines`` lines of transcript text, as saved by the editor."""
+    return u'\n'.join(
+        u'{0};{1} {2}'.format(
+            # Speakers often carry on past one line.
+            u's{0}'.format(x / 3 % speakers) if x % 3 == 0 else u'',
+            u' '.join(WORDS[(x + y) % len(WORDS)] for y in xrange(20)),
+            u'caf\xe9',
+        )
+        for x in xrange(lines)
+    )
+
+
+def _repo(path, name, snippets, **kwargs):
+    """Return a synthetic transcript of ``snippets`` snippets, mostly transcribed."""
+    repo_path = os.path.join(path, name)
+    kwargs.setdefault('commits', snippets * 2)
+    generate_repo(repo_path, duration=snippets * SNIPPET_SECONDS * 1000,
+                  snippet_ms=SNIPPET_SECONDS * 1000, seed=0, **kwargs)
+    return git.Repo(repo_path)
+
+
+# ===================================================================
+# benchmarks
+
+
+@benchmark(10, 100, 1000)
+def dialogue_list(size, path):
+    from fanscribed.transcripts import dialogue_list
+    text = _dialogue(size)
+    return lambda: dialogue_list(text)
+
+
+@benchmark(10, 100, 1000)
+def normalized_text(size, path):
+    from fanscribed.transcripts import normalized_text
+    text = _dialogue(size)
+    return lambda: normalized_text(text)
+
+
+@benchmark(10, 100, 1000)
+def split_lines_and_expand_abbreviations(size, path):
+    from fanscribed.views import _split_lines_and_expand_abbreviations
+    text = _dialogue(size).encode('utf8')
+    speakers_map = dict(('s{0}'.format(x), 'Speaker {0}'.format(x)) for x in xrange(5))
+    return lambda: _split_lines_and_expand_abbreviations(text, speakers_map)
+
+
+@benchmark(10, 100, 1000)
+def slugify(size, path):
+    from fanscribed.views import _slugify
+    text = (u'H\xe9ll\xf8 W\xf6rld ' * size)[:size]
+    return lambda: _slugify(text)
+
+
+@benchmark(120, 1200)
+def progress_dicts(size, path):
+    from fanscribed.views import _progress_dicts
+    repo = _repo(path, 'progress-{0}'.format(size), size)
+    tree = repo.tree('master')
+    info = json.load(tree['transcription.json'].data_stream)
+    return lambda: _progress_dicts(tree, info)
+
+
+@benchmark(10, 100, 1000)
+def speakers_map(size, path):
+    from fanscribed.repos import speakers_map
+    repo = _repo(path, 'speakers-{0}'.format(size), 10, speakers=size)
+    commit = repo.commit('master')
+    return lambda: speakers_map(repo, commit)
+
+
+@benchmark(120, 1200)
+def lock_available_snippet(size, path):
+    from fanscribed.repos import lock_available_snippet
+    repo = _repo(path, 'lock-snippet-{0}'.format(size), size)
+    index = repo.index
+    # Locks are written to the working tree, but never committed, so every
+    # call chooses from the same snippets.
+    return lambda: lock_available_snippet(repo, index, None)
+
+
+@benchmark(120, 1200)
+def lock_available_review(size, path):
+    from fanscribed.repos import lock_available_review
+    repo = _repo(path, 'lock-review-{0}'.format(size), size)
+    index = repo.index
+    return lambda: lock_available_review(repo, index)
+
+
+@benchmark(10, 1000, 100000)
+def ban_list(size, path):
+    from fanscribed.bans import BanList
+    filename = os.path.join(path, 'ip_address_bans-{0}.txt'.format(size))
+    with open(filename, 'wb') as f:
+        for x in xrange(size):
+            # Half single addresses, half /24 ranges.
+            if x % 2:
+                f.write('10.{0}.{1}.{2};abuse\n'.format(x >> 16 & 255, x >> 8 & 255, x & 255))
+            else:
+                f.write('172.{0}.{1}.0/24;abuse\n'.format(x >> 8 & 255, x & 255))
+    bans = BanList(filename, ranges=True)
+    return lambda: bans.reason('192.0.2.1')
+
+
+# ===================================================================
+# running and comparing
+
+
+def time_function(function):
+    """Return the best time, in seconds per call, of ``RUNS`` runs of ``function``."""
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < MIN_RUN_TIME:
+        number *= 2
+    return min(timer.repeat(RUNS, number)) / number
+
+
+def run(names=None):
+    """Run the benchmarks named (default: all), and return {'name/size': seconds}."""
+    results = {}
+    path = tempfile.mkdtemp(prefix='fanscribed-micro-')
+    # Views and repos read settings from the current registry.
+    testing.setUp(settings={'fanscribed.snippet_seconds': str(SNIPPET_SECONDS)})
+    try:
+        for name, sizes, setup in BENCHMARKS:
+            if names and name not in names:
+                continue
+            for size in sizes:
+                key = '{0}/{1}'.format(name, size)
+                results[key] = time_function(setup(size, path))
+                print '{0:>45} {1:12.2f}us'.format(key, results[key] * 1e6)
+                sys.stdout.flush()
+    finally:
+        testing.tearDown()
+        shutil.rmtree(path)
+    return results
+
+
+def save(filename, results):
+    with open(filename, 'wb') as f:
+        json.dump(dict(
+            python=platform.python_version(),
+            machine=platform.platform(),
+            results=results,
+        ), f, indent=4, sort_keys=True)
+
+
+def load(filename):
+    with open(filename, 'rb') as f:
+        return json.load(f)['results']
+
+
+def compare(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """Print how ``results`` compare with ``baseline``; return the keys of
+    results more than ``threshold`` slower."""
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            print '{0:>45} {1:>12} {2:12.2f}us'.format(key, 'new', results[key] * 1e6)
+            continue
+        change = results[key] / baseline[key] - 1
+        if change > threshold:
+            verdict = 'SLOWER'
+            regressions.append(key)
+        elif change < -threshold:
+            verdict = 'faster'
+        else:
+            verdict = ''
+        print '{0:>45} {1:12.2f}us {2:12.2f}us {3:+7.1%} {4}'.format(
+            key, baseline[key] * 1e6, results[key] * 1e6, change, verdict)
+    return regressions
+
+
+def main():
+    options = get_parser().parse_args()
+    if options.command == 'run':
+        results = run(options.names)
+        if options.output:
+            save(options.output, results)
+        if options.save_baseline:
+            save(BASELINE, results)
+    else:
+        regressions = compare(load(options.baseline), load(options.results), options.threshold)
+        if regressions:
+            print '{0} benchmark(s) more than {1:.0%} slower than the baseline'.format(
+                len(regressions), options.threshold)
+            sys.exit(1)
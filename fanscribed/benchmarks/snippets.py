@@ -0,0 +1,103 @@
+"""Benchmark snippet cutting with mp3splt against the in-process frame index."""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from fanscribed import mp3
+from fanscribed import mp3frames
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Compare snippet cutting with mp3splt and with MP3 frame indexes.',
+    )
+    parser.add_argument(
+        'full_mp3',
+        metavar='MP3',
+        type=str,
+        help='full episode MP3 file to cut snippets from',
+    )
+    parser.add_argument(
+        '--snippets', '-n',
+        metavar='COUNT',
+        type=int,
+        default=20,
+        help='number of random snippets to cut with each cutter',
+    )
+    parser.add_argument(
+        '--snippet-seconds', '-s',
+        metavar='SECONDS',
+        type=int,
+        default=30,
+        help='length of each snippet',
+    )
+    parser.add_argument(
+        '--padding-seconds', '-p',
+        metavar='SECONDS',
+        type=float,
+        default=2.5,
+        help='padding on either side of each snippet',
+    )
+    parser.add_argument(
+        '--mp3splt',
+        metavar='PATH',
+        type=str,
+        default=mp3.MP3SPLT,
+        help='location of the mp3splt tool',
+    )
+    return parser
+
+
+def time_cutter(cutter, full_mp3, duration, starting_points, length, padding):
+    """Return a sorted list of the seconds taken to cut each snippet with the given cutter."""
+    mp3.SNIPPET_CUTTER = cutter
+    output_path = tempfile.mkdtemp(prefix='fanscribed-bench-')
+    try:
+        timings = []
+        for starting_point in starting_points:
+            start = time.time()
+            mp3.snippet_path(
+                full_mp3=full_mp3,
+                duration=duration,
+                output_path=output_path,
+                starting_point=starting_point,
+                length=length,
+                padding=padding,
+            )
+            timings.append(time.time() - start)
+        return sorted(timings)
+    finally:
+        shutil.rmtree(output_path)
+
+
+def report(label, timings):
+    print '{0:>8}: mean {1:8.2f}ms  p50 {2:8.2f}ms  max {3:8.2f}ms'.format(
+        label,
+        sum(timings) * 1000 / len(timings),
+        timings[len(timings) / 2] * 1000,
+        timings[-1] * 1000,
+    )
+
+
+def main():
+    options = get_parser().parse_args()
+    mp3.MP3SPLT = options.mp3splt
+    full_mp3 = os.path.abspath(options.full_mp3)
+    # Build the frame index up front; it is built once per episode.
+    start = time.time()
+    mp3frames.build_index(full_mp3)
+    index = mp3frames.frame_index(full_mp3)
+    print 'Frame index: {0} frames, built in {1:.2f}s'.format(index.frame_count, time.time() - start)
+    duration = index.duration
+    length = options.snippet_seconds * 1000
+    padding = int(options.padding_seconds * 1000)
+    starting_points = [
+        random.randrange(0, max(duration - length, 1))
+        for x in xrange(options.snippets)
+    ]
+    for cutter in ['mp3splt', 'frames']:
+        report(cutter, time_cutter(cutter, full_mp3, duration, starting_points, length, padding))
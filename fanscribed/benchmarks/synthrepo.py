@@ -0,0 +1,241 @@
+"""Generate synthetic transcript repositories to benchmark against.
+
+Repositories are laid out the way the initrepo command lays them out, with
+a history of authors locking, saving, and cancelling snippets and reviews
+the way the views do.  History is written with a single 'git fast-import'
+so that deep histories take seconds rather than hours.
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import subprocess
+
+from fanscribed.repos import label_from_ms
+
+
+WORDS = """
+    the of and to a in that is was he for it with as his on be at by i this
+    had not are but from or have an they which one you were her all she there
+    would their we him been has when who will more no if out so said what up
+    its about into than them can only other new some could time these two may
+""".split()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic transcript repository.',
+    )
+    parser.add_argument(
+        'repo_path',
+        metavar='PATH',
+        type=str,
+        help='repository to create; its name is the host it is served at',
+    )
+    parser.add_argument(
+        '--duration', '-d',
+        metavar='SECONDS',
+        type=int,
+        default=3600,
+        help='length of the transcribed audio',
+    )
+    parser.add_argument(
+        '--snippet-seconds', '-s',
+        metavar='SECONDS',
+        type=int,
+        default=30,
+        help='length of each snippet',
+    )
+    parser.add_argument(
+        '--commits', '-c',
+        metavar='COUNT',
+        type=int,
+        default=200,
+        help='number of commits after the initial one',
+    )
+    parser.add_argument(
+        '--authors', '-a',
+        metavar='COUNT',
+        type=int,
+        default=10,
+        help='number of distinct authors',
+    )
+    parser.add_argument(
+        '--speakers',
+        metavar='COUNT',
+        type=int,
+        default=2,
+        help='number of distinct speakers in the audio',
+    )
+    parser.add_argument(
+        '--seed',
+        metavar='SEED',
+        type=int,
+        default=None,
+        help='random seed, for repeatable histories',
+    )
+    return parser
+
+
+def _snippet_filename(starting_point):
+    return '{0:016d}.txt'.format(starting_point)
+
+
+def _json(value):
+    # As written by initrepo and fanscribed.repos.
+    return json.dumps(value, indent=4)
+
+
+class _FastImport(object):
+    """Write commits to the master branch of a repository through 'git fast-import'."""
+
+    def __init__(self, repo_path):
+        self.process = subprocess.Popen(
+            ['git', 'fast-import', '--quiet'],
+            cwd=repo_path,
+            stdin=subprocess.PIPE,
+        )
+        self.marks = 0
+
+    def commit(self, name, email, date, message, files):
+        """Commit ``files`` ({path: content}) on top of the previous commit."""
+        write = self.process.stdin.write
+        self.marks += 1
+        write('commit refs/heads/master\n')
+        write('mark :{0}\n'.format(self.marks))
+        for kind in ['author', 'committer']:
+            write('{0} {1} <{2}> {3} +0000\n'.format(kind, name, email, date))
+        write('data {0}\n{1}\n'.format(len(message), message))
+        if self.marks > 1:
+            write('from :{0}\n'.format(self.marks - 1))
+        for path, content in sorted(files.iteritems()):
+            write('M 100644 inline {0}\ndata {1}\n{2}\n'.format(path, len(content), content))
+        write('\n')
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise IOError('git fast-import failed')
+
+
+def generate_repo(repo_path, duration=3600000, snippet_ms=30000, commits=200, authors=10,
+                  speakers=2, seed=None, start_time=1300000000):
+    """Create a transcript repository at ``repo_path`` with ``duration`` ms of
+    audio, and up to ``commits`` commits after the initial one by ``authors``
+    distinct authors, transcribing ``speakers`` distinct speakers.  Return the
+    number of commits made after the initial one.
+
+    Snippets are transcribed in order, then reviewed in order, then edited
+    at random, as when someone picks a snippet to correct from the page.
+    """
+    rnd = random.Random(seed)
+    host_name = os.path.basename(os.path.normpath(repo_path))
+    subprocess.check_call(['git', 'init', '-q', repo_path])
+    subprocess.check_call(['git', 'symbolic-ref', 'HEAD', 'refs/heads/master'], cwd=repo_path)
+    identities = [
+        ('Author {0}'.format(x), 'author{0}@example.com'.format(x))
+        for x in xrange(authors)
+    ]
+    remaining_snippets = range(0, duration, snippet_ms)
+    remaining_reviews = remaining_snippets[:-1]
+    abbreviations = ['s{0}'.format(x) for x in xrange(speakers)]
+    locks = {'snippet': {}, 'review': {}}
+    texts = {}
+    importer = _FastImport(repo_path)
+    now = start_time
+    importer.commit('Fanscribed', 'fanscribed@example.com', now, 'Initial commit.', {
+        'transcription.json': _json({
+            'audio_url': 'http://{0}/audio.mp3'.format(host_name),
+            'bytes_total': duration * 16,  # 128kbps
+            'duration': duration,
+            'title': 'Synthetic transcript {0}'.format(host_name),
+        }),
+        'remaining_snippets.json': _json(remaining_snippets),
+        'remaining_reviews.json': _json(remaining_reviews),
+        'speakers.txt': ''.join(
+            '{0}; Speaker {1}\n'.format(abbreviation, x)
+            for x, abbreviation in enumerate(abbreviations)
+        ),
+    })
+    made = 0
+    all_snippets = list(remaining_snippets)
+    while made + 2 <= commits:
+        name, email = rnd.choice(identities)
+        if remaining_snippets:
+            lock_type = 'snippet'
+            starting_point = remaining_snippets[0]
+        elif remaining_reviews:
+            lock_type = 'review'
+            starting_point = remaining_reviews[0]
+        else:
+            lock_type = 'snippet'
+            starting_point = rnd.choice(all_snippets)
+        label = label_from_ms(starting_point)
+        # Lock it...
+        now += rnd.randint(5, 120)
+        locks[lock_type][str(starting_point)] = {
+            'secret': ''.join(rnd.choice(string.letters) for x in xrange(16)),
+            'timestamp': now,
+        }
+        importer.commit(name, email, now, '{0}: {1}, locked by {2}'.format(lock_type, label, name),
+                        {'locks.json': _json(locks)})
+        # ...then save it, or sometimes give up on it.
+        now += rnd.randint(60, 600)
+        del locks[lock_type][str(starting_point)]
+        files = {'locks.json': _json(locks)}
+        if rnd.random() < 0.1:
+            action = 'cancel'
+        elif lock_type == 'snippet' and starting_point in remaining_snippets:
+            action = 'saved'
+            texts[starting_point] = _snippet_text(rnd, snippet_ms, abbreviations)
+            files[_snippet_filename(starting_point)] = texts[starting_point]
+            remaining_snippets.remove(starting_point)
+            files['remaining_snippets.json'] = _json(remaining_snippets)
+        elif lock_type == 'snippet':
+            action = 'saved'
+            texts[starting_point] += ' ' + rnd.choice(WORDS)
+            files[_snippet_filename(starting_point)] = texts[starting_point]
+        else:
+            action = 'saved'
+            for edited in [starting_point, starting_point + snippet_ms]:
+                texts[edited] = texts.get(edited, '') + ' ' + rnd.choice(WORDS)
+                files[_snippet_filename(edited)] = texts[edited]
+            remaining_reviews.remove(starting_point)
+            files['remaining_reviews.json'] = _json(remaining_reviews)
+        importer.commit(name, email, now, '{0}: {1}, {2} by {3}'.format(lock_type, label, action, name),
+                        files)
+        made += 2
+    importer.close()
+    # Check out master, as initrepo leaves it.
+    subprocess.check_call(['git', 'reset', '-q', '--hard', 'master'], cwd=repo_path)
+    return made
+
+
+def _snippet_text(rnd, snippet_ms, abbreviations):
+    """Return about as many words as are spoken in a snippet, split among speakers."""
+    lines = []
+    words = snippet_ms / 400  # 150 words per minute
+    while words > 0:
+        count = min(words, rnd.randint(5, 40))
+        words -= count
+        lines.append('{0}; {1}'.format(
+            rnd.choice(abbreviations),
+            ' '.join(rnd.choice(WORDS) for x in xrange(count)),
+        ))
+    return '\n'.join(lines)
+
+
+def main():
+    options = get_parser().parse_args()
+    made = generate_repo(
+        options.repo_path,
+        duration=options.duration * 1000,
+        snippet_ms=options.snippet_seconds * 1000,
+        commits=options.commits,
+        authors=options.authors,
+        speakers=options.speakers,
+        seed=options.seed,
+    )
+    print 'Created {0} with {1} commits after the initial one'.format(options.repo_path, made)
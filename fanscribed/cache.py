@@ -6,6 +6,7 @@ import random
 import time
 
 from fanscribed.common import app_settings
+from fanscribed import metrics
 
 
 def _cache_path():
@@ -15,6 +16,7 @@ def _cache_path():
     return path
 
 
+@metrics.timed('cache')
 def get_cached_content(key):
     """Return (content, mtime) associated with ``key``, or ``(None, None)`` if not found."""
     # Convert key to a hash.
@@ -23,11 +25,16 @@ def get_cached_content(key):
     content_path = os.path.join(_cache_path(), hashed_key)
     try:
         with open(content_path, 'rb') as f:
-            return f.read(), os.fstat(f.fileno()).st_mtime
+            content = f.read(), os.fstat(f.fileno()).st_mtime
     except IOError:
+        metrics.count_cache_lookup(hit=False)
         return None, None
+    else:
+        metrics.count_cache_lookup(hit=True)
+        return content
 
 
+@metrics.timed('cache')
 def cache_content(key, content, mtime=None):
     """Cache the given content."""
     # Convert key to a hash.
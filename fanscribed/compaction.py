@@ -0,0 +1,190 @@
+"""Fold lock-only commits out of transcript history.
+
+Most commits in a finished transcript only lock, or cancel a lock on, a
+snippet or review, changing nothing but locks.json.  Compaction rewrites
+master without them: each is folded into the next commit that changes
+anything else, which keeps its own tree, author, dates and message, plus a
+line recording each commit folded into it.  Lock-only commits after the
+last of those are kept, so master's tree does not change.
+
+Every rewritten commit's new sha is recorded in the repository's git
+directory (see ``repos.current_sha``), so that ``?rev=`` links, the
+``since`` of snippets_updated, and fanscribed-stats carry on from the
+commits that replaced the ones they knew of.  A folded commit is replaced
+by its nearest kept ancestor.
+
+Compaction drops the commits that tell when each lock was taken, so run
+fanscribed-stats with a store first, to keep lock times in it.  It runs
+through the writer, if there is one, but only holds ``repos.commit_lock``
+to move master to the rewritten history; if master moved while history
+was being rewritten, the new commits are rewritten too::
+
+    $ paster compact production.ini [HOST_NAME ...]
+"""
+
+import json
+import os
+import time
+
+import git
+from gitdb.util import hex_to_bin
+
+from paste.deploy.loadwsgi import loadapp
+from paste.script.command import Command
+from pyramid.threadlocal import manager
+
+from fanscribed.gitlog import iter_log
+from fanscribed import repos
+from fanscribed import writer
+
+
+# Only fold commits at least this many days old.
+DEFAULT_DAYS = 7
+
+# Times to rewrite history before giving up, if master keeps moving.
+ATTEMPTS = 3
+
+# Seconds for ``paster compact`` to wait for the writer to compact a
+# repository; rewriting a long history can take minutes.
+CALL_TIMEOUT = 60 * 60
+
+
+def lock_only(entry):
+    """Return True if the LogEntry only changes locks.json."""
+    return [path for path, blob_sha in entry.changes] == ['locks.json']
+
+
+def _folded_line(commit):
+    return u'Folded: {0} ({1}, {2})'.format(
+        commit.summary, commit.author.email, commit.authored_date)
+
+
+def _save_shas(repo, replaced):
+    """Add {old hexsha: new hexsha} to the shas recorded by earlier compactions."""
+    filename = os.path.join(repo.git_dir, repos.COMPACTED_SHAS)
+    shas = dict(repos.compacted_shas(repo))
+    # Commits that replaced others may themselves have been replaced.
+    for old_sha, new_sha in shas.items():
+        shas[old_sha] = replaced.get(new_sha, new_sha)
+    shas.update(replaced)
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        json.dump(shas, f)
+    os.rename(temp_filename, filename)
+
+
+def _rewrite(repo, old_head, cutoff):
+    """Write the compacted history of ``old_head``, and return (new head
+    hexsha, {old hexsha: new hexsha}, number of commits folded, number of
+    commits before)."""
+    entries = list(iter_log(repo, until=old_head))
+    # Only fold commits that have a later commit to fold them into.
+    last_kept = max([0] + [x for x, entry in enumerate(entries) if not lock_only(entry)])
+    replaced = {
+        # old hexsha: new hexsha,
+    }
+    folded = [
+        # commit,
+    ]
+    parent_sha = None
+    folded_count = 0
+    for x, entry in enumerate(entries):
+        if 0 < x < last_kept and lock_only(entry) and entry.authored_date < cutoff:
+            folded.append(repo.commit(entry.hexsha))
+            folded_count += 1
+            replaced[entry.hexsha] = parent_sha
+            continue
+        commit = repo.commit(entry.hexsha)
+        old_parent_sha = commit.parents[0].hexsha if commit.parents else None
+        if not folded and old_parent_sha == parent_sha:
+            # Nothing before it has changed.
+            parent_sha = entry.hexsha
+            continue
+        message = commit.message
+        if folded:
+            message = u'\n'.join([message.rstrip(u'\n'), u''] + [_folded_line(c) for c in folded]) + u'\n'
+            folded = []
+        new_commit = git.Commit(
+            repo, git.Commit.NULL_BIN_SHA, commit.tree,
+            commit.author, commit.authored_date, commit.author_tz_offset,
+            commit.committer, commit.committed_date, commit.committer_tz_offset,
+            message, [git.Commit(repo, hex_to_bin(parent_sha))], commit.encoding,
+        )
+        repos.write_commit(repo, new_commit)
+        parent_sha = replaced[entry.hexsha] = new_commit.hexsha
+    return parent_sha, replaced, folded_count, len(entries)
+
+
+@writer.operation(locked=False)
+def compact(repo, days=DEFAULT_DAYS):
+    """Fold lock-only commits at least ``days`` old out of master's history.
+    Return the number of commits before and after."""
+    cutoff = time.time() - days * 24 * 60 * 60
+    for attempt in xrange(ATTEMPTS):
+        old_head = repo.commit('master').hexsha
+        if repo.git.rev_list('--merges', '--max-count=1', old_head):
+            raise ValueError('History has merges; not compacted')
+        # Writes carry on while history is rewritten.
+        new_head, replaced, folded_count, before = _rewrite(repo, old_head, cutoff)
+        if new_head == old_head:
+            return dict(before=before, after=before)
+        with repos.commit_lock:
+            if repo.commit('master').hexsha != old_head:
+                # Written to meanwhile; rewrite again, including the new commits.
+                continue
+            _save_shas(repo, replaced)
+            # The reflog keeps the old history reachable, for stats to compare locks with.
+            repo.git.update_ref('-m', 'compact: folded {0} commits'.format(folded_count),
+                                'refs/heads/master', new_head, old_head)
+        return dict(before=before, after=int(repo.git.rev_list('--count', new_head)))
+    raise ValueError('Master kept moving; not compacted')
+
+
+class CompactCommand(Command):
+
+    min_args = 1
+    usage = 'CONFIG_FILE [HOST_NAME ...]'
+    takes_config_file = 1
+    summary = 'Fold lock-only commits out of transcript history'
+    description = """\
+    This command rewrites the history of the given transcript repositories
+    (or all of them, if none are given), folding commits that only lock or
+    cancel a snippet or review into the next commit.  If
+    fanscribed.writer_socket is set, the writer does the work, alongside
+    writes; otherwise, only run this while the app is stopped.
+    """
+    default_verbosity = 1
+
+    parser = Command.standard_parser()
+    parser.add_option(
+        '--days',
+        type='int',
+        dest='days',
+        default=DEFAULT_DAYS,
+        help='Only fold commits at least this many days old (default: %default)',
+    )
+
+    def command(self):
+        # Load config file.
+        app_spec = 'config:{0}'.format(self.args[0])
+        base = os.getcwd()
+        app = loadapp(app_spec, name='main', relative_to=base, global_conf={})
+        # Read settings.
+        settings = app.registry.settings
+        repos_path = settings['fanscribed.repos']
+        # Operations read settings from the current registry.
+        manager.push({'registry': app.registry, 'request': None})
+        host_names = self.args[1:] or sorted(os.listdir(repos_path))
+        for host_name in host_names:
+            try:
+                if writer.socket_path is not None:
+                    result = writer.call(writer.socket_path, 'compact', host_name,
+                                         wait=CALL_TIMEOUT, days=self.options.days)
+                else:
+                    result = writer.run('compact', host_name, days=self.options.days)
+            except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+                print '{0}: not a transcript repository; skipped.'.format(host_name)
+            except (ValueError, writer.WriterError) as e:
+                print '{0}: {1}'.format(host_name, e)
+            else:
+                print '{0}: {1} commits, now {2}'.format(host_name, result['before'], result['after'])
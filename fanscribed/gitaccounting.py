@@ -0,0 +1,169 @@
+"""Count the git work each request does.
+
+GitPython turns ``iter_commits``, ``commit.stats``, ``tree[...]`` and
+``data_stream`` into git subprocesses, 'git cat-file' round trips, and
+object database reads, without saying so.  Repositories handed out by
+``repos.repo_from_request`` are wrapped so that each of these is counted
+against the request being handled.  Counts go into histograms at
+/metrics, and requests that use git more than a threshold are logged with
+their route and the commits they asked for.
+"""
+
+import logging
+import threading
+
+import git
+
+from fanscribed import metrics
+
+
+# Set by ``fanscribed.main`` when fanscribed.git_accounting is enabled.
+enabled = False
+
+# Log requests making more git subprocesses, cat-file requests and object
+# reads than this, in all.
+threshold = 100
+
+
+log = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+git_processes = metrics.Histogram(
+    'fanscribed_git_processes',
+    'git subprocesses started per request.',
+    ['route'],
+    COUNT_BUCKETS,
+)
+cat_file_requests = metrics.Histogram(
+    'fanscribed_git_cat_file_requests',
+    'Objects asked of git cat-file per request.',
+    ['route'],
+    COUNT_BUCKETS,
+)
+object_reads = metrics.Histogram(
+    'fanscribed_git_object_reads',
+    'Objects read from repository object databases per request.',
+    ['route'],
+    COUNT_BUCKETS,
+)
+object_bytes = metrics.Histogram(
+    'fanscribed_git_object_bytes',
+    'Bytes of objects read from repository object databases per request.',
+    ['route'],
+    BYTES_BUCKETS,
+)
+metrics.METRICS.extend([git_processes, cat_file_requests, object_reads, object_bytes])
+
+
+class _RequestCounts(object):
+
+    def __init__(self):
+        self.processes = 0
+        self.cat_file_requests = 0
+        self.object_reads = 0
+        self.object_bytes = 0
+        self.commits = [
+            # hexsha,
+        ]
+
+    @property
+    def total(self):
+        return self.processes + self.cat_file_requests + self.object_reads
+
+
+def _current():
+    """Return the _RequestCounts of the request being handled, if any."""
+    return getattr(_local, 'request_counts', None)
+
+
+class CountingGit(git.cmd.Git):
+    """Counts the subprocesses it starts, and the objects it asks cat-file for."""
+
+    def execute(self, command, *args, **kwargs):
+        counts = _current()
+        if counts is not None:
+            counts.processes += 1
+        return git.cmd.Git.execute(self, command, *args, **kwargs)
+
+    def get_object_header(self, ref):
+        counts = _current()
+        if counts is not None:
+            counts.cat_file_requests += 1
+        return git.cmd.Git.get_object_header(self, ref)
+
+    def stream_object_data(self, ref):
+        counts = _current()
+        if counts is not None:
+            counts.cat_file_requests += 1
+        return git.cmd.Git.stream_object_data(self, ref)
+
+
+class CountingObjectDB(object):
+    """Wraps an object database, counting the objects and bytes read from it."""
+
+    def __init__(self, odb):
+        self._odb = odb
+
+    def __getattr__(self, name):
+        return getattr(self._odb, name)
+
+    def info(self, binsha):
+        counts = _current()
+        if counts is not None:
+            counts.object_reads += 1
+        return self._odb.info(binsha)
+
+    def stream(self, binsha):
+        ostream = self._odb.stream(binsha)
+        counts = _current()
+        if counts is not None:
+            counts.object_reads += 1
+            counts.object_bytes += ostream.size
+        return ostream
+
+
+def account(repo):
+    """Have the git work done through ``repo`` counted; return ``repo``."""
+    repo.git = CountingGit(repo.working_dir)
+    repo.odb = CountingObjectDB(repo.odb)
+    return repo
+
+
+def note_commit(commit):
+    """Remember that the current request asked for ``commit``."""
+    counts = _current()
+    if counts is not None:
+        counts.commits.append(commit.hexsha)
+
+
+def git_accounting_tween_factory(handler, registry):
+    """Count the git work done by each request, by the route it matched."""
+
+    def git_accounting_tween(request):
+        counts = _local.request_counts = _RequestCounts()
+        try:
+            return handler(request)
+        finally:
+            _local.request_counts = None
+            route = getattr(request, 'matched_route', None)
+            route = route.name if route is not None else metrics.NO_ROUTE
+            git_processes.observe((route,), counts.processes)
+            cat_file_requests.observe((route,), counts.cat_file_requests)
+            object_reads.observe((route,), counts.object_reads)
+            object_bytes.observe((route,), counts.object_bytes)
+            if counts.total > threshold:
+                log.warning(
+                    '%s %s: %d git processes, %d cat-file requests, %d object reads '
+                    '(%d bytes); commits %s, since %s',
+                    route, request.host,
+                    counts.processes, counts.cat_file_requests,
+                    counts.object_reads, counts.object_bytes,
+                    ', '.join(counts.commits) or '-', request.GET.get('since', '-'),
+                )
+
+    return git_accounting_tween
@@ -0,0 +1,72 @@
+"""Stream the history of a transcription repository out of a single 'git log'.
+
+``commit.stats`` runs a 'git diff' for every commit it is asked about; the
+reader here gets every commit's author and changed files from one
+'git log --raw' process per repository.
+"""
+
+from collections import namedtuple
+
+
+# One commit's worth of history.
+LogEntry = namedtuple('LogEntry', [
+    'hexsha',  # str
+    'author_name',  # unicode
+    'author_email',  # unicode
+    'authored_date',  # int, seconds since epoch
+    'changes',  # [(path, blob hexsha, or None if deleted), ...]
+])
+
+
+LOG_FORMAT = 'commit %H%x09%at%x09%ae%x09%an'
+DELETED = 'D'
+
+
+def iter_log(repo, until='master', since=None):
+    """Yield a LogEntry for each commit reachable from ``until`` but not
+    from ``since``, eldest first."""
+    if since is None:
+        revisions = until
+    else:
+        revisions = '{0}..{1}'.format(since, until)
+    process = repo.git.log(
+        '--raw',
+        '--no-renames',
+        '--no-abbrev',
+        '--no-color',
+        '--reverse',
+        '--format=' + LOG_FORMAT,
+        revisions,
+        as_process=True,
+    )
+    entry = None
+    for line in process.stdout:
+        line = line.rstrip('\n')
+        if line.startswith(':'):
+            # ":old_mode new_mode old_sha new_sha status\tpath"
+            meta, path = line.split('\t', 1)
+            new_sha, status = meta.split()[3:5]
+            entry.changes.append((path, None if status == DELETED else new_sha))
+        elif line.startswith('commit '):
+            if entry is not None:
+                yield entry
+            hexsha, authored_date, email, name = line[7:].split('\t', 3)
+            entry = LogEntry(
+                hexsha=hexsha,
+                author_name=name.decode('utf8', 'replace'),
+                author_email=email.decode('utf8', 'replace'),
+                authored_date=int(authored_date),
+                changes=[],
+            )
+    if entry is not None:
+        yield entry
+    process.wait()
+
+
+def blob_sha_at(repo, rev, path):
+    """Return the hexsha of the blob at ``path`` in ``rev``, or None if absent."""
+    tree = repo.commit(rev).tree
+    if path in tree:
+        return tree[path].hexsha
+    else:
+        return None
@@ -9,7 +9,8 @@ import json
 from paste.deploy.loadwsgi import loadapp
 from paste.script.command import Command
 
-from fanscribed import mp3
+from fanscribed import mp3frames
+from fanscribed.pregenerate import pregenerate_from_settings
 
 
 class InitRepoCommand(Command):
@@ -25,6 +26,13 @@ class InitRepoCommand(Command):
     default_verbosity = 1
 
     parser = Command.standard_parser()
+    parser.add_option(
+        '--pregenerate',
+        action='store_true',
+        dest='pregenerate',
+        default=False,
+        help='Pre-generate all snippet MP3 files after creating the repository',
+    )
 
     def command(self):
         # Load config file.
@@ -91,12 +99,17 @@ class InitRepoCommand(Command):
         # Get information about the audio.
         print 'Inspecting MP3 file for total time.'
         try:
-            mp3_duration_ms = mp3.duration(full_audio_file)
+            mp3_duration_ms = mp3frames.duration(full_audio_file)
         except IOError:
             print 'Could not determine duration of MP3 file!'
             return 1
         else:
             print 'MP3 file is {0}ms long'.format(mp3_duration_ms)
+        print 'Building MP3 frame index.'
+        try:
+            mp3frames.build_index(full_audio_file)
+        except IOError:
+            print 'Could not build frame index; use the mp3splt snippet cutter.'
         # Prepare the repository.
         print 'Preparing repository.'
         repo = git.Repo.init(repo_path)
@@ -145,4 +158,8 @@ class InitRepoCommand(Command):
             repo.index.add([template_filename])
         print 'Initial commit, using your globally configured name and email.'
         repo.index.commit('Initial commit.')
+        if self.options.pregenerate:
+            print 'Pre-generating snippets (please be patient)'
+            snippet_count = pregenerate_from_settings(settings, host_name)
+            print 'Snippets: {0}'.format(snippet_count)
         print 'Done!'
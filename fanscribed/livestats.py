@@ -0,0 +1,349 @@
+"""Author and transcript leaderboards, kept up to date inside the web app.
+
+Views that commit to a transcription repository ``notify`` the engine, and
+a worker thread reads just the new commits with ``stats.process_repo``,
+adds them to running totals, and renders the leaderboards as JSON.  Serving
+a leaderboard only hands out the last rendering.
+
+Commits made through other workers, or by the writer, don't notify this
+engine, so every ``poll_interval`` seconds the worker thread also looks for
+repositories whose master has moved.
+
+When the app starts, the worker thread is started the first time a
+leaderboard is asked for, or a view commits.  It first loads what
+fanscribed-stats has saved in its ``store``, if given, then reads every
+repository from the latest commit stored, or from its first commit.  Until
+it has, leaderboards are served as far as they have got, marked
+``warming_up``.
+"""
+
+from hashlib import sha1
+import logging
+import os
+import threading
+import time
+
+from ujson import dumps, load
+
+import git
+
+from fanscribed import stats
+from fanscribed.statsevents import Interner, LockEvents, SnippetEvents, LOCK_TYPES, NONE
+
+
+# Indexes into each author's running totals.
+ACTIONS = 0
+TRANSCRIPTIONS = 1
+TIME_SPENT = 2
+TIME_SPENT_TRANSCRIBING = 3
+BYTES_TRANSCRIBED = 4
+
+
+# Set by ``fanscribed.main`` when fanscribed.live_stats is enabled.
+engine = None
+
+
+log = logging.getLogger(__name__)
+
+
+class LiveStats(object):
+    """Stats for every repository under ``repos_path``, updated incrementally."""
+
+    def __init__(self, repos_path, snippet_ms=30000, poll_interval=5, store=None):
+        self.repos_path = repos_path
+        self.snippet_ms = snippet_ms
+        self.poll_interval = poll_interval
+        self.store = store
+        self.author_ids = Interner()
+        self.repo_ids = Interner()
+        self.snippets = SnippetEvents()
+        self.locks = LockEvents()
+        self.names = [
+            # set(), (indexed by author id)
+        ]
+        self.totals = [
+            # [actions, transcriptions, time_spent, ...], (indexed by author id)
+        ]
+        self.transcribers = {
+            # repo id: {author id: snippets transcribed},
+        }
+        self.progress = {
+            # repo name: {...},
+        }
+        self.latest_commits = {
+            # repo name: hexsha,
+        }
+        self._authors_json = dumps({'authors': [], 'updated': None, 'warming_up': True})
+        self._transcripts_json = dumps({'transcripts': [], 'updated': None, 'warming_up': True})
+        self._update_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending = set([
+            # repo name,
+        ])
+        self._wakeup = threading.Event()
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def repo_names(self):
+        """Return the names of the transcription repositories under ``repos_path``."""
+        return sorted(
+            name for name in os.listdir(self.repos_path)
+            if os.path.isfile(os.path.join(self.repos_path, name, 'transcription.json'))
+        )
+
+    def changed_repo_names(self):
+        """Return the names of repositories whose master is not the latest
+        commit read."""
+        changed = []
+        for name in self.repo_names():
+            try:
+                hexsha = git.Repo(os.path.join(self.repos_path, name)).commit('master').hexsha
+            except Exception:
+                log.exception('Could not read master of %s', name)
+                continue
+            if hexsha != self.latest_commits.get(name):
+                changed.append(name)
+        return changed
+
+    def notify(self, repo_name):
+        """Have the worker thread read new commits in ``repo_name``."""
+        with self._lock:
+            self._pending.add(repo_name)
+            self._start()
+        self._wakeup.set()
+
+    def authors_json(self):
+        """Return the author leaderboard as JSON, as far as it has got."""
+        with self._lock:
+            self._start()
+        return self._authors_json
+
+    def transcripts_json(self):
+        """Return the transcript leaderboard as JSON, as far as it has got."""
+        with self._lock:
+            self._start()
+        return self._transcripts_json
+
+    def stop(self):
+        """Stop the worker thread, once it has finished any update."""
+        self._stopping.set()
+        self._wakeup.set()
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _start(self):
+        # Called with self._lock held.
+        if self._thread is None and not self._stopping.is_set():
+            self._pending.update(self.repo_names())
+            self._thread = threading.Thread(target=self._run, name='fanscribed-livestats')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        if self.store is not None:
+            self._load_store()
+        while not self._stopping.is_set():
+            self.update()
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                changed = self.changed_repo_names()
+            except Exception:
+                # Keep serving what we have, and try again next time.
+                log.exception('Could not look for new commits')
+                changed = []
+            with self._lock:
+                self._pending.update(changed)
+
+    def _load_store(self):
+        """Start from what fanscribed-stats saved in the store, and render it."""
+        if not os.path.isfile(self.store):
+            log.warning('No stats store at %s; reading every commit', self.store)
+            return
+        with self._update_lock:
+            try:
+                store = stats.StatsStore(self.store)
+                try:
+                    results = stats.store_repo_results(store, self.repo_names())
+                finally:
+                    store.close()
+                for result in results:
+                    self._merge(result)
+                for result in results:
+                    self.progress[result.name] = self._repo_progress(
+                        git.Repo(os.path.join(self.repos_path, result.name)))
+                self._render()
+            except Exception:
+                # Read what is missing from the repositories instead.
+                log.exception('Could not load live stats from %s', self.store)
+
+    def update(self, repo_names=None):
+        """Read new commits in ``repo_names``, or in repositories that views
+        have notified us of, then render the leaderboards."""
+        with self._update_lock:
+            if repo_names is None:
+                with self._lock:
+                    repo_names, self._pending = self._pending, set()
+                if not repo_names and self._ready.is_set():
+                    # Nothing new since the last rendering.
+                    return
+            for name in sorted(repo_names):
+                try:
+                    self._update_repo(name)
+                except Exception:
+                    log.exception('Could not update live stats for %s', name)
+            # Warmed up, even if some repositories could not be read.
+            self._ready.set()
+            try:
+                self._render()
+            except Exception:
+                log.exception('Could not render live stats')
+
+    def _update_repo(self, name):
+        path = os.path.join(self.repos_path, name)
+        result = stats.process_repo((path, name, self.latest_commits.get(name), {}))
+        if result.latest_commit != self.latest_commits.get(name):
+            self._merge(result)
+            self.progress[name] = self._repo_progress(git.Repo(path))
+
+    def _author(self, email):
+        author = self.author_ids.id(email)
+        if author == len(self.totals):
+            self.names.append(set())
+            self.totals.append([0, 0, 0, 0, 0])
+        return author
+
+    def _merge(self, result):
+        """Add a RepoResult to the event columns and running totals.
+
+        Snippet actions go first, so that locks removed when a snippet is
+        saved can tell whether they were spent transcribing it.
+        """
+        repo = self.repo_ids.id(result.name)
+        for email, names in result.author_names.iteritems():
+            self.names[self._author(email)].update(names)
+        snippets = self.snippets
+        start = len(snippets)
+        for starting_point, action in result.snippet_actions:
+            snippets.append(repo, starting_point, self._author(action.email),
+                            action.saved, action.bytes)
+        first_actions = snippets.first_actions()
+        transcribers = self.transcribers.setdefault(repo, {})
+        for row in xrange(start, len(snippets)):
+            author = snippets.author[row]
+            totals = self.totals[author]
+            totals[ACTIONS] += 1
+            if first_actions[(repo, snippets.starting_point[row])] == row:
+                totals[TRANSCRIPTIONS] += 1
+                transcribers[author] = transcribers.get(author, 0) + 1
+        closed = []
+        for locks_dict in [result.snippet_locks, result.review_locks]:
+            for secret, lock in locks_dict.iteritems():
+                row = self.locks.append(
+                    secret,
+                    repo,
+                    LOCK_TYPES.index(lock.type),
+                    lock.starting_point,
+                    lock.timestamp,
+                    lock.created_at,
+                    self._author(lock.created_by),
+                    lock.destroyed_at if lock.destroyed_at is not None else NONE,
+                    self._author(lock.destroyed_by) if lock.destroyed_by is not None else NONE,
+                    1 if lock.completed else 0,
+                )
+                if lock.destroyed_at is not None:
+                    closed.append(row)
+        for lock_type, secret, destroyed_at, destroyed_by, completed in result.destroyed_locks:
+            row = self.locks.destroy(secret, destroyed_at, self._author(destroyed_by), int(completed))
+            if row is not None:
+                closed.append(row)
+        for row in closed:
+            self._close_lock(row, first_actions)
+        self.latest_commits[result.name] = result.latest_commit
+
+    def _close_lock(self, row, first_actions):
+        """Count the time spent holding a removed lock, as ``author_totals`` does."""
+        locks = self.locks
+        created_by = locks.created_by[row]
+        if created_by != locks.destroyed_by[row]:
+            return
+        destroyed_at = locks.destroyed_at[row]
+        duration = destroyed_at - locks.created_at[row]
+        totals = self.totals[created_by]
+        totals[TIME_SPENT] += duration
+        first = first_actions.get((locks.repo[row], locks.starting_point[row]))
+        if first is not None and self.snippets.saved[first] == destroyed_at:
+            totals[TIME_SPENT_TRANSCRIBING] += duration
+            totals[BYTES_TRANSCRIBED] += self.snippets.bytes[first]
+
+    def _repo_progress(self, repo):
+        master = repo.tree('master')
+        duration = load(master['transcription.json'].data_stream)['duration']
+        total_snippets = stats.snippets_in_ms(duration, self.snippet_ms)
+        total_reviews = max(total_snippets - 1, 0)
+        remaining_snippets = len(load(master['remaining_snippets.json'].data_stream))
+        remaining_reviews = len(load(master['remaining_reviews.json'].data_stream))
+        snippets_completed = total_snippets - remaining_snippets
+        reviews_completed = total_reviews - remaining_reviews
+        return dict(
+            snippets_completed=snippets_completed,
+            total_snippets=total_snippets,
+            percent_snippets=(snippets_completed * 100) / total_snippets if total_snippets else 100,
+            reviews_completed=reviews_completed,
+            total_reviews=total_reviews,
+            percent_reviews=(reviews_completed * 100) / total_reviews if total_reviews else 100,
+        )
+
+    def _author_entry(self, author):
+        return {
+            # Identify authors the same way their stats pages are named.
+            'id': sha1(self.author_ids[author]).hexdigest(),
+            'names': sorted(self.names[author]),
+        }
+
+    def _render(self):
+        """Render both leaderboards, so that reads need not."""
+        updated = int(time.time())
+        warming_up = not self._ready.is_set()
+        authors = []
+        for author, totals in enumerate(self.totals):
+            if not totals[ACTIONS]:
+                # Only include authors who have contributed at least one snippet.
+                continue
+            entry = self._author_entry(author)
+            entry.update(
+                actions=totals[ACTIONS],
+                transcriptions=totals[TRANSCRIPTIONS],
+                hours=round(totals[TIME_SPENT] / 60.0 / 60.0, 2),
+                wpm=0.0,
+            )
+            if totals[TRANSCRIPTIONS] and totals[TIME_SPENT_TRANSCRIBING]:
+                entry['wpm'] = round(
+                    (totals[BYTES_TRANSCRIBED] / 5.0) / (totals[TIME_SPENT_TRANSCRIBING] / 60.0), 2)
+            authors.append((totals[TIME_SPENT], entry))
+        # Sort by total time spent transcribing and editing.
+        authors.sort(key=lambda item: (-item[0], u', '.join(item[1]['names']).lower()))
+        transcripts = []
+        for name in sorted(self.progress):
+            entry = dict(self.progress[name], name=name, transcriptionists=[])
+            transcribers = self.transcribers.get(self.repo_ids.id(name), {})
+            for author, count in sorted(transcribers.iteritems(), key=lambda item: (-item[1], item[0])):
+                author_entry = self._author_entry(author)
+                author_entry['snippets'] = count
+                entry['transcriptionists'].append(author_entry)
+            transcripts.append(entry)
+        self._authors_json = dumps({
+            'authors': [item[1] for item in authors],
+            'updated': updated,
+            'warming_up': warming_up,
+        })
+        self._transcripts_json = dumps({
+            'transcripts': transcripts,
+            'updated': updated,
+            'warming_up': warming_up,
+        })
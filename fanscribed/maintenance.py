@@ -0,0 +1,183 @@
+"""Keep transcript repositories packed.
+
+Every lock, save and cancel adds loose objects to a repository, and git
+reads get slower as they pile up.  When a repository has more than a
+threshold of loose objects or packs, it is repacked into one pack with a
+bitmap index, unreachable loose objects are pruned, and a commit-graph is
+written.
+
+Maintenance is a writer operation, run in whichever process makes writes.
+Git repacks safely while a repository is in use, so only pruning, which
+could remove the objects of a commit being made, holds
+``repos.commit_lock``; writes carry on while the rest runs.  It runs from
+a background thread in that process every fanscribed.maintenance_interval
+seconds, or on demand with::
+
+    $ paster maintain production.ini [HOST_NAME ...]
+"""
+
+import logging
+import os
+import threading
+import time
+
+import git
+
+from paste.deploy.loadwsgi import loadapp
+from paste.script.command import Command
+from pyramid.threadlocal import manager
+
+from fanscribed import repos
+from fanscribed import writer
+
+
+# Set by ``fanscribed.main`` from settings.
+scheduler = None
+loose_objects_threshold = 1000
+packs_threshold = 20
+
+# Only prune unreachable objects older than this, in case something other
+# than the app is writing to the repository.
+PRUNE_EXPIRE = '1.hour.ago'
+
+# Seconds for ``paster maintain`` to wait for the writer to maintain a
+# repository; repacking a large one can take minutes.
+CALL_TIMEOUT = 60 * 60
+
+
+log = logging.getLogger(__name__)
+
+
+def object_counts(repo):
+    """Return the counts of ``git count-objects -v``, e.g. 'count' (loose
+    objects) and 'packs'."""
+    counts = {}
+    for line in repo.git.count_objects('-v').splitlines():
+        key, value = line.split(':', 1)
+        counts[key] = int(value)
+    return counts
+
+
+def needs_maintenance(counts):
+    return counts['count'] >= loose_objects_threshold or counts['packs'] >= packs_threshold
+
+
+def maintain_repo(repo):
+    """Repack, prune, and write a commit-graph for ``repo``.  Call without
+    ``repos.commit_lock`` held."""
+    repo.git.repack('-a', '-d', '-q', '--write-bitmap-index')
+    try:
+        repo.git.commit_graph('write', '--reachable')
+    except git.GitCommandError:
+        # git before 2.18 has no commit-graph.
+        pass
+    with repos.commit_lock:
+        repo.git.prune('--expire=' + PRUNE_EXPIRE)
+
+
+@writer.operation(locked=False)
+def maintain(repo, force=False):
+    """Maintain ``repo`` if it needs it, or if ``force``.  Return the object
+    counts before and after, and the seconds taken, or None if it didn't."""
+    before = object_counts(repo)
+    if not (force or needs_maintenance(before)):
+        return None
+    start = time.time()
+    maintain_repo(repo)
+    return dict(before=before, after=object_counts(repo), seconds=time.time() - start)
+
+
+def describe(name, result):
+    if result is None:
+        return '{0}: nothing to do'.format(name)
+    return '{0}: {1} loose objects in {2} packs, now {3} in {4}, in {5:.1f}s'.format(
+        name,
+        result['before']['count'], result['before']['packs'],
+        result['after']['count'], result['after']['packs'],
+        result['seconds'],
+    )
+
+
+class Scheduler(object):
+    """Maintains every repository under ``repos_path`` that needs it, every
+    ``interval`` seconds, from a background thread."""
+
+    def __init__(self, repos_path, interval):
+        self.repos_path = repos_path
+        self.interval = interval
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='fanscribed-maintenance')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
+
+    def run_once(self):
+        for name in sorted(os.listdir(self.repos_path)):
+            try:
+                repo = git.Repo(os.path.join(self.repos_path, name))
+            except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+                continue
+            try:
+                result = maintain(repo)
+            except Exception:
+                log.exception('Maintenance of %s failed', name)
+            else:
+                if result is not None:
+                    log.info(describe(name, result))
+
+
+class MaintainCommand(Command):
+
+    min_args = 1
+    usage = 'CONFIG_FILE [HOST_NAME ...]'
+    takes_config_file = 1
+    summary = 'Repack and prune transcript repositories'
+    description = """\
+    This command repacks, prunes, and writes commit-graph and bitmap files
+    for the given transcript repositories (or all of them, if none are
+    given) that have too many loose objects or packs.  If
+    fanscribed.writer_socket is set, the writer does the work, alongside
+    writes; otherwise, only run this while the app is stopped.
+    """
+    default_verbosity = 1
+
+    parser = Command.standard_parser()
+    parser.add_option(
+        '--force',
+        action='store_true',
+        dest='force',
+        default=False,
+        help='Maintain repositories whether or not they need it',
+    )
+
+    def command(self):
+        # Load config file.
+        app_spec = 'config:{0}'.format(self.args[0])
+        base = os.getcwd()
+        app = loadapp(app_spec, name='main', relative_to=base, global_conf={})
+        # Read settings.
+        settings = app.registry.settings
+        repos_path = settings['fanscribed.repos']
+        # Operations read settings from the current registry.
+        manager.push({'registry': app.registry, 'request': None})
+        host_names = self.args[1:] or sorted(os.listdir(repos_path))
+        for host_name in host_names:
+            try:
+                if writer.socket_path is not None:
+                    result = writer.call(writer.socket_path, 'maintain', host_name,
+                                         wait=CALL_TIMEOUT, force=self.options.force)
+                else:
+                    result = writer.run('maintain', host_name, force=self.options.force)
+            except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+                print '{0}: not a transcript repository; skipped.'.format(host_name)
+            except writer.WriterError as e:
+                print '{0}: {1}'.format(host_name, e)
+            else:
+                print describe(host_name, result)
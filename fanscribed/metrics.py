@@ -0,0 +1,279 @@
+"""Per-request timing, exposed at /metrics in Prometheus text format.
+
+A tween times each request, and ``timed`` blocks within it time phases of
+the request: git access in ``repos``, cache reads and writes, cutting
+snippet audio, and rendering templates.  ``TimedLock`` records how long
+requests wait for a lock, and how long they then hold it.  When the
+request is done, each phase's total goes into a histogram labelled with
+the route that was matched.
+
+Phases may overlap; git access while holding the commit lock counts
+towards both.  A phase nested in itself, as when one ``repos`` function
+calls another, is only counted once.
+"""
+
+from functools import wraps
+import threading
+import time
+
+
+# Upper bounds of histogram buckets, in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Set by ``fanscribed.main`` when fanscribed.metrics is enabled.
+enabled = False
+
+# Route label of requests that matched no route.
+NO_ROUTE = 'none'
+
+
+_local = threading.local()
+
+
+class Histogram(object):
+    """Counts of observations in cumulative buckets, for each set of labels."""
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values = {
+            # (label value, ...): [bucket count, ..., +Inf count, sum],
+        }
+
+    def observe(self, labels, value):
+        with self._lock:
+            values = self._values.get(labels)
+            if values is None:
+                values = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for x, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[x] += 1
+            values[-2] += 1
+            values[-1] += value
+
+    def samples(self):
+        """Yield (name, labels, value) for each sample to expose."""
+        with self._lock:
+            items = sorted((labels, list(values)) for labels, values in self._values.iteritems())
+        for labels, values in items:
+            pairs = zip(self.labelnames, labels)
+            for bound, count in zip(self.buckets, values):
+                yield self.name + '_bucket', pairs + [('le', repr(bound))], count
+            yield self.name + '_bucket', pairs + [('le', '+Inf')], values[-2]
+            yield self.name + '_sum', pairs, values[-1]
+            yield self.name + '_count', pairs, values[-2]
+
+
+class Counter(object):
+    """A count that only goes up, for each set of labels."""
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = {
+            # (label value, ...): count,
+        }
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.iteritems())
+        for labels, value in items:
+            yield self.name, zip(self.labelnames, labels), value
+
+
+class CacheHitRatio(object):
+    """The fraction of cache lookups that were hits, computed from ``cache_lookups``."""
+
+    type = 'gauge'
+    name = 'fanscribed_cache_hit_ratio'
+    help = 'Fraction of cache lookups that found cached content.'
+
+    def samples(self):
+        totals = {}
+        for name, pairs, value in cache_lookups.samples():
+            labels = dict(pairs)
+            route_totals = totals.setdefault(labels['route'], {'hit': 0, 'miss': 0})
+            route_totals[labels['result']] += value
+        for route, route_totals in sorted(totals.iteritems()):
+            lookups = route_totals['hit'] + route_totals['miss']
+            yield self.name, [('route', route)], float(route_totals['hit']) / lookups
+
+
+request_seconds = Histogram(
+    'fanscribed_request_seconds',
+    'Time spent handling requests.',
+    ['route'],
+)
+phase_seconds = Histogram(
+    'fanscribed_phase_seconds',
+    'Time spent in each phase of handling requests.',
+    ['route', 'phase'],
+)
+cache_lookups = Counter(
+    'fanscribed_cache_lookups_total',
+    'Cache lookups, by whether cached content was found.',
+    ['route', 'result'],
+)
+
+
+METRICS = [
+    request_seconds,
+    phase_seconds,
+    cache_lookups,
+    CacheHitRatio(),
+]
+
+
+class _RequestTimes(object):
+
+    def __init__(self):
+        self.phases = {
+            # phase: seconds,
+        }
+        self.active = set([
+            # phase,
+        ])
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def _current():
+    """Return the _RequestTimes of the request being handled, if any."""
+    return getattr(_local, 'request_times', None)
+
+
+def add_phase(phase, seconds):
+    """Add ``seconds`` to the time spent in ``phase`` by the current request."""
+    times = _current()
+    if times is not None:
+        times.phases[phase] = times.phases.get(phase, 0.0) + seconds
+
+
+def count_cache_lookup(hit):
+    times = _current()
+    if times is not None:
+        if hit:
+            times.cache_hits += 1
+        else:
+            times.cache_misses += 1
+
+
+class timed(object):
+    """Time a block, or every call of a decorated function, as ``phase``
+    of the current request."""
+
+    def __init__(self, phase):
+        self.phase = phase
+        self._starts = threading.local()
+
+    def __enter__(self):
+        times = _current()
+        if times is None or self.phase in times.active:
+            # Not in a request, or already timing this phase.
+            self._starts.start = None
+        else:
+            times.active.add(self.phase)
+            self._starts.start = time.time()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        start = self._starts.start
+        if start is not None:
+            times = _current()
+            times.active.discard(self.phase)
+            add_phase(self.phase, time.time() - start)
+
+    def __call__(self, function):
+        phase = self.phase
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(phase):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+class TimedLock(object):
+    """A lock that records how long requests wait for it, and then hold it,
+    as the '<name>_wait' and '<name>_hold' phases."""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._acquired_at = None
+
+    def acquire(self, blocking=True):
+        start = time.time()
+        acquired = self._lock.acquire(blocking)
+        if acquired:
+            self._acquired_at = time.time()
+            add_phase(self.name + '_wait', self._acquired_at - start)
+        return acquired
+
+    def release(self):
+        held = time.time() - self._acquired_at
+        self._lock.release()
+        add_phase(self.name + '_hold', held)
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def metrics_tween_factory(handler, registry):
+    """Time each request, and its phases, by the route it matched."""
+
+    def metrics_tween(request):
+        times = _local.request_times = _RequestTimes()
+        start = time.time()
+        try:
+            return handler(request)
+        finally:
+            elapsed = time.time() - start
+            _local.request_times = None
+            route = getattr(request, 'matched_route', None)
+            route = route.name if route is not None else NO_ROUTE
+            request_seconds.observe((route,), elapsed)
+            for phase, seconds in times.phases.iteritems():
+                phase_seconds.observe((route, phase), seconds)
+            if times.cache_hits:
+                cache_lookups.inc((route, 'hit'), times.cache_hits)
+            if times.cache_misses:
+                cache_lookups.inc((route, 'miss'), times.cache_misses)
+
+    return metrics_tween
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def exposition():
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.append('# HELP {0} {1}'.format(metric.name, metric.help))
+        lines.append('# TYPE {0} {1}'.format(metric.name, metric.type))
+        for name, pairs, value in metric.samples():
+            if pairs:
+                name += '{' + ','.join(
+                    '{0}="{1}"'.format(label, _escape(label_value)) for label, label_value in pairs
+                ) + '}'
+            lines.append('{0} {1}'.format(name, repr(value) if isinstance(value, float) else value))
+    return '\n'.join(lines) + '\n'
@@ -1,18 +1,44 @@
-"""Wrapper functions for controlling the 'mp3splt' tool."""
+"""Wrapper functions for controlling the 'mp3splt' tool.
+
+Snippets may instead be cut in-process using a frame index; see
+``fanscribed.mp3frames``.  Low-bitrate variants of snippets are
+transcoded using the 'lame' tool.
+"""
 
 from hashlib import sha1
 import os
+import random
 import re
 import subprocess
 import time
 
+from fanscribed import metrics
+from fanscribed import mp3frames
+
 
 MP3SPLT = 'mp3splt' # may be overridden
+LAME = 'lame' # may be overridden
+LOW_BITRATE_KBPS = 32 # may be overridden
+LOW_BITRATE_AVAILABLE = False # set by fanscribed.main if lame can be run
+SNIPPET_CUTTER = 'mp3splt' # may be overridden with 'frames'
 TOTAL_TIME_RE = re.compile(r'.*Total time: (\d+)m.(\d+)s')
 
 
+def lame_available():
+    """Return True if the 'lame' tool can be run."""
+    try:
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.call([LAME, '--version'], stdout=devnull, stderr=devnull)
+    except OSError:
+        return False
+    return True
+
+
 def duration(filename):
-    """Return the approximate duration, in milliseconds, of the given MP3 file."""
+    """Return the approximate duration, in milliseconds, of the given MP3 file.
+
+    See ``fanscribed.mp3frames.duration`` for an exact, in-process version.
+    """
     mp3splt_output = subprocess.check_output([MP3SPLT, '-qPft', '0.30.00', filename])
     duration = None
     for line in mp3splt_output.splitlines():
@@ -28,11 +54,9 @@ def duration(filename):
         return duration
 
 
-def snippet_path(full_mp3, duration, output_path, starting_point, length, padding):
-    """Extract a snippet of audio from a full MP3, and return its full path.
-
-    All times are given in milliseconds.
-    """
+def _snippet_job(full_mp3, duration, output_path, starting_point, length, padding, variant=None):
+    """Return (output_filename, function, args), where ``function(*args)``
+    creates the snippet and returns its full path."""
     ending_ms = starting_point + length + padding
     starting_point -= padding
     if starting_point < 0:
@@ -52,25 +76,105 @@ def snippet_path(full_mp3, duration, output_path, starting_point, length, paddin
     # Generate a hashed filename based on source file, starting, and ending.
     hash = sha1('{0} {1} {2}'.format(full_mp3, split_start, split_end)).hexdigest()
     output_filename = os.path.join(output_path, '{0}.mp3'.format(hash))
+    args = (full_mp3, output_path, hash, starting_point, ending_ms, split_start, split_end)
+    if variant is None:
+        return output_filename, _cut_snippet, args
+    elif variant == 'low':
+        # Transcoded from the snippet above, and cached under its own hash.
+        low_hash = sha1('{0} low {1}'.format(hash, LOW_BITRATE_KBPS)).hexdigest()
+        low_filename = os.path.join(output_path, '{0}.mp3'.format(low_hash))
+        return low_filename, _transcode_snippet, (args, low_filename)
+    else:
+        raise ValueError('Unknown snippet variant {0!r}'.format(variant))
+
+
+@metrics.timed('audio')
+def snippet_path(full_mp3, duration, output_path, starting_point, length, padding,
+                 scheduler=None, variant=None):
+    """Extract a snippet of audio from a full MP3, and return its full path.
+
+    All times are given in milliseconds.
+
+    If ``variant`` is 'low', return a low-bitrate mono version of the snippet.
+
+    If an ``audiojobs.Scheduler`` is given, the snippet is cut by one of its
+    workers, and concurrent calls for the same snippet share a single job.
+    ``audiojobs.QueueFull`` is raised if the scheduler is too busy.
+    """
+    output_filename, function, args = _snippet_job(
+        full_mp3, duration, output_path, starting_point, length, padding, variant)
     if os.path.isfile(output_filename):
         # File already exists; don't recreate it.
         # Instead, touch it so it doesn't get removed.
         # Touch its access time only, so that its modified time is used to improve caching.
-        # TODO: Fix potential race conditions.
         stat = os.stat(output_filename)
         os.utime(output_filename, (time.time(), stat.st_mtime))
         return output_filename
+    if scheduler is not None:
+        return scheduler.submit(output_filename, function, *args).wait()
     else:
-        subprocess.call([
-            MP3SPLT,
-            '-Qf',
-            '-d', output_path,
-            '-o', hash,
-            full_mp3,
-            split_start,
-            split_end,
-        ])
-        if not os.path.isfile(output_filename):
-            raise IOError('Output file {0} was not generated'.format(output_filename))
-        else:
-            return output_filename
+        return function(*args)
+
+
+def prefetch_snippet(full_mp3, duration, output_path, starting_point, length, padding,
+                     scheduler, variant=None):
+    """Have ``scheduler`` cut a snippet in the background, if it isn't cut yet
+    and the scheduler has room for it.  Don't wait for it."""
+    output_filename, function, args = _snippet_job(
+        full_mp3, duration, output_path, starting_point, length, padding, variant)
+    if not os.path.isfile(output_filename):
+        scheduler.prefetch(output_filename, function, *args)
+
+
+def _cut_snippet(full_mp3, output_path, hash, starting_ms, ending_ms, split_start, split_end):
+    """Cut a snippet into ``output_path``, named after ``hash``, and return its full path."""
+    output_filename = os.path.join(output_path, '{0}.mp3'.format(hash))
+    if os.path.isfile(output_filename):
+        # Cut while we were waiting for a worker.
+        return output_filename
+    if SNIPPET_CUTTER == 'frames':
+        # Slice frame-aligned bytes from the full MP3, without spawning mp3splt.
+        mp3frames.cut_snippet(full_mp3, output_filename, starting_ms, ending_ms)
+        return output_filename
+    # Have mp3splt write to a temporary file, then rename, so that nobody
+    # serves a partially-written snippet.
+    initial_name = '{0}-{1:08x}'.format(hash, random.getrandbits(32))
+    initial_filename = os.path.join(output_path, '{0}.mp3'.format(initial_name))
+    subprocess.call([
+        MP3SPLT,
+        '-Qf',
+        '-d', output_path,
+        '-o', initial_name,
+        full_mp3,
+        split_start,
+        split_end,
+    ])
+    if not os.path.isfile(initial_filename):
+        raise IOError('Output file {0} was not generated'.format(output_filename))
+    else:
+        os.rename(initial_filename, output_filename)
+        return output_filename
+
+
+def _transcode_snippet(cut_args, output_filename):
+    """Transcode the snippet cut by ``_cut_snippet(*cut_args)`` to a low-bitrate
+    mono MP3 at ``output_filename``, and return its full path."""
+    if os.path.isfile(output_filename):
+        # Transcoded while we were waiting for a worker.
+        return output_filename
+    source_filename = _cut_snippet(*cut_args)
+    initial_filename = '{0}-{1:08x}.mp3'.format(output_filename[:-4], random.getrandbits(32))
+    subprocess.call([
+        LAME,
+        '--quiet',
+        '--mp3input',
+        '-m', 'm',
+        '-b', str(LOW_BITRATE_KBPS),
+        source_filename,
+        initial_filename,
+    ])
+    if not os.path.isfile(initial_filename):
+        raise IOError('Output file {0} was not generated'.format(output_filename))
+    else:
+        os.rename(initial_filename, output_filename)
+        return output_filename
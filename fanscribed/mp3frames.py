@@ -0,0 +1,378 @@
+"""In-process MP3 frame parsing, and frame-offset indexes for cutting snippets."""
+
+from collections import namedtuple
+import mmap
+import os
+import random
+import struct
+import threading
+
+
+# Bitrates in kbps, by (is MPEG-1, layer) and then by bitrate index.
+BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Sample rates in Hz, by version bits and then by sample rate index.
+SAMPLE_RATES = {
+    0: [11025, 12000, 8000],  # MPEG-2.5
+    2: [22050, 24000, 16000],  # MPEG-2
+    3: [44100, 48000, 32000],  # MPEG-1
+}
+
+CHANNEL_MODE_MONO = 3
+
+# Xing/Info header flag indicating that a frame count is present.
+XING_FRAMES_FLAG = 0x0001
+
+# Read MP3 files in blocks of this many bytes when streaming through them.
+SCAN_BLOCK_SIZE = 256 * 1024
+
+INDEX_MAGIC = 'FSMP3IDX'
+INDEX_VERSION = 1
+INDEX_HEADER = struct.Struct('<8sIIIII')  # magic, version, sample_rate, samples_per_frame, frame_count, end_offset
+INDEX_OFFSET = struct.Struct('<I')
+
+
+FrameHeader = namedtuple('FrameHeader', [
+    'mpeg1',  # bool
+    'layer',  # 1, 2, or 3
+    'bitrate',  # kbps
+    'sample_rate',  # Hz
+    'channel_mode',  # 0-3; 3 is mono
+    'frame_length',  # bytes, including header
+    'samples',  # samples per frame
+])
+
+
+def parse_header(data, offset):
+    """Return the FrameHeader of the frame at ``offset`` in ``data``,
+    or None if there is no valid frame header there."""
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = struct.unpack_from('4B', data, offset)
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        # No frame sync.
+        return None
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        # Reserved values, or free-format bitrate, which we don't support.
+        return None
+    mpeg1 = (version == 3)
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        frame_length = (12 * bitrate * 1000 / sample_rate + padding) * 4
+        samples = 384
+    elif layer == 2 or mpeg1:
+        frame_length = 144 * bitrate * 1000 / sample_rate + padding
+        samples = 1152
+    else:
+        frame_length = 72 * bitrate * 1000 / sample_rate + padding
+        samples = 576
+    return FrameHeader(
+        mpeg1=mpeg1,
+        layer=layer,
+        bitrate=bitrate,
+        sample_rate=sample_rate,
+        channel_mode=b3 >> 6,
+        frame_length=frame_length,
+        samples=samples,
+    )
+
+
+def id3v2_length(data):
+    """Return the length of the ID3v2 tag at the start of ``data``, or 0 if there is none."""
+    if data[:3] != 'ID3' or len(data) < 10:
+        return 0
+    flags = ord(data[5])
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (ord(byte) & 0x7F)
+    footer = 10 if flags & 0x10 else 0
+    return 10 + size + footer
+
+
+def vbr_header_offset(header):
+    """Return the offset, from the start of a frame, where a Xing or Info
+    tag would be found if the frame were a VBR header frame."""
+    if header.mpeg1:
+        side_info = 17 if header.channel_mode == CHANNEL_MODE_MONO else 32
+    else:
+        side_info = 9 if header.channel_mode == CHANNEL_MODE_MONO else 17
+    return 4 + side_info
+
+
+def is_vbr_header_frame(data, offset, header):
+    """Return True if the frame at ``offset`` carries a Xing, Info, or VBRI
+    tag instead of audio."""
+    tag_offset = offset + vbr_header_offset(header)
+    if data[tag_offset:tag_offset + 4] in ('Xing', 'Info'):
+        return True
+    return data[offset + 36:offset + 40] == 'VBRI'
+
+
+def vbr_frame_count(data, offset, header):
+    """Return the number of audio frames recorded in the Xing, Info, or VBRI
+    tag of the frame at ``offset``, or None if there is no such count."""
+    tag_offset = offset + vbr_header_offset(header)
+    if data[tag_offset:tag_offset + 4] in ('Xing', 'Info'):
+        flags, = struct.unpack_from('>I', data, tag_offset + 4)
+        if flags & XING_FRAMES_FLAG:
+            return struct.unpack_from('>I', data, tag_offset + 8)[0]
+    elif data[offset + 36:offset + 40] == 'VBRI':
+        return struct.unpack_from('>I', data, offset + 36 + 14)[0]
+    return None
+
+
+def _is_followed_by_frame(data, offset):
+    """Return True if ``offset`` in ``data`` is the start of another frame,
+    an ID3v1 tag, or too close to the end of the data to tell."""
+    return (
+        offset + 4 > len(data)
+        or data[offset:offset + 3] == 'TAG'
+        or parse_header(data, offset) is not None
+    )
+
+
+def iter_frames(data, offset=0):
+    """Yield (offset, FrameHeader) for each audio frame in ``data``.
+
+    A candidate frame is only accepted when it is followed by another valid
+    frame (or an ID3v1 tag, or the end of the data), so stray sync bits
+    inside tags or audio data are skipped.
+    """
+    length = len(data)
+    while offset + 4 <= length:
+        header = parse_header(data, offset)
+        if header is None:
+            offset += 1
+            continue
+        next_offset = offset + header.frame_length
+        if next_offset > length:
+            # Truncated final frame.
+            break
+        if not _is_followed_by_frame(data, next_offset):
+            # False sync; keep looking.
+            offset += 1
+            continue
+        yield offset, header
+        offset = next_offset
+
+
+def iter_file_frames(f, offset=0, block_size=SCAN_BLOCK_SIZE):
+    """Yield (offset, FrameHeader) for each audio frame in the open file ``f``,
+    starting at ``offset``.
+
+    Like ``iter_frames``, but reads the file in blocks instead of all at once.
+    """
+    f.seek(offset)
+    data = ''
+    position = 0  # position within data
+    at_end = False
+    while not at_end:
+        block = f.read(block_size)
+        at_end = not block
+        # Keep unscanned data, and append the new block.
+        offset += position
+        data = data[position:] + block
+        position = 0
+        length = len(data)
+        while position + 4 <= length:
+            header = parse_header(data, position)
+            if header is None:
+                position += 1
+                continue
+            next_position = position + header.frame_length
+            if next_position + 4 > length and not at_end:
+                # Read more before accepting this frame.
+                break
+            if next_position > length:
+                # Truncated final frame.
+                return
+            if not _is_followed_by_frame(data, next_position):
+                # False sync; keep looking.
+                position += 1
+                continue
+            yield offset + position, header
+            position = next_position
+
+
+def duration(filename):
+    """Return the duration, in milliseconds, of the given MP3 file.
+
+    The frame count is read from a Xing, Info, or VBRI tag when the file has
+    one; otherwise every frame in the file is counted.
+    """
+    with open(filename, 'rb') as f:
+        start = id3v2_length(f.read(10))
+        f.seek(start)
+        head = f.read(SCAN_BLOCK_SIZE)
+        first = next(iter_frames(head), None)
+        if first is None:
+            raise IOError('No MP3 frames found in {0}'.format(filename))
+        offset, header = first
+        frame_count = vbr_frame_count(head, offset, header)
+        if frame_count is None:
+            frame_count = sum(1 for frame in iter_file_frames(f, start))
+            if is_vbr_header_frame(head, offset, header):
+                # A tag without a frame count; don't count it as audio.
+                frame_count -= 1
+    return frame_count * header.samples * 1000 / header.sample_rate
+
+
+# Frame indexes
+# =============
+
+
+def index_path(full_mp3):
+    """Return the path of the frame index for the given full MP3."""
+    return '{0}.frames'.format(full_mp3)
+
+
+def build_index(full_mp3):
+    """Scan every frame of the given full MP3, and write its frame index.
+
+    The index is a small header followed by the byte offset of every audio
+    frame, so that any millisecond can be mapped to a frame-aligned byte
+    offset without reading the MP3 itself.
+    """
+    output_path = index_path(full_mp3)
+    with open(full_mp3, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offsets = []
+            sample_rate = samples_per_frame = None
+            end_offset = id3v2_length(data[:10])
+            for offset, header in iter_frames(data, end_offset):
+                if not offsets and is_vbr_header_frame(data, offset, header):
+                    # Skip the Xing/Info/VBRI frame; it holds no audio.
+                    end_offset = offset + header.frame_length
+                    continue
+                if sample_rate is None:
+                    sample_rate, samples_per_frame = header.sample_rate, header.samples
+                offsets.append(offset)
+                end_offset = offset + header.frame_length
+        finally:
+            data.close()
+    if not offsets:
+        raise IOError('No MP3 frames found in {0}'.format(full_mp3))
+    # Write to a temporary file, then rename, to make index writes atomic.
+    initial_path = '{0}-{1}'.format(output_path, random.random())
+    with open(initial_path, 'wb') as f:
+        f.write(INDEX_HEADER.pack(
+            INDEX_MAGIC, INDEX_VERSION, sample_rate, samples_per_frame, len(offsets), end_offset))
+        f.write(''.join(INDEX_OFFSET.pack(offset) for offset in offsets))
+    os.rename(initial_path, output_path)
+    return output_path
+
+
+class FrameIndex(object):
+    """A read-only, memory-mapped frame index for one full MP3."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mtime = os.fstat(f.fileno()).st_mtime
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic, version, self.sample_rate, self.samples_per_frame, self.frame_count, self.end_offset,
+        ) = INDEX_HEADER.unpack_from(self._data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise IOError('{0} is not a frame index'.format(path))
+
+    def close(self):
+        self._data.close()
+
+    @property
+    def duration(self):
+        """Return the duration, in milliseconds, of the indexed audio."""
+        return self.frame_count * self.samples_per_frame * 1000 / self.sample_rate
+
+    def frame_offset(self, frame):
+        """Return the byte offset of the given frame number."""
+        if frame >= self.frame_count:
+            return self.end_offset
+        return INDEX_OFFSET.unpack_from(self._data, INDEX_HEADER.size + INDEX_OFFSET.size * frame)[0]
+
+    def offset_at(self, ms):
+        """Return the byte offset of the frame playing at ``ms`` milliseconds."""
+        frame = max(ms, 0) * self.sample_rate / (self.samples_per_frame * 1000)
+        return self.frame_offset(frame)
+
+    def byte_range(self, starting_ms, ending_ms):
+        """Return the (start, end) byte offsets of the frames covering the given times."""
+        return self.offset_at(starting_ms), self.offset_at(ending_ms)
+
+
+_indexes = {
+    # full_mp3: FrameIndex(),
+}
+_build_locks = {
+    # full_mp3: threading.Lock(),
+}
+# Guards the two dicts above, but not the building of any one index.
+_indexes_lock = threading.Lock()
+
+
+def _is_current(index, full_mp3):
+    try:
+        index_mtime = os.stat(index.path).st_mtime
+        return index.mtime == index_mtime and index_mtime >= os.stat(full_mp3).st_mtime
+    except OSError:
+        return False
+
+
+def frame_index(full_mp3):
+    """Return the FrameIndex for the given full MP3, building it if needed.
+
+    Only callers for the same MP3 wait while its index is built.  An index
+    replaced because its MP3 changed is closed.
+    """
+    index = _indexes.get(full_mp3)
+    if index is not None and _is_current(index, full_mp3):
+        return index
+    with _indexes_lock:
+        build_lock = _build_locks.setdefault(full_mp3, threading.Lock())
+    with build_lock:
+        index = _indexes.get(full_mp3)
+        if index is not None and _is_current(index, full_mp3):
+            # Built or loaded while we waited.
+            return index
+        path = index_path(full_mp3)
+        if not os.path.isfile(path) or os.stat(path).st_mtime < os.stat(full_mp3).st_mtime:
+            build_index(full_mp3)
+        new_index = FrameIndex(path)
+        with _indexes_lock:
+            old_index = _indexes.get(full_mp3)
+            _indexes[full_mp3] = new_index
+    if old_index is not None:
+        old_index.close()
+    return new_index
+
+
+def cut_snippet(full_mp3, output_filename, starting_ms, ending_ms):
+    """Write the frames of ``full_mp3`` between the given times to ``output_filename``."""
+    try:
+        start, end = frame_index(full_mp3).byte_range(starting_ms, ending_ms)
+    except ValueError:
+        # Replaced and closed by another thread as we read it.
+        start, end = frame_index(full_mp3).byte_range(starting_ms, ending_ms)
+    with open(full_mp3, 'rb') as f:
+        f.seek(start)
+        content = f.read(end - start)
+    # Write to a temporary file, then rename, to make snippet writes atomic.
+    initial_path = '{0}-{1}'.format(output_filename, random.random())
+    with open(initial_path, 'wb') as f:
+        f.write(content)
+    os.rename(initial_path, output_filename)
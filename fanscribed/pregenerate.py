@@ -0,0 +1,104 @@
+import json
+import os
+from multiprocessing.pool import ThreadPool
+
+import git
+
+from paste.deploy.loadwsgi import loadapp
+from paste.script.command import Command
+
+from fanscribed import mp3
+
+
+DEFAULT_WORKERS = 2
+
+
+def snippet_spans(duration, snippet_ms):
+    """Return a list of (starting_point, length) tuples for every snippet
+    and review a transcript of the given duration will ask for.
+
+    All times are given in milliseconds.
+    """
+    starting_points = range(0, duration, snippet_ms)
+    # Snippets are played one at a time while transcribing...
+    spans = [(starting_point, snippet_ms) for starting_point in starting_points]
+    # ...and two at a time while reviewing.
+    spans.extend((starting_point, snippet_ms * 2) for starting_point in starting_points[:-1])
+    return spans
+
+
+def pregenerate_snippets(full_mp3, duration, output_path, snippet_ms, padding, workers=DEFAULT_WORKERS):
+    """Cut every snippet of the given full MP3 into the snippet cache.
+
+    At most ``workers`` copies of mp3splt are run at once.
+    Return the number of snippets now present in the snippet cache.
+    """
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+    def cut(span):
+        starting_point, length = span
+        return mp3.snippet_path(
+            full_mp3=full_mp3,
+            duration=duration,
+            output_path=output_path,
+            starting_point=starting_point,
+            length=length,
+            padding=padding,
+        )
+    pool = ThreadPool(processes=workers)
+    try:
+        snippet_paths = pool.map(cut, snippet_spans(duration, snippet_ms))
+    finally:
+        pool.close()
+        pool.join()
+    return len(snippet_paths)
+
+
+def pregenerate_from_settings(settings, host_name):
+    """Pre-generate snippets for the transcript at ``host_name``, using app settings."""
+    repo_path = os.path.join(settings['fanscribed.repos'], host_name)
+    repo = git.Repo(repo_path)
+    transcription_info = json.load(repo.tree('master')['transcription.json'].data_stream)
+    return pregenerate_snippets(
+        full_mp3=os.path.join(settings['fanscribed.audio'], '{0}.mp3'.format(host_name)),
+        duration=transcription_info['duration'],
+        output_path=settings['fanscribed.snippet_cache'],
+        snippet_ms=int(settings['fanscribed.snippet_seconds']) * 1000,
+        padding=int(float(settings['fanscribed.snippet_padding_seconds']) * 1000),
+        workers=int(settings.get('fanscribed.pregenerate_workers', DEFAULT_WORKERS)),
+    )
+
+
+class PregenerateCommand(Command):
+
+    min_args = 1
+    usage = 'CONFIG_FILE [HOST_NAME ...]'
+    takes_config_file = 1
+    summary = 'Pre-generate snippet MP3 files'
+    description = """\
+    This command cuts every snippet and review MP3 for the given transcripts
+    (or all transcripts, if none are given) into the snippet cache, so that
+    listeners never wait for mp3splt.  Note that the cleanup command will
+    remove pre-generated snippets that have not been accessed recently.
+    """
+    default_verbosity = 1
+
+    parser = Command.standard_parser()
+
+    def command(self):
+        # Load config file.
+        app_spec = 'config:{0}'.format(self.args[0])
+        base = os.getcwd()
+        app = loadapp(app_spec, name='main', relative_to=base, global_conf={})
+        # Read settings.
+        settings = app.registry.settings
+        repos_path = settings['fanscribed.repos']
+        host_names = self.args[1:] or sorted(os.listdir(repos_path))
+        for host_name in host_names:
+            print 'Pre-generating snippets for {0}'.format(host_name),
+            try:
+                snippet_count = pregenerate_from_settings(settings, host_name)
+            except (git.InvalidGitRepositoryError, git.NoSuchPathError):
+                print 'Not a transcript repository; skipped.'
+            else:
+                print 'Snippets: {0}'.format(snippet_count)
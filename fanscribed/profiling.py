@@ -0,0 +1,96 @@
+"""Profile requests under real traffic.
+
+An administrator can profile a single request by adding ``__profile=1`` to
+its query string, and sending fanscribed.profile_secret in the
+X-Fanscribed-Profile header.  In addition, 1 in every
+fanscribed.profile_sample requests is profiled at random.
+
+Each profile is saved with ``pstats``-compatible ``dump_stats`` into a
+subdirectory of fanscribed.profile_dir named after the route, keeping the
+most recent ones.  Read them with ``python -m pstats``, or draw them as a
+flame graph with e.g. ``flameprof`` or ``snakeviz``.
+"""
+
+import cProfile
+import hmac
+import itertools
+import os
+import random
+import time
+
+
+# Set by ``fanscribed.main`` from settings.
+directory = None
+secret = None
+sample = 0  # profile 1 in this many requests; 0 for none
+keep = 100  # profiles kept per route
+
+SECRET_HEADER = 'X-Fanscribed-Profile'
+
+
+_sequence = itertools.count()
+
+
+def _requested_by_admin(request):
+    """Return True if the request asks to be profiled, with the right secret."""
+    if secret is None or request.GET.get('__profile') != '1':
+        return False
+    given = request.headers.get(SECRET_HEADER, '')
+    return hmac.compare_digest(given, secret)
+
+
+def _sampled():
+    return sample > 0 and random.randrange(sample) == 0
+
+
+def profile_filename(route):
+    """Return a new filename for a profile of ``route``, in its own directory."""
+    route_directory = os.path.join(directory, route)
+    if not os.path.isdir(route_directory):
+        try:
+            os.makedirs(route_directory)
+        except OSError:
+            # Made by another thread in the meantime.
+            pass
+    return os.path.join(route_directory, '{0}-{1}-{2}.pstats'.format(
+        time.strftime('%Y%m%d-%H%M%S'), os.getpid(), next(_sequence)))
+
+
+def prune(route_directory):
+    """Remove all but the ``keep`` most recent profiles in ``route_directory``."""
+    filenames = sorted(
+        (os.path.getmtime(path), path)
+        for path in (os.path.join(route_directory, name) for name in os.listdir(route_directory))
+    )
+    for mtime, path in filenames[:-keep]:
+        try:
+            os.remove(path)
+        except OSError:
+            # Removed by another thread in the meantime.
+            pass
+
+
+def profiling_tween_factory(handler, registry):
+    """Run the requests chosen for profiling under cProfile."""
+
+    def profiling_tween(request):
+        by_admin = _requested_by_admin(request)
+        if not (by_admin or _sampled()):
+            return handler(request)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = handler(request)
+        finally:
+            profiler.disable()
+            route = getattr(request, 'matched_route', None)
+            route = route.name if route is not None else 'none'
+            filename = profile_filename(route)
+            profiler.dump_stats(filename)
+            prune(os.path.dirname(filename))
+        if by_admin:
+            # Tell the administrator where to find it.
+            response.headers['X-Fanscribed-Profile-File'] = os.path.relpath(filename, directory)
+        return response
+
+    return profiling_tween
@@ -1,20 +1,38 @@
 import json
 import os
 import random
+from StringIO import StringIO
 import string
-import threading
 import time
 
 import git
+from git.refs.log import RefLogEntry
+from gitdb import IStream
 
 from fanscribed.common import app_settings
+from fanscribed import gitaccounting
+from fanscribed import metrics
+
+
+# GitPython 0.3.2 writes reflog entries as byte strings; later versions
+# format them as unicode, and encode them when writing.
+_UNICODE_REFLOG = hasattr(RefLogEntry, 'format')
 
 
 # Twenty minute lock timeout.
 LOCK_TIMEOUT = 20 * 60
 
 
-commit_lock = threading.Lock()
+commit_lock = metrics.TimedLock('commit_lock')
+
+
+# Compaction records the commits that replaced rewritten ones here, in the
+# repository's git directory, as {old hexsha: new hexsha}.
+COMPACTED_SHAS = 'fanscribed-compacted.json'
+
+_compacted_shas = {
+    # git dir: (mtime, {old hexsha: new hexsha}),
+}
 
 
 def _lock_is_expired(timestamp):
@@ -25,33 +43,125 @@ def _lock_secret():
     return ''.join(random.choice(string.letters) for x in xrange(16))
 
 
-def _snippet_ms():
+def snippet_ms():
+    """Return the length of each snippet, in milliseconds."""
     snippet_seconds = int(app_settings()['fanscribed.snippet_seconds'])
     return snippet_seconds * 1000
 
 
+def snippet_padding_ms():
+    """Return the audio padding on either side of a snippet, in milliseconds."""
+    return int(float(app_settings()['fanscribed.snippet_padding_seconds']) * 1000)
+
+
+def label_from_ms(ms):
+    """Return ``ms`` as minutes:seconds, as commit messages show positions."""
+    seconds = ms / 1000
+    minutes = seconds / 60
+    seconds %= 60
+    return '{0:d}:{1:02d}'.format(minutes, seconds)
+
+
+@metrics.timed('git')
+def open_repo(name):
+    """Return the repository for the transcript at host ``name``."""
+    repos_path = app_settings()['fanscribed.repos']
+    repo_path = os.path.join(repos_path, name)
+    # Make sure repo path is underneath outer repos path.
+    assert '..' not in os.path.relpath(repo_path, repos_path)
+    repo = git.Repo(repo_path)
+    if gitaccounting.enabled:
+        gitaccounting.account(repo)
+    return repo
+
+
+def compacted_shas(repo):
+    """Return {old hexsha: new hexsha} for commits rewritten by compaction."""
+    filename = os.path.join(repo.git_dir, COMPACTED_SHAS)
+    try:
+        mtime = os.path.getmtime(filename)
+    except OSError:
+        return {}
+    cached = _compacted_shas.get(repo.git_dir)
+    if cached is None or cached[0] != mtime:
+        with open(filename, 'rb') as f:
+            cached = _compacted_shas[repo.git_dir] = (mtime, json.load(f))
+    return cached[1]
+
+
+def current_sha(repo, rev):
+    """Return the sha of the commit that replaced ``rev`` when history was
+    compacted, or ``rev`` itself."""
+    if len(rev) != 40:
+        # A branch name, not a sha.
+        return rev
+    return str(compacted_shas(repo).get(rev, rev))
+
+
+@metrics.timed('git')
 def repo_from_request(request, rev=None):
     """Return the repository and commit based on the request.
 
     The host of the request is inspected to determine the repository.
     The 'rev' GET param is used to determine the commit (default: master).
     """
-    repos_path = app_settings()['fanscribed.repos']
-    repo_path = os.path.join(repos_path, request.host)
-    # Make sure repo path is underneath outer repos path.
-    assert '..' not in os.path.relpath(repo_path, repos_path)
-    repo = git.Repo(repo_path)
+    repo = open_repo(request.host)
     # Only get rev from user if not specified in function call.
     if rev is None:
         rev = request.GET.get('rev', 'master')
-    commit = repo.commit(rev)
+    commit = repo.commit(current_sha(repo, rev))
+    gitaccounting.note_commit(commit)
     return (repo, commit)
 
 
+@metrics.timed('git')
 def latest_revision(repo):
     return repo.iter_commits('master').next().hexsha
 
 
+def write_commit(repo, commit):
+    """Store ``commit``, made with ``git.Commit.NULL_BIN_SHA``, in the
+    repository's object database, and give it its sha."""
+    stream = StringIO()
+    commit._serialize(stream)
+    size = stream.tell()
+    stream.seek(0)
+    commit.binsha = repo.odb.store(IStream(git.Commit.type, size, stream)).binsha
+
+
+@metrics.timed('git')
+def commit(repo, index, message, author_name, author_email):
+    """Commit the index to master, authored by the given identity.
+
+    GitPython's ``index.commit`` takes its author from GIT_AUTHOR_NAME and
+    GIT_AUTHOR_EMAIL, which all threads share, so the commit is made here
+    with an explicit author instead.  The committer still comes from the
+    environment or git config, which are only read.  Call with
+    ``commit_lock`` held.
+    """
+    config = repo.config_reader()
+    if isinstance(author_email, unicode):
+        # GitPython only encodes names and messages.
+        author_email = author_email.encode('utf8')
+    author = git.Actor(author_name, author_email)
+    committer = git.Actor.committer(config)
+    committed_date = int(time.time())
+    encoding = config.get_value('i18n', 'commitencoding', git.Commit.default_encoding)
+    new_commit = git.Commit(
+        repo, git.Commit.NULL_BIN_SHA, index.write_tree(),
+        author, committed_date, time.altzone,
+        committer, committed_date, time.altzone,
+        message, [repo.head.commit], encoding,
+    )
+    write_commit(repo, new_commit)
+    logmsg = u'commit: %s' % message
+    if not _UNICODE_REFLOG:
+        logmsg = logmsg.encode(encoding)
+    repo.head.set_commit(new_commit, logmsg=logmsg)
+    return new_commit
+
+
+@metrics.timed('git')
 def file_at_commit(repo, filename, commit, required=False, content_filter=None):
     """
     -> (content-string, mtime)   for the given filename+commit.
@@ -71,11 +181,13 @@ def file_at_commit(repo, filename, commit, required=False, content_filter=None):
         return ('', None)
 
 
+@metrics.timed('git')
 def json_file_at_commit(repo, filename, commit, required=False):
     content, mtime = file_at_commit(repo, filename, commit, required)
     return (json.loads(content), mtime)
 
 
+@metrics.timed('git')
 def most_recent_revision(repo, filename):
     try:
         most_recent_commit = repo.iter_commits('master', 'custom.css').next()
@@ -85,6 +197,7 @@ def most_recent_revision(repo, filename):
         return most_recent_commit.hexsha
 
 
+@metrics.timed('git')
 def speakers_map(repo, commit):
     text, mtime = file_at_commit(repo, 'speakers.txt', commit)
     d = {}
@@ -100,6 +213,7 @@ def speakers_map(repo, commit):
     return d
 
 
+@metrics.timed('git')
 def get_locks(tree):
     if 'locks.json' in tree:
         blob = tree['locks.json']
@@ -108,6 +222,7 @@ def get_locks(tree):
         return {}
 
 
+@metrics.timed('git')
 def save_locks(repo, index, locks):
     filename = os.path.join(repo.working_dir, 'locks.json')
     with open(filename, 'wb') as f:
@@ -115,11 +230,13 @@ def save_locks(repo, index, locks):
     index.add(['locks.json'])
 
 
+@metrics.timed('git')
 def get_remaining_snippets(tree):
     blob = tree['remaining_snippets.json']
     return json.load(blob.data_stream)
 
 
+@metrics.timed('git')
 def save_remaining_snippets(repo, index, snippets):
     filename = os.path.join(repo.working_dir, 'remaining_snippets.json')
     with open(filename, 'wb') as f:
@@ -127,6 +244,7 @@ def save_remaining_snippets(repo, index, snippets):
     index.add(['remaining_snippets.json'])
 
 
+@metrics.timed('git')
 def remove_snippet_from_remaining(repo, index, starting_point):
     tree = repo.tree('master')
     snippets = get_remaining_snippets(tree)
@@ -135,11 +253,13 @@ def remove_snippet_from_remaining(repo, index, starting_point):
     save_remaining_snippets(repo, index, snippets)
 
 
+@metrics.timed('git')
 def get_remaining_reviews(tree):
     blob = tree['remaining_reviews.json']
     return json.load(blob.data_stream)
 
 
+@metrics.timed('git')
 def save_remaining_reviews(repo, index, reviews):
     filename = os.path.join(repo.working_dir, 'remaining_reviews.json')
     with open(filename, 'wb') as f:
@@ -147,6 +267,7 @@ def save_remaining_reviews(repo, index, reviews):
     index.add(['remaining_reviews.json'])
 
 
+@metrics.timed('git')
 def remove_review_from_remaining(repo, index, starting_point):
     tree = repo.tree('master')
     reviews = get_remaining_reviews(tree)
@@ -155,6 +276,7 @@ def remove_review_from_remaining(repo, index, starting_point):
     save_remaining_reviews(repo, index, reviews)
 
 
+@metrics.timed('git')
 def lock_available_snippet(repo, index, desired_starting_point):
     """Return a (starting_point, lock_secret) tuple of a newly-locked snippet,
     or (None, message) if there are none remaining or all are locked."""
@@ -196,10 +318,11 @@ def lock_available_snippet(repo, index, desired_starting_point):
     return (starting_point, lock_secret)
 
 
+@metrics.timed('git')
 def lock_available_review(repo, index):
     """Return a (starting_point, lock_secret) tuple of a newly-locked review,
     or (None, message) if there are none remaining or all are locked."""
-    snippet_ms = _snippet_ms()
+    snippet_length = snippet_ms()
     tree = repo.tree('master')
     remaining = set(get_remaining_reviews(tree))
     if len(remaining) == 0:
@@ -227,7 +350,7 @@ def lock_available_review(repo, index):
     if len(unlocked) > 0:
         adjacent_empty = set()
         for starting_point in unlocked:
-            candidate = starting_point + snippet_ms
+            candidate = starting_point + snippet_length
             if candidate in remaining_snippets:
                 adjacent_empty.add(starting_point)
         unlocked -= adjacent_empty
@@ -249,7 +372,7 @@ def lock_available_review(repo, index):
             'secret': _lock_secret(),
             'timestamp': timestamp,
         }
-        snippet_locks[str(starting_point + snippet_ms)] = {
+        snippet_locks[str(starting_point + snippet_length)] = {
             'secret': _lock_secret(),
             'timestamp': timestamp,
         }
@@ -258,6 +381,7 @@ def lock_available_review(repo, index):
         return (starting_point, lock_secret)
 
 
+@metrics.timed('git')
 def lock_is_valid(repo, index, lock_type, starting_point, lock_secret):
     tree = repo.tree('master')
     lock_structure = get_locks(tree)
@@ -269,6 +393,7 @@ def lock_is_valid(repo, index, lock_type, starting_point, lock_secret):
     return (lock_detail['secret'] == lock_secret)
 
 
+@metrics.timed('git')
 def remove_lock(repo, index, lock_type, starting_point):
     tree = repo.tree('master')
     lock_structure = get_locks(tree)
@@ -279,7 +404,7 @@ def remove_lock(repo, index, lock_type, starting_point):
         if lock_type == 'review':
             # Also unlock associated snippets.
             snippet_locks = lock_structure.get('snippet', {})
-            lock2_name = str(starting_point + _snippet_ms())
+            lock2_name = str(starting_point + snippet_ms())
             if lock_name in snippet_locks:
                 del snippet_locks[lock_name]
             if lock2_name in snippet_locks:
@@ -287,6 +412,7 @@ def remove_lock(repo, index, lock_type, starting_point):
         save_locks(repo, index, lock_structure)
 
 
+@metrics.timed('git')
 def snippet_text(repo, index, starting_point):
     tree = repo.tree('master')
     filename = '{0:016d}.txt'.format(starting_point)
@@ -298,6 +424,7 @@ def snippet_text(repo, index, starting_point):
         return u''
 
 
+@metrics.timed('git')
 def save_snippet_text(repo, index, starting_point, text):
     filename = os.path.join(
         repo.working_dir,
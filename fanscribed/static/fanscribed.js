@@ -2,7 +2,6 @@
 // constants
 
 
-var PADDING = 2.5 * 1000; // 2.5 second audio padding on either side of a snippet
 var UPDATE_SNIPPETS_INTERVAL = 3 * 60 * 1000; // check for new snippets every 3 mins
 
 
@@ -46,6 +45,7 @@ var common_onload = function () {
 
 var common_event_handlers = function () {
     $('#player-auto-play-edit').change(player_auto_play_edit_changed);
+    $('#player-low-bitrate').change(player_low_bitrate_changed);
 };
 
 
@@ -375,7 +375,10 @@ var editor_replay = function (ignore_cookie) {
         var starting_point = lock_info.starting_point;
         var length = lock_info.ending_point - lock_info.starting_point;
         // reset the player's URL
-        var url = '/snippet.mp3?starting_point=' + starting_point + '&length=' + length + '&padding=' + PADDING;
+        var url = '/snippet.mp3?starting_point=' + starting_point + '&length=' + length + '&padding=' + snippet_padding_ms;
+        if ($.cookie('low_bitrate_audio')) {
+            url += '&quality=low';
+        }
         if (player_listener.url != url) {
             player().SetVariable('method:stop', '');
             player().SetVariable('method:setUrl', url);
@@ -751,6 +754,11 @@ var fill_player_preferences = function () {
     } else {
         $('#player-auto-play-edit').removeAttr('checked');
     }
+    if ($.cookie('low_bitrate_audio')) {
+        $('#player-low-bitrate').attr('checked', 'checked');
+    } else {
+        $('#player-low-bitrate').removeAttr('checked');
+    }
 };
 
 
@@ -759,6 +767,11 @@ var player_auto_play_edit_changed = function () {
 };
 
 
+var player_low_bitrate_changed = function () {
+    $.cookie('low_bitrate_audio', $(this).attr('checked') ? '1' : '', cookie_options);
+};
+
+
 // =========================================================================
 // server
 
@@ -2,25 +2,47 @@
 
 import argparse
 from cgi import escape
+from contextlib import contextmanager
 import cPickle as pickle
-from collections import namedtuple
+import csv
 from datetime import datetime
 from hashlib import sha1
+import multiprocessing
 from operator import itemgetter
 import os
+import sqlite3
 import sys
 from urllib2 import quote
 
-from ujson import load
+from ujson import dumps, load, loads
 
 import git
+from gitdb.util import hex_to_bin
 
 from twiggy import log, quickSetup
 
+from fanscribed.gitlog import blob_sha_at, iter_log
+from fanscribed.repos import current_sha
+from fanscribed.statsevents import (
+    Interner, LockEvents, SnippetEvents, LOCK_TYPES, NONE, author_totals, windowed_totals)
+
 
 # TODO: Read from config file or command line.
 LOCK_TIMEOUT = 20 * 60
 
+# Starting points not yet transcribed or reviewed, by lock type.
+REMAINING_FILES = {
+    'snippet': 'remaining_snippets.json',
+    'review': 'remaining_reviews.json',
+}
+
+
+# Throughput windows: (seconds, strftime format of the start of each, in UTC).
+WINDOWS = {
+    'hour': (60 * 60, '%Y-%m-%d %H:00'),
+    'day': (24 * 60 * 60, '%Y-%m-%d'),
+}
+
 
 def get_parser():
     parser = argparse.ArgumentParser(
@@ -34,13 +56,28 @@ def get_parser():
         help='a repository to generate stats from',
     )
     parser.add_argument(
-        '--pickle', '-p',
+        '--store', '-s',
         metavar='FILENAME',
         type=str,
         nargs=1,
         required=False,
         default=None,
-        help='pickle file in which to cache stats',
+        help='SQLite file in which to keep stats between runs',
+    )
+    parser.add_argument(
+        '--partial',
+        action='store_true',
+        default=False,
+        help='load only the given repositories from the store, and write only their transcript pages',
+    )
+    parser.add_argument(
+        '--import-pickle', '-p',
+        metavar='FILENAME',
+        type=str,
+        nargs=1,
+        required=False,
+        default=None,
+        help='pickle file written by older versions to copy into the store',
     )
     parser.add_argument(
         '--output-path', '-o',
@@ -50,6 +87,33 @@ def get_parser():
         required=True,
         help='directory to write stats results to',
     )
+    parser.add_argument(
+        '--window', '-w',
+        choices=sorted(WINDOWS),
+        default='day',
+        help='period to report throughput over (default: day)',
+    )
+    parser.add_argument(
+        '--snippet-seconds',
+        metavar='SECONDS',
+        type=int,
+        default=30,
+        help='length of each snippet, to count minutes transcribed (default: 30)',
+    )
+    parser.add_argument(
+        '--all-pages',
+        action='store_true',
+        default=False,
+        help='rewrite every page, not just those of repositories and authors with new commits',
+    )
+    parser.add_argument(
+        '--jobs', '-j',
+        metavar='COUNT',
+        type=int,
+        required=False,
+        default=multiprocessing.cpu_count(),
+        help='number of repositories to process at once (default: number of CPUs)',
+    )
     parser.add_argument(
         '--email-map', '-m',
         metavar='FROM:TO',
@@ -83,12 +147,6 @@ class AuthorInfo(_SimpleObject):
 
     __slots__ = [
         'names',  # set()
-        'locks_created',  # dict(reponame={secret:Lock(), ...})
-        'snippets',  # dict(reponame={
-                     #     starting_point: [
-                     #         SnippetAction(), ...
-                     #     ],
-                     # })
         'total_actions',  # int
         'total_transcriptions',  # int
         'total_bytes_transcribed',  # int
@@ -109,6 +167,7 @@ class Lock(_SimpleObject):
         'created_by',  # email
         'destroyed_at',  # time
         'destroyed_by',  # email
+        'completed',  # bool: removed by saving its snippet or review
         'snippet_created',  # bool  TODO
         'snippet_updated',  # bool  TODO
     ]
@@ -120,7 +179,6 @@ class RepoInfo(_SimpleObject):
         'name',  # str
         'transcription',  # dict
         'authors',  # set()
-        'snippets',  # {starting_point: [SnippetAction(), ...]}
     ]
 
     @property
@@ -141,20 +199,35 @@ class SnippetAction(_SimpleObject):
         return cmp((self.saved, self.email), (other.saved, other.email))
 
 
+class RepoResult(_SimpleObject):
+    """New information found in one repository by ``process_repo``."""
+
+    __slots__ = [
+        'name',  # str
+        'latest_commit',  # hexsha
+        'author_names',  # {email: set()}
+        'review_locks',  # {secret: Lock()}
+        'snippet_locks',  # {secret: Lock()}
+        'snippet_actions',  # [(starting_point, SnippetAction()), ...], eldest first
+        'destroyed_locks',  # [(type, secret, destroyed_at, destroyed_by, completed), ...]
+                            # for locks created in earlier runs
+    ]
+
+
 # Map author emails to stats.
 authors_map = {
     # email: AuthorInfo(),
 }
 
 
-review_locks = {
-    # secret: Lock(),
-}
+# Authors (by email) and repos (by name), interned as small integers.
+author_ids = Interner()
+repo_ids = Interner()
 
 
-snippet_locks = {
-    # secret: Lock(),
-}
+# Every snippet action and lock seen, as columns.
+snippet_events = SnippetEvents()
+lock_events = LockEvents()
 
 
 # Map repo path to repo.
@@ -175,6 +248,15 @@ latest_commits = {
 }
 
 
+# Repos and authors whose pages need to be rewritten.
+changed_repos = set([
+    # name,
+])
+changed_authors = set([
+    # email,
+])
+
+
 email_maps = {
     # email-from: email-to,
 }
@@ -188,9 +270,22 @@ def main():
     quickSetup()
     parser = get_parser()
     options = parser.parse_args()
-    if options.pickle is not None:
-        options.pickle = options.pickle[0]  # list -> string
-        unpickle_all(options.pickle)
+    store = None
+    if options.store is not None:
+        options.store = options.store[0]  # list -> string
+        try:
+            store = StatsStore(options.store)
+        except StoreVersionError as e:
+            log.fields(filename=options.store).error(str(e))
+            sys.exit(1)
+        if options.import_pickle is not None:
+            import_pickle(store, options.import_pickle[0])
+        if options.partial:
+            load_store(store, repo_names=[os.path.split(repo_path)[-1] for repo_path in options.repos])
+        else:
+            load_store(store)
+    elif options.import_pickle is not None or options.partial:
+        parser.error('--import-pickle and --partial need a --store')
     else:
         # Do nothing; keep initial state.
         pass
@@ -234,141 +329,529 @@ def main():
                     name=repo_name,
                     transcription=transcription_json,
                     authors=set(),
-                    snippets={},
                 )
             else:
                 # Keep existing RepoInfo structure.
                 pass
     if not all_repos_valid:
         sys.exit(1)
-    process_all_repos()
+    process_all_repos(options.jobs, store)
     process_all_authors()
-    create_all_output(output_path)
-    if options.pickle is not None:
-        pickle_all(options.pickle)
+    if options.all_pages:
+        create_all_output(output_path, window=options.window,
+                          snippet_seconds=options.snippet_seconds, partial=options.partial)
+    else:
+        create_all_output(output_path, changed_repos, changed_authors, options.window,
+                          options.snippet_seconds, options.partial)
+    if store is not None:
+        store.close()
 
 
 # ===================================================================
-# pickling
-
+# storage
+
+
+# Bump when STORE_SCHEMA changes, and add to STORE_MIGRATIONS.
+STORE_VERSION = 3
+
+STORE_SCHEMA = """
+CREATE TABLE repos (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    transcription TEXT NOT NULL,  -- JSON
+    latest_commit TEXT
+);
+CREATE TABLE author_names (
+    repo TEXT NOT NULL,
+    email TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (repo, email, name)
+);
+CREATE INDEX author_names_email ON author_names (email);
+CREATE TABLE locks (
+    repo TEXT NOT NULL,
+    secret TEXT NOT NULL,
+    type TEXT NOT NULL,
+    starting_point INTEGER,
+    timestamp REAL,
+    created_at INTEGER,
+    created_by TEXT,
+    destroyed_at INTEGER,
+    destroyed_by TEXT,
+    completed INTEGER,
+    PRIMARY KEY (repo, secret)
+);
+CREATE INDEX locks_created_by ON locks (created_by);
+CREATE TABLE snippet_actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,  -- eldest first
+    repo TEXT NOT NULL,
+    starting_point INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    saved INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+CREATE INDEX snippet_actions_repo ON snippet_actions (repo, starting_point);
+CREATE INDEX snippet_actions_email ON snippet_actions (email);
+"""
 
-def pickle_all(filename, log=log):
-    log.fields(filename=filename).info('pickling')
-    structure = dict(
-        authors_map=authors_map,
-        review_locks=review_locks,
-        snippet_locks=snippet_locks,
-        latest_commits=latest_commits,
-        repo_infos_by_path=repo_infos_by_path,
-        repo_infos_by_name=repo_infos_by_name,
-    )
-    with open(filename, 'wb') as f:
-        pickle.dump(structure, f, -1)
+STORE_MIGRATIONS = {
+    # from_version: script,
+    1: """
+INSERT OR IGNORE INTO locks
+    SELECT repo, secret, type, starting_point, timestamp,
+           created_at, created_by, destroyed_at, destroyed_by
+    FROM locks_created;
+DROP TABLE locks_created;
+CREATE INDEX locks_created_by ON locks (created_by);
+""",
+    # Locks saved before this don't say whether they were completed, so
+    # their reviews aren't counted; remove the store to count them again.
+    2: """
+ALTER TABLE locks ADD COLUMN completed INTEGER;
+""",
+}
 
+LOCK_COLUMNS = [
+    'type',
+    'starting_point',
+    'timestamp',
+    'created_at',
+    'created_by',
+    'destroyed_at',
+    'destroyed_by',
+    'completed',
+]
+
+
+class StoreVersionError(Exception):
+    """Raised when a stats store was written with a different schema version."""
+
+
+class StatsStore(object):
+    """SQLite database holding everything learned from previous runs.
+
+    Each repository's new commits are added in their own transaction, so
+    the store only ever grows by what is new, and an interrupted run loses
+    at most the repository it was saving.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            with self.db:
+                self.db.executescript(STORE_SCHEMA)
+                self.db.execute('PRAGMA user_version = {0:d}'.format(STORE_VERSION))
+            version = STORE_VERSION
+        while version in STORE_MIGRATIONS:
+            with self.db:
+                self.db.executescript(STORE_MIGRATIONS[version])
+                version += 1
+                self.db.execute('PRAGMA user_version = {0:d}'.format(version))
+        if version != STORE_VERSION:
+            raise StoreVersionError(
+                'Stats store {0} has version {1}; expected {2}'.format(filename, version, STORE_VERSION))
+
+    def close(self):
+        self.db.close()
+
+    def save_repo_result(self, repo_path, repo_info, result):
+        """Add a RepoResult, and the repo's latest commit, in one transaction."""
+        repo_name = result.name
+        lock_values = ', '.join('?' * len(LOCK_COLUMNS))
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO repos (name, path, transcription, latest_commit) '
+                'VALUES (?, ?, ?, ?)',
+                (repo_name, repo_path, dumps(repo_info.transcription), result.latest_commit),
+            )
+            self.db.executemany(
+                'INSERT OR IGNORE INTO author_names (repo, email, name) VALUES (?, ?, ?)',
+                [
+                    (repo_name, email, name)
+                    for email, names in result.author_names.iteritems()
+                    for name in names
+                ],
+            )
+            self.db.executemany(
+                'INSERT OR REPLACE INTO locks (repo, secret, {0}) VALUES (?, ?, {1})'.format(
+                    ', '.join(LOCK_COLUMNS), lock_values),
+                [
+                    (repo_name, secret) + _lock_row(lock)
+                    for locks_dict in [result.snippet_locks, result.review_locks]
+                    for secret, lock in locks_dict.iteritems()
+                ],
+            )
+            self.db.executemany(
+                'INSERT INTO snippet_actions (repo, starting_point, email, saved, bytes) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [
+                    (repo_name, starting_point, action.email, action.saved, action.bytes)
+                    for starting_point, action in result.snippet_actions
+                ],
+            )
 
-def unpickle_all(filename, log=log):
+    def select(self, table, columns, order_by=None, **filters):
+        """Yield rows of ``columns`` from ``table``.
+
+        Each keyword argument limits the rows to those whose column of that
+        name holds one of the given values, unless the values are None.
+        """
+        where = []
+        params = []
+        for column, values in sorted(filters.iteritems()):
+            if values is not None:
+                values = list(values)
+                where.append('{0} IN ({1})'.format(column, ', '.join('?' * len(values))))
+                params.extend(values)
+        sql = 'SELECT {0} FROM {1}'.format(', '.join(columns), table)
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        if order_by is not None:
+            sql += ' ORDER BY ' + order_by
+        return self.db.execute(sql, params)
+
+
+def _lock_row(lock):
+    # Locks from older pickles lack newer attributes.
+    return tuple(getattr(lock, name, None) for name in LOCK_COLUMNS)
+
+
+def _lock_from_row(row):
+    return Lock(**dict(zip(LOCK_COLUMNS, row)))
+
+
+def load_store(store, repo_names=None, emails=None, log=log):
+    """Replace the global maps and event columns with what ``store`` holds.
+
+    If ``repo_names`` is given, load only those repos.  If ``emails`` is
+    given, load only those authors (but all snippets of the loaded repos,
+    which are needed to tell transcriptions from edits).
+    """
+    global author_ids, repo_ids, snippet_events, lock_events
+    log.fields(filename=store.filename).info('loading')
+    for global_map in [authors_map, repo_infos_by_path, repo_infos_by_name, latest_commits]:
+        global_map.clear()
+    author_ids = Interner()
+    repo_ids = Interner()
+    snippet_events = SnippetEvents()
+    lock_events = LockEvents()
+    for name, path, transcription, latest_commit in store.select(
+            'repos', ['name', 'path', 'transcription', 'latest_commit']):
+        if repo_names is not None and name not in repo_names:
+            continue
+        repo_infos_by_path[path] = repo_infos_by_name[name] = RepoInfo(
+            name=name,
+            transcription=loads(transcription),
+            authors=set(),
+        )
+        if latest_commit is not None:
+            latest_commits[name] = latest_commit
+    repo_names = sorted(repo_infos_by_name)
+    for repo_name, email, name in store.select(
+            'author_names', ['repo', 'email', 'name'], repo=repo_names, email=emails):
+        update_authors_map(email, [name])
+    for row in store.select('locks', ['secret', 'repo'] + LOCK_COLUMNS,
+                            repo=repo_names, created_by=emails):
+        secret, repo_name = row[:2]
+        append_lock(secret, repo_ids.id(repo_name), _lock_from_row(row[2:]))
+    snippet_rows = store.select(
+        'snippet_actions', ['repo', 'starting_point', 'email', 'saved', 'bytes'],
+        order_by='id', repo=repo_names)
+    for repo_name, starting_point, email, saved, bytes in snippet_rows:
+        snippet_events.append(repo_ids.id(repo_name), starting_point, author_ids.id(email), saved, bytes)
+
+
+def store_repo_results(store, repo_names=None):
+    """Return a RepoResult for each repo in ``store``, or each of
+    ``repo_names`` that it holds, with all it learned up to the repo's
+    latest commit."""
+    results = {}
+    for name, latest_commit in store.select('repos', ['name', 'latest_commit'], name=repo_names):
+        results[name] = RepoResult(
+            name=name,
+            latest_commit=latest_commit,
+            author_names={},
+            review_locks={},
+            snippet_locks={},
+            snippet_actions=[],
+            destroyed_locks=[],
+        )
+    repo_names = sorted(results)
+    for repo_name, email, name in store.select(
+            'author_names', ['repo', 'email', 'name'], repo=repo_names):
+        results[repo_name].author_names.setdefault(email, set()).add(name)
+    for row in store.select('locks', ['secret', 'repo'] + LOCK_COLUMNS, repo=repo_names):
+        secret, repo_name = row[:2]
+        lock = _lock_from_row(row[2:])
+        result = results[repo_name]
+        locks_dict = result.snippet_locks if lock.type == 'snippet' else result.review_locks
+        locks_dict[secret] = lock
+    snippet_rows = store.select(
+        'snippet_actions', ['repo', 'starting_point', 'email', 'saved', 'bytes'],
+        order_by='id', repo=repo_names)
+    for repo_name, starting_point, email, saved, bytes in snippet_rows:
+        results[repo_name].snippet_actions.append(
+            (starting_point, SnippetAction(email=email, saved=saved, bytes=bytes)))
+    return [results[name] for name in repo_names]
+
+
+class _PickledObject(object):
+    """Stands in for instances of this module's classes when reading pickles
+    written by older versions, whose attributes may no longer exist."""
+
+    def __setstate__(self, state):
+        # Objects with __slots__ are pickled as (None, {slot: value}).
+        dict_state, slots_state = state
+        self.__dict__.update(dict_state or {})
+        self.__dict__.update(slots_state or {})
+
+
+def _find_pickled_global(module_name, name):
+    if module_name == __name__:
+        return _PickledObject
+    __import__(module_name)
+    return getattr(sys.modules[module_name], name)
+
+
+def import_pickle(store, filename, log=log):
+    """Save the global maps from a pickle written by older versions into ``store``.
+
+    Pickles don't record which repos an author committed to, so authors
+    with no locks or snippets are recorded against every repo.
+    """
     log = log.fields(filename=filename)
-    if os.path.isfile(filename):
-        log.info('unpickling')
-        with open(filename, 'rb') as f:
-            globals().update(pickle.load(f))
-    else:
+    if not os.path.isfile(filename):
         log.info('notfound')
+        return
+    log.info('importing')
+    with open(filename, 'rb') as f:
+        unpickler = pickle.Unpickler(f)
+        unpickler.find_global = _find_pickled_global
+        structure = unpickler.load()
+    for repo_path, repo_info in structure['repo_infos_by_path'].iteritems():
+        repo_name = repo_info.name
+        result = RepoResult(
+            name=repo_name,
+            latest_commit=structure['latest_commits'].get(repo_name),
+            author_names={},
+            review_locks={},
+            snippet_locks={},
+            snippet_actions=[],
+            destroyed_locks=[],
+        )
+        for email, author_info in structure['authors_map'].iteritems():
+            if (repo_name in author_info.snippets or repo_name in author_info.locks_created
+                    or not (author_info.snippets or author_info.locks_created)):
+                result.author_names[email] = author_info.names
+            for secret, lock in author_info.locks_created.get(repo_name, {}).iteritems():
+                locks_dict = result.snippet_locks if lock.type == 'snippet' else result.review_locks
+                locks_dict[secret] = lock
+        # Each snippet's actions are already eldest first.
+        for starting_point, snippet_actions in sorted(repo_info.snippets.iteritems()):
+            for snippet_action in snippet_actions:
+                result.snippet_actions.append((starting_point, snippet_action))
+        store.save_repo_result(repo_path, repo_info, result)
 
 
 # ===================================================================
 # processing
 
 
-def normalize_email(email):
+def normalize_email(email, maps=None):
     """Strip; lowercase; replace foo+bar@gmail.com with foo@gmail.com"""
+    if maps is None:
+        maps = email_maps
     email = email.strip().lower()
     # Replace with mapped email if it exists; otherwise use given email.
-    email = email_maps.get(email, email)
+    email = maps.get(email, email)
     return email
 
 
-def process_all_repos():
-    """Loop through events in all repositories."""
-    for repo_path, repo_info in repo_infos_by_path.iteritems():
-        repo = repo_info.repo
-        repo_name = repo_info.name
-        repolog = log.fields(repo_name=repo_name)
-        repolog.info('processing')
-        last_locks = {}
-        prev_latest_commit = latest_commits.get(repo_name, None)
-        if prev_latest_commit is not None:
-            repolog.fields(prev_latest_commit=prev_latest_commit).info()
-        else:
-            repolog.info('new repo')
-        latest_commit = repo.commit('master').hexsha
-        commits = []
-        # Find applicable commits.
-        for commit in repo.iter_commits(latest_commit):
-            if commit.hexsha == prev_latest_commit:
-                # Reached commit we stopped at last time.
-                break
-            else:
-                commits.append(commit)
-        # Process them starting with eldest first.
-        for commit in reversed(commits):
-            email = normalize_email(commit.author.email)
-            update_authors_map(email, commit)
-            last_locks = update_locks(email, repo_name, commit, last_locks)
-            update_snippets(email, repo_info, commit)
-        # Store latest commit for next time.
-        latest_commits[repo_name] = latest_commit
-        repolog.fields(latest_commit=latest_commit).info()
+def process_all_repos(jobs=1, store=None):
+    """Loop through events in all repositories, ``jobs`` repositories at a time.
+
+    Each repository is processed independently (in a separate process when
+    ``jobs`` is more than 1), then the results are merged in repository name
+    order, so the outcome does not depend on which worker finishes first.
+    If a StatsStore is given, each repository's results are saved to it.
+    """
+    tasks = [
+        (repo_path, repo_info.name, latest_commits.get(repo_info.name, None), email_maps)
+        for repo_path, repo_info
+        in sorted(repo_infos_by_path.iteritems(), key=lambda item: item[1].name)
+    ]
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes=min(jobs, len(tasks)))
+        try:
+            results = pool.map(process_repo, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(process_repo, tasks)
+    for task, result in zip(tasks, results):
+        merge_repo_result(result)
+        if store is not None:
+            repo_path = task[0]
+            store.save_repo_result(repo_path, repo_infos_by_name[result.name], result)
+
+
+def process_repo(task):
+    """Process new commits in one repository, and return a RepoResult.
+
+    ``task`` is a (repo_path, repo_name, prev_latest_commit, email_maps) tuple.
+    This may run in a worker process, so it must not touch the global maps.
+    """
+    repo_path, repo_name, prev_latest_commit, task_email_maps = task
+    repo = git.Repo(repo_path)
+    repolog = log.fields(repo_name=repo_name)
+    repolog.info('processing')
+    if prev_latest_commit is not None:
+        repolog.fields(prev_latest_commit=prev_latest_commit).info()
+    else:
+        repolog.info('new repo')
+    latest_commit = repo.commit('master').hexsha
+    result = RepoResult(
+        name=repo_name,
+        latest_commit=latest_commit,
+        author_names={},
+        review_locks={},
+        snippet_locks={},
+        snippet_actions=[],
+        destroyed_locks=[],
+    )
+    # Start from the locks as of the previous run, so that locks still held
+    # then are neither created again nor forgotten when they are removed.
+    last_locks = {}
+    last_locks_sha = None
+    # Likewise the snippets and reviews remaining, to tell which locks were
+    # removed by saving, rather than cancelling.
+    last_remaining = dict((lock_type, set()) for lock_type in LOCK_TYPES)
+    if prev_latest_commit is not None:
+        last_locks_sha = blob_sha_at(repo, prev_latest_commit, 'locks.json')
+        if last_locks_sha is not None:
+            last_locks = load(repo.odb.stream(hex_to_bin(last_locks_sha)))
+        for lock_type in LOCK_TYPES:
+            blob_sha = blob_sha_at(repo, prev_latest_commit, REMAINING_FILES[lock_type])
+            if blob_sha is not None:
+                last_remaining[lock_type] = set(load(repo.odb.stream(hex_to_bin(blob_sha))))
+        # If history was compacted since, carry on from the commit that replaced
+        # it.  Locks are still compared with those of the commit itself, which
+        # the master reflog keeps, since its changes may have been folded into
+        # a later commit.
+        prev_latest_commit = current_sha(repo, prev_latest_commit)
+    # Process new commits starting with eldest first.
+    for entry in iter_log(repo, until=latest_commit, since=prev_latest_commit):
+        email = normalize_email(entry.author_email, task_email_maps)
+        result.author_names.setdefault(email, set()).add(entry.author_name)
+        changes = dict(entry.changes)
+        completed = {}
+        for lock_type in LOCK_TYPES:
+            blob_sha = changes.get(REMAINING_FILES[lock_type])
+            if blob_sha is not None:
+                remaining = set(load(repo.odb.stream(hex_to_bin(blob_sha))))
+                completed[lock_type] = last_remaining[lock_type] - remaining
+                last_remaining[lock_type] = remaining
+        # Only read locks.json when its blob changes.  If it is removed,
+        # keep comparing with the last locks seen.
+        blob_sha = changes.get('locks.json')
+        if blob_sha is not None and blob_sha != last_locks_sha:
+            locks = load(repo.odb.stream(hex_to_bin(blob_sha)))
+            update_locks(result, email, entry.authored_date, locks, last_locks, completed)
+            last_locks, last_locks_sha = locks, blob_sha
+        update_snippets(result, repo, email, entry)
+    repolog.fields(latest_commit=latest_commit).info()
+    return result
+
+
+def merge_repo_result(result):
+    """Merge a RepoResult into the global maps."""
+    repo_name = result.name
+    if result.latest_commit != latest_commits.get(repo_name):
+        changed_repos.add(repo_name)
+    for email, names in result.author_names.iteritems():
+        if email in authors_map and not names <= authors_map[email].names:
+            # Their new name shows up on the pages of repos they contributed to.
+            author_snippets = snippet_events.starting_points(author=author_ids.id(email))
+            changed_repos.update(repo_ids[repo] for repo in author_snippets)
+        update_authors_map(email, names)
+        changed_authors.add(email)
+    repo = repo_ids.id(repo_name)
+    for locks_dict in [result.snippet_locks, result.review_locks]:
+        for secret, lock in locks_dict.iteritems():
+            append_lock(secret, repo, lock)
+    for lock_type, secret, destroyed_at, destroyed_by, completed in result.destroyed_locks:
+        row = lock_events.destroy(secret, destroyed_at, author_ids.id(destroyed_by), int(completed))
+        if row is not None:
+            # Have the store save the lock along with the others.
+            result_locks_dict = result.snippet_locks if lock_type == 'snippet' else result.review_locks
+            result_locks_dict[secret] = lock_from_events(row)
+    for starting_point, snippet_action in result.snippet_actions:
+        snippet_events.append(
+            repo, starting_point, author_ids.id(snippet_action.email),
+            snippet_action.saved, snippet_action.bytes)
+    # Store latest commit for next time.
+    latest_commits[repo_name] = result.latest_commit
+
+
+def append_lock(secret, repo, lock):
+    """Add a Lock to the lock event columns."""
+    lock_events.append(
+        secret,
+        repo,
+        LOCK_TYPES.index(lock.type),
+        lock.starting_point,
+        lock.timestamp,
+        lock.created_at,
+        author_ids.id(lock.created_by),
+        lock.destroyed_at if lock.destroyed_at is not None else NONE,
+        author_ids.id(lock.destroyed_by) if lock.destroyed_by is not None else NONE,
+        1 if lock.completed else 0,
+    )
+
+
+def lock_from_events(row):
+    """Return a Lock for a row of the lock event columns."""
+    destroyed_at = lock_events.destroyed_at[row]
+    destroyed_by = lock_events.destroyed_by[row]
+    return Lock(
+        type=LOCK_TYPES[lock_events.type[row]],
+        starting_point=lock_events.starting_point[row],
+        timestamp=lock_events.timestamp[row],
+        created_at=lock_events.created_at[row],
+        created_by=author_ids[lock_events.created_by[row]],
+        destroyed_at=destroyed_at if destroyed_at != NONE else None,
+        destroyed_by=author_ids[destroyed_by] if destroyed_by != NONE else None,
+        completed=bool(lock_events.completed[row]),
+    )
 
 
 def process_all_authors():
-    """Loop through authors to calculate author-specific stats."""
-    for author_info in authors_map.itervalues():
+    """Calculate author-specific stats from the event columns."""
+    (total_actions, total_transcriptions, time_spent, time_spent_transcribing,
+     total_bytes_transcribed) = author_totals(snippet_events, lock_events, len(author_ids))
+    for email, author_info in authors_map.iteritems():
         author_log = log.fields(author_name=sorted(author_info.names)[0])
         author_log.info('processing')
-        # Reset accumulators.
-        author_info.total_actions = 0
-        author_info.total_transcriptions = 0
-        author_info.time_spent = 0
-        author_info.time_spent_transcribing = 0
-        author_info.total_bytes_transcribed = 0
-        # Process snippets.
-        for repo_name, snippet_map in author_info.snippets.iteritems():
-            for starting_point, snippet_actions in snippet_map.iteritems():
-                author_info.total_actions += len(snippet_actions)
-                # Determine if the snippet action was a transcription.
-                repo_info = repo_infos_by_name[repo_name]
-                first_repo_snippet = repo_info.snippets.get(starting_point)
-                if first_repo_snippet:
-                    first_repo_snippet_action = first_repo_snippet[0]
-                    if first_repo_snippet_action in snippet_actions:
-                        author_info.total_transcriptions += 1
-        # Process locks.
-        for repo_name, locks_map in author_info.locks_created.iteritems():
-            for lock in locks_map.itervalues():
-                if lock.created_by == lock.destroyed_by:
-                    duration = lock.destroyed_at - lock.created_at
-                    author_info.time_spent += duration
-                    # Determine if the lock was associated with a transcription, vs. an edit.
-                    repo_info = repo_infos_by_name[repo_name]
-                    if lock.starting_point in repo_info.snippets:
-                        first_repo_snippet_action = repo_info.snippets[lock.starting_point][0]
-                        if first_repo_snippet_action.saved == lock.destroyed_at:
-                            author_info.time_spent_transcribing += duration
-                            author_info.total_bytes_transcribed += first_repo_snippet_action.bytes
+        author = author_ids.id(email)
+        author_info.total_actions = total_actions[author]
+        author_info.total_transcriptions = total_transcriptions[author]
+        author_info.time_spent = time_spent[author]
+        author_info.time_spent_transcribing = time_spent_transcribing[author]
+        author_info.total_bytes_transcribed = total_bytes_transcribed[author]
         if author_info.total_transcriptions and author_info.time_spent_transcribing:
             author_info.average_time_per_transcription = author_info.time_spent_transcribing / author_info.total_transcriptions
             author_info.average_wpm = (author_info.total_bytes_transcribed / 5.0) / (author_info.time_spent_transcribing / 60.0)
 
 
-def update_authors_map(email, commit):
-    """Update the authors map based on the given commit."""
-    author = commit.author
+def update_authors_map(email, names):
+    """Update the authors map with names used by the given email address."""
     if email not in authors_map:
+        author_ids.id(email)
         authors_map[email] = AuthorInfo(
             names=set(),
-            locks_created=dict(),
-            snippets=dict(),
             total_actions=0,
             total_transcriptions=0,
             total_bytes_transcribed=0,
@@ -378,97 +861,74 @@ def update_authors_map(email, commit):
             average_wpm=0.0,
         )
     author_info = authors_map[email]
-    author_info.names.add(author.name)
-
-
-RotatedLock = namedtuple('RotatedLock', 'starting_point timestamp')
-
-
-def update_locks(email, repo_name, commit, last_locks):
-    """Update locks based on the given commit."""
-    tree = commit.tree
-    author_info = authors_map[normalize_email(email)]
-    date = commit.authored_date
-    if 'locks.json' in tree:
-        locks = load(tree['locks.json'].data_stream)
-        for lock_type, locks_dict in [
-            ('snippet', snippet_locks),
-            ('review', review_locks),
-        ]:
-            # Snippets.
-            this_locks = locks.get(lock_type, {})
-            last_locks = last_locks.get(lock_type, {})
-            this_by_secret = dict(
-                (
-                    value['secret'],
-                    RotatedLock(starting_point=int(key), timestamp=value['timestamp']),
-                )
-                for key, value
-                in this_locks.iteritems()
-            )
-            last_by_secret = dict(
-                (
-                    value['secret'],
-                    RotatedLock(starting_point=int(key), timestamp=value['timestamp']),
-                )
-                for key, value
-                in last_locks.iteritems()
+    author_info.names.update(names)
+
+
+def update_locks(result, email, date, locks, last_locks, completed=None):
+    """Update a RepoResult's locks based on how a commit changed locks.json.
+
+    ``last_locks`` and ``locks`` are the contents of locks.json before and
+    after the commit.  Each lock is keyed by its starting point, so a lock
+    was removed if its key is gone or now holds a different secret, and
+    vice versa for added locks.  ``completed`` maps lock types to the
+    starting points the commit removed from those remaining; a lock removed
+    from one of them was completed.
+    """
+    if completed is None:
+        completed = {}
+    for lock_type, locks_dict in [
+        ('snippet', result.snippet_locks),
+        ('review', result.review_locks),
+    ]:
+        this_locks = locks.get(lock_type, {})
+        prev_locks = last_locks.get(lock_type, {})
+        for key, value in prev_locks.iteritems():
+            this_value = this_locks.get(key)
+            if this_value is not None and this_value['secret'] == value['secret']:
+                continue
+            secret = value['secret']
+            lock_completed = int(key) in completed.get(lock_type, ())
+            lock = locks_dict.get(secret)
+            if lock is not None:
+                lock.destroyed_at = date
+                lock.destroyed_by = email
+                lock.completed = lock_completed
+            else:
+                # Created in an earlier run.
+                result.destroyed_locks.append((lock_type, secret, date, email, lock_completed))
+        for key, value in this_locks.iteritems():
+            prev_value = prev_locks.get(key)
+            if prev_value is not None and prev_value['secret'] == value['secret']:
+                continue
+            secret = value['secret']
+            locks_dict[secret] = Lock(
+                type=lock_type,
+                starting_point=int(key),
+                timestamp=value['timestamp'],
+                created_at=date,
+                created_by=email,
             )
-            removed_secrets = set(last_by_secret) - set(this_by_secret)
-            added_secrets = set(this_by_secret) - set(last_by_secret)
-            for secret in removed_secrets:
-                lock = locks_dict.get(secret)
-                if lock is not None:
-                    updated_lock = locks_dict[secret]
-                    updated_lock.destroyed_at = date
-                    updated_lock.destroyed_by = email
-            for secret in added_secrets:
-                this = this_by_secret[secret]
-                locks_dict[secret] = new_lock = Lock(
-                    type=lock_type,
-                    starting_point=int(this.starting_point),
-                    timestamp=this.timestamp,
-                    created_at=date,
-                    created_by=email,
-                )
-                author_repo_locks_created = author_info.locks_created.setdefault(repo_name, {})
-                author_repo_locks_created[secret] = new_lock
-        # Pass along most recently-read locks to compare with next round.
-        return locks
-    else:
-        # Pass along last used locks to compare with next round, since
-        # the structure wasn't found in the repo.
-        return last_locks
 
 
-def update_snippets(email, repo_info, commit):
-    """Update information about snippets touched by a commit."""
-    repo_name = repo_info.name
-    repo_snippets = repo_info.snippets
-    author_info = authors_map[email]
-    for filename in commit.stats.files:
+def update_snippets(result, repo, email, entry):
+    """Update a RepoResult with the snippets touched by a LogEntry."""
+    for filename, blob_sha in entry.changes:
         if len(filename) == 20 and filename.endswith('.txt'):
             # It's a snippet.  Find its starting point and create a SnippetAction instance.
             starting_point = int(filename[:16])
             snippet_action = SnippetAction(
                 email=email,
-                saved=commit.authored_date,
-                bytes=commit.tree[filename].size if filename in commit.tree else 0,
+                saved=entry.authored_date,
+                bytes=repo.odb.info(hex_to_bin(blob_sha)).size if blob_sha is not None else 0,
             )
-            # Add the snippet change to the author's info.
-            author_repo_snippets = author_info.snippets.setdefault(repo_name, {})
-            author_repo_snippets_list = author_repo_snippets.setdefault(starting_point, [])
-            author_repo_snippets_list.append(snippet_action)
-            # Add the snippet change to the repo's info.
-            repo_snippets_list = repo_snippets.setdefault(starting_point, [])
-            repo_snippets_list.append(snippet_action)
+            result.snippet_actions.append((starting_point, snippet_action))
 
 
 # ===================================================================
 # output
 
 
-PAGE_TEMPLATE = """\
+PAGE_HEADER = """\
 <!DOCTYPE html>
 <html>
     <head>
@@ -484,7 +944,8 @@ PAGE_TEMPLATE = """\
         {index_link}
         <h1>{title}</h1>
         <div>
-            {body}
+            """
+PAGE_FOOTER = """
         </div>
         <div id="footer">
             Generated at {timestamp}.
@@ -522,14 +983,25 @@ def transcript_filename(name):
     return 'transcript_{0}.html'.format(name)
 
 
-def create_all_output(path):
-    create_index(path)
-    create_all_transcript_pages(path)
-    create_all_author_pages(path)
+def create_all_output(path, repo_names=None, emails=None, window='day', snippet_seconds=30,
+                      partial=False):
+    """Write the index, throughput pages, and pages for the given repos and authors.
+
+    Pages for all repos or authors are written if ``repo_names`` or
+    ``emails`` are None.  Pages missing from ``path`` are always written.
+    If ``partial``, only some repos are loaded, so only transcript pages
+    are written; the rest would leave out the other repos.
+    """
+    if not partial:
+        create_index(path, window)
+        create_throughput_pages(path, window, snippet_seconds)
+    create_all_transcript_pages(path, repo_names)
+    if not partial:
+        create_all_author_pages(path, emails)
 
 
-def create_index(path):
-    body = ''
+def index_body(window):
+    """Yield the body of the index page."""
     # Transcripts.
     # ------------
     transcripts_list = [
@@ -547,7 +1019,7 @@ def create_index(path):
         ))
     # Sort by name.
     transcripts_list.sort(key=itemgetter(0))
-    body += """
+    yield """
         <h2>Transcripts</h2>
         <ul>
             {transcripts_list}
@@ -555,6 +1027,12 @@ def create_index(path):
     """.format(
         transcripts_list='\n'.join(html for name, html in transcripts_list),
     )
+    yield """
+        <p>
+            <a href="throughput.html">Throughput by {window}</a>
+            (also as <a href="throughput.json">JSON</a> or <a href="throughput.csv">CSV</a>)
+        </p>
+    """.format(window=window)
     # Authors.
     # --------
     authors_list = [
@@ -595,7 +1073,7 @@ def create_index(path):
         [item for item in authors_list if item[2] > 0],  # exclude non-transcribers
         key=lambda item: (item[3], item[0].lower()),
     ))
-    body += """
+    yield """
         <hr/>
         <p>Key: [author name] ([total hours spent], [transcriptions] @ [average <a href="http://en.wikipedia.org/wiki/Words_per_minute">WPM</a>])</p>
         <table border="0" cellspacing="10">
@@ -634,34 +1112,178 @@ def create_index(path):
         authors_by_total_transcriptions='\n'.join(item[-1] for item in authors_by_total_transcriptions),
         authors_by_average_time='\n'.join(item[-1] for item in authors_by_average_time),
     )
+
+
+def create_index(path, window='day'):
     write_page(
         index=True,
         path=path,
         filename='index.html',
         title='Fanscribed Stats',
-        body=body,
+        body=index_body(window),
     )
 
 
-def create_all_transcript_pages(path):
-    for repo_path, repo_info in repo_infos_by_path.iteritems():
-        name = repo_info.name
-        filename = transcript_filename(name)
-        body = ''
-        # General stats.
-        # ==============
-        body += '<h2>General stats</h2>'
-        total_snippets = snippets_in_ms(repo_info.transcription['duration'])
-        total_reviews = total_snippets - 1
-        repo = repo_info.repo
-        master = repo.tree('master')
-        remaining_reviews = len(load(master['remaining_reviews.json'].data_stream))
-        remaining_snippets = len(load(master['remaining_snippets.json'].data_stream))
-        snippets_completed = total_snippets - remaining_snippets
-        reviews_completed = total_reviews - remaining_reviews
-        percent_reviews = (reviews_completed * 100) / total_reviews
-        percent_snippets = (snippets_completed * 100) / total_snippets
-        body += """
+def throughput(window, snippet_seconds=30):
+    """Return the work done in each window of time, per repo and per author.
+
+    Return a ({repo_name: rows}, {email: rows}) pair, where each row is a
+    (start, snippets transcribed, reviews, minutes transcribed) tuple,
+    eldest first.
+    """
+    seconds = WINDOWS[window][0]
+    durations = dict(
+        (repo_ids.id(name), repo_info.transcription['duration'])
+        for name, repo_info
+        in repo_infos_by_name.iteritems()
+    )
+    by_repo, by_author = windowed_totals(
+        snippet_events, lock_events, seconds, snippet_seconds * 1000, durations)
+    repos = {}
+    for (repo, start), (transcriptions, reviews, ms) in by_repo.iteritems():
+        rows = repos.setdefault(repo_ids[repo], [])
+        rows.append((start, transcriptions, reviews, ms / 60000.0))
+    authors = {}
+    for (author, start), (transcriptions, reviews, ms) in by_author.iteritems():
+        email = author_ids[author]
+        if email in authors_map and email not in email_ignores:
+            rows = authors.setdefault(email, [])
+            rows.append((start, transcriptions, reviews, ms / 60000.0))
+    for rows in repos.values() + authors.values():
+        rows.sort()
+    return repos, authors
+
+
+def window_label(window, start):
+    return datetime.utcfromtimestamp(start).strftime(WINDOWS[window][1])
+
+
+def throughput_table(window, rows):
+    yield """
+        <table border="1" cellspacing="0" cellpadding="4">
+            <tr>
+                <th>{window} (UTC)</th>
+                <th>Snippets transcribed</th>
+                <th>Reviews</th>
+                <th>Minutes transcribed</th>
+            </tr>
+    """.format(window=window.capitalize())
+    for start, transcriptions, reviews, minutes in rows:
+        yield """
+            <tr>
+                <td>{label}</td>
+                <td>{transcriptions:d}</td>
+                <td>{reviews:d}</td>
+                <td>{minutes:0.01f}</td>
+            </tr>
+        """.format(
+            label=window_label(window, start),
+            transcriptions=transcriptions,
+            reviews=reviews,
+            minutes=minutes,
+        )
+    yield """
+        </table>
+    """
+
+
+def throughput_body(window, repos, authors):
+    """Yield the body of the throughput page."""
+    yield '<h2>Transcripts</h2>'
+    for name in sorted(repos):
+        yield '<h3><a href="{url}">{name}</a></h3>'.format(
+            url=quote(transcript_filename(name)),
+            name=name,
+        )
+        for piece in throughput_table(window, repos[name]):
+            yield piece
+    yield '<h2>Authors</h2>'
+    names_by_email = dict(
+        (email, escape(author_names(authors_map[email])))
+        for email in authors
+    )
+    for email in sorted(authors, key=lambda email: names_by_email[email].lower()):
+        yield '<h3><a href="{url}">{names}</a></h3>'.format(
+            url=author_filename(email),
+            names=names_by_email[email],
+        )
+        for piece in throughput_table(window, authors[email]):
+            yield piece
+
+
+def create_throughput_pages(path, window='day', snippet_seconds=30):
+    """Write throughput per window as HTML, JSON and CSV."""
+    repos, authors = throughput(window, snippet_seconds)
+    write_page(
+        path=path,
+        filename='throughput.html',
+        title='Throughput by {window}'.format(window=window),
+        body=throughput_body(window, repos, authors),
+    )
+    # Authors are identified by the hash used in their page names, not by email.
+    def json_rows(rows):
+        return [
+            dict(
+                start=start,
+                label=window_label(window, start),
+                snippets=transcriptions,
+                reviews=reviews,
+                minutes=minutes,
+            )
+            for start, transcriptions, reviews, minutes
+            in rows
+        ]
+    structure = dict(
+        window=window,
+        window_seconds=WINDOWS[window][0],
+        transcripts=dict((name, json_rows(rows)) for name, rows in repos.iteritems()),
+        authors=[
+            dict(
+                id=sha1(email).hexdigest(),
+                names=author_names(authors_map[email]),
+                windows=json_rows(rows),
+            )
+            for email, rows
+            in sorted(authors.iteritems())
+        ],
+    )
+    with output_file(path, 'throughput.json') as f:
+        f.write(dumps(structure))
+    with output_file(path, 'throughput.csv') as f:
+        writer = csv.writer(f)
+        writer.writerow(['kind', 'id', 'name', 'start', 'label', 'snippets', 'reviews', 'minutes'])
+        for kind, id_names_rows in [
+            ('transcript', [(name, name, rows) for name, rows in sorted(repos.iteritems())]),
+            ('author', [
+                (sha1(email).hexdigest(), author_names(authors_map[email]), rows)
+                for email, rows
+                in sorted(authors.iteritems())
+            ]),
+        ]:
+            for id, names, rows in id_names_rows:
+                for start, transcriptions, reviews, minutes in rows:
+                    writer.writerow([
+                        kind, id, names.encode('utf8'), start, window_label(window, start),
+                        transcriptions, reviews, '{0:0.02f}'.format(minutes),
+                    ])
+
+
+def transcript_body(repo_info):
+    """Yield the body of a repo's transcript page."""
+    # General stats.
+    # ==============
+    yield '<h2>General stats</h2>'
+    total_snippets = snippets_in_ms(repo_info.transcription['duration'])
+    total_reviews = total_snippets - 1
+    repo = repo_info.repo
+    master = repo.tree('master')
+    remaining_reviews = len(load(master['remaining_reviews.json'].data_stream))
+    remaining_snippets = len(load(master['remaining_snippets.json'].data_stream))
+    snippets_completed = total_snippets - remaining_snippets
+    reviews_completed = total_reviews - remaining_reviews
+    percent_reviews = (reviews_completed * 100) / total_reviews
+    percent_snippets = (snippets_completed * 100) / total_snippets
+    yield """
         <dl>
             <dt>Snippets transcribed</dt>
             <dd>{snippets_completed} of {total_snippets} ({percent_snippets}%)</dd>
@@ -670,47 +1292,49 @@ def create_all_transcript_pages(path):
             <dd>{reviews_completed} of {total_reviews} ({percent_reviews}%)</dd>
         </dl>
         """.format(**locals())
-        # Authors and editors
-        # ========
-        # Figure out who the top transcriptionists and editors are.
-        snippet_creators = {
-            # email: [starting_point, ...],
-        }
-        snippet_editors = {
-            # email: [starting_point, ...],
-        }
-        for starting_point, snippet_actions in repo_info.snippets.iteritems():
-            transcriptionist = snippet_actions[0].email
-            snippet_creator_snippets = snippet_creators.setdefault(transcriptionist, [])
-            snippet_creator_snippets.append(starting_point)
-            for snippet_action in snippet_actions[1:]:
-                editor = snippet_action.email
-                snippet_editor_snippets = snippet_editors.setdefault(editor, [])
-                snippet_editor_snippets.append(starting_point)
-        # Reverse sort by number of snippets created or edited.
-        snippet_creators = reversed(sorted(snippet_creators.iteritems(), key=lambda kv: (len(kv[1]), kv[0])))
-        snippet_editors = reversed(sorted(snippet_editors.iteritems(), key=lambda kv: (len(kv[1]), kv[0])))
-        snippet_creators = [
-            '<li><a href="{url}">{names}</a> ({count} snippets transcribed)</li>'.format(
-                url=author_filename(email),
-                names=author_names(authors_map[email]),
-                count=len(starting_points),
-            )
-            for email, starting_points
-            in snippet_creators
-            if email not in email_ignores
-        ]
-        snippet_editors = [
-            '<li><a href="{url}">{names}</a> ({count} snippets edited)</li>'.format(
-                url=author_filename(email),
-                names=author_names(authors_map[email]),
-                count=len(starting_points),
-            )
-            for email, starting_points
-            in snippet_editors
-            if email not in email_ignores
-        ]
-        body += """
+    # Authors and editors
+    # ========
+    # Figure out who the top transcriptionists and editors are.
+    snippet_creators = {
+        # email: [starting_point, ...],
+    }
+    snippet_editors = {
+        # email: [starting_point, ...],
+    }
+    repo = repo_ids.id(repo_info.name)
+    repo_snippets = snippet_events.starting_points(repo=repo).get(repo, {})
+    for starting_point, authors in repo_snippets.iteritems():
+        transcriptionist = author_ids[authors[0]]
+        snippet_creator_snippets = snippet_creators.setdefault(transcriptionist, [])
+        snippet_creator_snippets.append(starting_point)
+        for author in authors[1:]:
+            editor = author_ids[author]
+            snippet_editor_snippets = snippet_editors.setdefault(editor, [])
+            snippet_editor_snippets.append(starting_point)
+    # Reverse sort by number of snippets created or edited.
+    snippet_creators = reversed(sorted(snippet_creators.iteritems(), key=lambda kv: (len(kv[1]), kv[0])))
+    snippet_editors = reversed(sorted(snippet_editors.iteritems(), key=lambda kv: (len(kv[1]), kv[0])))
+    snippet_creators = [
+        '<li><a href="{url}">{names}</a> ({count} snippets transcribed)</li>'.format(
+            url=author_filename(email),
+            names=author_names(authors_map[email]),
+            count=len(starting_points),
+        )
+        for email, starting_points
+        in snippet_creators
+        if email not in email_ignores
+    ]
+    snippet_editors = [
+        '<li><a href="{url}">{names}</a> ({count} snippets edited)</li>'.format(
+            url=author_filename(email),
+            names=author_names(authors_map[email]),
+            count=len(starting_points),
+        )
+        for email, starting_points
+        in snippet_editors
+        if email not in email_ignores
+    ]
+    yield """
             <table border="0" cellspacing="10">
                 <tr valign="top">
                     <td>
@@ -728,24 +1352,30 @@ def create_all_transcript_pages(path):
                 </tr>
             </table>
         """.format(
-            snippet_creators='\n'.join(snippet_creators),
-            snippet_editors='\n'.join(snippet_editors),
-        )
+        snippet_creators='\n'.join(snippet_creators),
+        snippet_editors='\n'.join(snippet_editors),
+    )
+
+
+def create_all_transcript_pages(path, repo_names=None):
+    for repo_path, repo_info in repo_infos_by_path.iteritems():
+        name = repo_info.name
+        filename = transcript_filename(name)
+        if not _page_needed(path, filename, repo_names, name):
+            continue
         write_page(
             path=path,
             filename=filename,
             head_title='Transcript: {name}'.format(name=name),
             title='Transcript: <a href="http://{name}/">{name}</a>'.format(name=name),
-            body=body,
+            body=transcript_body(repo_info),
         )
 
 
-def create_all_author_pages(path):
-    for email, author_info in authors_map.iteritems():
-        names = escape(author_names(author_info))
-        body = ''
-        # General stats.
-        body += """
+def author_body(email, author_info):
+    """Yield the body of an author's page."""
+    # General stats.
+    yield """
             <h2>General stats</h2>
             <dl>
                 <dt>Total transcribe/edit actions</td>
@@ -761,51 +1391,83 @@ def create_all_author_pages(path):
                 <dd>{average_wpm:0.02f} WPM</dd>
             </dl>
         """.format(
-            total_actions=author_info.total_actions,
-            time_spent=author_info.time_spent / 60.0 / 60.0,
-            total_transcriptions=author_info.total_transcriptions,
-            average_wpm=author_info.average_wpm,
-        )
-        # Snippets contributed to.
-        body += '<h2>Snippets transcribed or edited</h2>'
-        snippets_map = authors_map[email].snippets
-        for repo_name in sorted(snippets_map):
-            snippet_action_map = snippets_map[repo_name]
-            starting_points = sorted(snippet_action_map)
-            list_items = [
-                '<li><a href="http://{repo_name}/#{label}">{repo_name}/#{label}</a></li>'.format(
-                    repo_name=repo_name,
-                    label=ms_to_label(starting_point)
-                )
-                for starting_point
-                in starting_points
-            ]
-            body += """
+        total_actions=author_info.total_actions,
+        time_spent=author_info.time_spent / 60.0 / 60.0,
+        total_transcriptions=author_info.total_transcriptions,
+        average_wpm=author_info.average_wpm,
+    )
+    # Snippets contributed to.
+    yield '<h2>Snippets transcribed or edited</h2>'
+    snippets_map = dict(
+        (repo_ids[repo], repo_snippets)
+        for repo, repo_snippets
+        in snippet_events.starting_points(author=author_ids.id(email)).iteritems()
+    )
+    for repo_name in sorted(snippets_map):
+        snippet_action_map = snippets_map[repo_name]
+        starting_points = sorted(snippet_action_map)
+        list_items = [
+            '<li><a href="http://{repo_name}/#{label}">{repo_name}/#{label}</a></li>'.format(
+                repo_name=repo_name,
+                label=ms_to_label(starting_point)
+            )
+            for starting_point
+            in starting_points
+        ]
+        yield """
                 <h3>{repo_name}</h3>
                 <ul>
                 {list_items}
                 </ul>
             """.format(
-                repo_name=repo_name,
-                list_items='\n'.join(list_items),
-            )
+            repo_name=repo_name,
+            list_items='\n'.join(list_items),
+        )
+
+
+def create_all_author_pages(path, emails=None):
+    for email, author_info in authors_map.iteritems():
+        filename = author_filename(email)
+        if not _page_needed(path, filename, emails, email):
+            continue
+        names = escape(author_names(author_info))
         write_page(
             path=path,
-            filename=author_filename(email),
+            filename=filename,
             title='Author: {names}'.format(names=names),
-            body=body,
+            body=author_body(email, author_info),
         )
 
 
-def write_page(path, filename, **kwargs):
+def _page_needed(path, filename, keys, key):
+    """Return True if ``key`` is one of ``keys`` (or ``keys`` is None), or
+    if its page has not been written yet."""
+    return keys is None or key in keys or not os.path.exists(os.path.join(path, filename))
+
+
+def write_page(path, filename, body, **kwargs):
+    """Write a page, streaming each piece of ``body`` to the file as it is
+    generated, then move it into place."""
     if 'index' not in kwargs:
         kwargs['index_link'] = '<p><a href="index.html">Back to stats home page</a></p>'
     else:
         kwargs['index_link'] = ''
     if 'head_title' not in kwargs:
         kwargs['head_title'] = kwargs['title']
-    kwargs['timestamp'] = unicode(datetime.now())
+    with output_file(path, filename) as f:
+        f.write(PAGE_HEADER.format(**kwargs))
+        for piece in body:
+            f.write(piece)
+        f.write(PAGE_FOOTER.format(timestamp=unicode(datetime.now())))
+
+
+@contextmanager
+def output_file(path, filename):
+    """Open a temporary file to write, and move it into place as ``filename``
+    once written."""
     filename = os.path.join(path, filename)
     log.fields(filename=filename).info('writing')
-    with open(filename, 'wb') as f:
-        f.write(PAGE_TEMPLATE.format(**kwargs))
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        yield f
+    os.rename(temp_filename, filename)
@@ -0,0 +1,233 @@
+"""Array-backed columns of the events that fanscribed-stats aggregates.
+
+Each event is a row across a set of ``array.array`` columns, with emails
+and repo names interned as small integers, rather than a Python object
+of its own.
+"""
+
+from array import array
+from itertools import izip
+
+
+# Stands in for None in integer columns.
+NONE = -1
+
+LOCK_TYPES = ['snippet', 'review']
+
+
+class Interner(object):
+    """Assign each distinct value a small integer id, in order of first use."""
+
+    def __init__(self):
+        self.ids = {
+            # value: id,
+        }
+        self.values = [
+            # value, (indexed by id)
+        ]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, id):
+        return self.values[id]
+
+    def id(self, value):
+        """Return the id of ``value``, assigning one if it is new."""
+        id = self.ids.get(value)
+        if id is None:
+            id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return id
+
+    def get(self, value, default=None):
+        """Return the id of ``value``, or ``default`` if it has none."""
+        return self.ids.get(value, default)
+
+
+class SnippetEvents(object):
+    """The creation or modification of snippets, eldest first."""
+
+    def __init__(self):
+        self.repo = array('i')
+        self.starting_point = array('l')  # ms
+        self.author = array('i')
+        self.saved = array('l')  # time
+        self.bytes = array('l')
+        # first_actions() so far, and how many rows it has seen.
+        self._first_actions = {}
+        self._first_actions_rows = 0
+        # Rows of each repo and author so far, and how many rows they have seen.
+        self._repo_rows = {}
+        self._author_rows = {}
+        self._indexed_rows = 0
+
+    def __len__(self):
+        return len(self.repo)
+
+    def append(self, repo, starting_point, author, saved, bytes):
+        self.repo.append(repo)
+        self.starting_point.append(starting_point)
+        self.author.append(author)
+        self.saved.append(saved)
+        self.bytes.append(bytes)
+
+    def first_actions(self):
+        """Return {(repo, starting_point): row} of each snippet's first action,
+        i.e. its transcription."""
+        if self._first_actions_rows == len(self):
+            # Nothing appended since last time.
+            return self._first_actions
+        first = self._first_actions
+        start = self._first_actions_rows
+        rows = xrange(start, len(self))
+        for row, key in izip(rows, izip(self.repo[start:], self.starting_point[start:])):
+            if key not in first:
+                first[key] = row
+        self._first_actions_rows = len(self)
+        return first
+
+    def _index(self):
+        """Bring the rows of each repo and author up to date."""
+        start = self._indexed_rows
+        rows = xrange(start, len(self))
+        for row, row_repo, row_author in izip(rows, self.repo[start:], self.author[start:]):
+            self._repo_rows.setdefault(row_repo, array('l')).append(row)
+            self._author_rows.setdefault(row_author, array('l')).append(row)
+        self._indexed_rows = len(self)
+
+    def starting_points(self, repo=None, author=None):
+        """Return {repo: {starting_point: [author, ...]}} for actions in
+        ``repo`` and/or by ``author``, if given, with authors eldest first."""
+        self._index()
+        if author is not None:
+            rows = self._author_rows.get(author, ())
+        elif repo is not None:
+            rows = self._repo_rows.get(repo, ())
+        else:
+            rows = xrange(len(self))
+        snippets = {}
+        for row in rows:
+            row_repo = self.repo[row]
+            if repo is not None and row_repo != repo:
+                continue
+            repo_snippets = snippets.setdefault(row_repo, {})
+            repo_snippets.setdefault(self.starting_point[row], []).append(self.author[row])
+        return snippets
+
+
+class LockEvents(object):
+    """Snippet and review locks, in the order they were created."""
+
+    def __init__(self):
+        self.repo = array('i')
+        self.type = array('b')  # index into LOCK_TYPES
+        self.starting_point = array('l')  # ms
+        self.timestamp = array('d')  # time
+        self.created_at = array('l')  # time
+        self.created_by = array('i')  # author
+        self.destroyed_at = array('l')  # time, or NONE
+        self.destroyed_by = array('i')  # author, or NONE
+        self.completed = array('b')  # 1 if removed by saving its snippet or review
+        # Only locks that may still be destroyed need to be found by secret.
+        self.open_rows = {
+            # secret: row,
+        }
+
+    def __len__(self):
+        return len(self.repo)
+
+    def append(self, secret, repo, type, starting_point, timestamp, created_at, created_by,
+               destroyed_at=NONE, destroyed_by=NONE, completed=0):
+        row = len(self.repo)
+        self.repo.append(repo)
+        self.type.append(type)
+        self.starting_point.append(starting_point)
+        self.timestamp.append(timestamp)
+        self.created_at.append(created_at)
+        self.created_by.append(created_by)
+        self.destroyed_at.append(destroyed_at)
+        self.destroyed_by.append(destroyed_by)
+        self.completed.append(completed)
+        if destroyed_at == NONE:
+            self.open_rows[secret] = row
+        return row
+
+    def destroy(self, secret, destroyed_at, destroyed_by, completed=0):
+        """Record that the lock with ``secret`` was removed; return its row,
+        or None if there is no such open lock."""
+        row = self.open_rows.pop(secret, None)
+        if row is not None:
+            self.destroyed_at[row] = destroyed_at
+            self.destroyed_by[row] = destroyed_by
+            self.completed[row] = completed
+        return row
+
+
+def author_totals(snippets, locks, author_count):
+    """Return per-author arrays of (total_actions, total_transcriptions,
+    time_spent, time_spent_transcribing, total_bytes_transcribed), indexed
+    by author id.
+
+    Time is spent holding locks that the same author later removed; it was
+    spent transcribing if the removal saved the snippet's first action.
+    """
+    total_actions = array('l', [0]) * author_count
+    total_transcriptions = array('l', [0]) * author_count
+    time_spent = array('l', [0]) * author_count
+    time_spent_transcribing = array('l', [0]) * author_count
+    total_bytes_transcribed = array('l', [0]) * author_count
+    for author in snippets.author:
+        total_actions[author] += 1
+    first_actions = snippets.first_actions()
+    for row in first_actions.itervalues():
+        total_transcriptions[snippets.author[row]] += 1
+    for repo, starting_point, created_at, created_by, destroyed_at, destroyed_by in izip(
+            locks.repo, locks.starting_point, locks.created_at, locks.created_by,
+            locks.destroyed_at, locks.destroyed_by):
+        if created_by != destroyed_by:
+            continue
+        duration = destroyed_at - created_at
+        time_spent[created_by] += duration
+        row = first_actions.get((repo, starting_point))
+        if row is not None and snippets.saved[row] == destroyed_at:
+            time_spent_transcribing[created_by] += duration
+            total_bytes_transcribed[created_by] += snippets.bytes[row]
+    return (total_actions, total_transcriptions, time_spent, time_spent_transcribing,
+            total_bytes_transcribed)
+
+
+def windowed_totals(snippets, locks, window, snippet_ms, durations):
+    """Return the work done in each ``window`` seconds, as a pair of dicts
+    {(repo, start): [transcriptions, reviews, ms], ...} and
+    {(author, start): [transcriptions, reviews, ms], ...}, where ``start`` is
+    the beginning of the window and ``ms`` is how much audio was transcribed.
+
+    Snippets are counted when first saved, and reviews when saved, to the
+    author who saved them.  ``durations`` maps repo ids to the length of
+    their audio, to account for a shorter last snippet.
+    """
+    by_repo = {}
+    by_author = {}
+    first_actions = snippets.first_actions()
+    for row in first_actions.itervalues():
+        repo = snippets.repo[row]
+        saved = snippets.saved[row]
+        start = saved - saved % window
+        ms = min(snippet_ms, durations.get(repo, snippet_ms) - snippets.starting_point[row])
+        for totals in [
+            by_repo.setdefault((repo, start), [0, 0, 0]),
+            by_author.setdefault((snippets.author[row], start), [0, 0, 0]),
+        ]:
+            totals[0] += 1
+            totals[2] += ms
+    review = LOCK_TYPES.index('review')
+    for repo, type, destroyed_at, destroyed_by, completed in izip(
+            locks.repo, locks.type, locks.destroyed_at, locks.destroyed_by, locks.completed):
+        if type != review or not completed:
+            # Still held, cancelled, or expired.
+            continue
+        start = destroyed_at - destroyed_at % window
+        by_repo.setdefault((repo, start), [0, 0, 0])[1] += 1
+        by_author.setdefault((destroyed_by, start), [0, 0, 0])[1] += 1
+    return by_repo, by_author
@@ -93,6 +93,9 @@
       <h2>Player</h2>
       <ul>
         <li><input id="player-auto-play-edit" type="checkbox"> <label for="player-auto-play-edit">Auto-play (on edit)</label></li>
+        % if low_bitrate_available:
+        <li><input id="player-low-bitrate" type="checkbox"> <label for="player-low-bitrate">Low-bandwidth audio (on edit)</label></li>
+        % endif
         <li style="display:none;">enabled: <span id="player-enabled"></span></li>
         <li>playing: <span id="player-isPlaying"></span></li>
         <li style="display:none;">url: <span id="player-url"></span></li>
@@ -131,7 +134,7 @@
   % endif
 
   <script type="text/javascript" src="${request.static_url('fanscribed:static/jquery.cookie.js')}?2012012401"></script>
-  <script type="text/javascript" src="${request.static_url('fanscribed:static/fanscribed.js')}?2012021301"></script>
+  <script type="text/javascript" src="${request.static_url('fanscribed:static/fanscribed.js')}?2026101801"></script>
   <script type="text/javascript">
     var cookie_options = {
       expires: 365,
@@ -141,6 +144,8 @@
     };
     var transcription = ${transcription_info_json | n};
     var latest_revision = '${latest_revision}';
+    // Audio padding on either side of a snippet; the server pre-cuts snippets with it.
+    var snippet_padding_ms = ${snippet_padding_ms};
   </script>
   ${next.head_script()}
   % if custom_js_revision:
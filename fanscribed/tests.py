@@ -14,3 +14,1310 @@ class ViewTests(unittest.TestCase):
         request = testing.DummyRequest()
         info = my_view(request)
         self.assertEqual(info['project'], 'fanscribed')
+
+
+def _mp3_frames(count, xing=False):
+    """Return ``count`` silent MPEG-1 Layer III frames (128kbps, 44.1kHz, stereo)."""
+    frame = '\xff\xfb\x90\x00' + '\x00' * 413
+    frames = [frame] * count
+    if xing:
+        frames.insert(0, frame[:36] + 'Xing' + frame[40:])
+    return 'ID3\x03\x00\x00\x00\x00\x00\x05' + 'x' * 5 + ''.join(frames)
+
+
+class Mp3FramesTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.path)
+
+    def test_iter_frames(self):
+        from fanscribed.mp3frames import iter_frames
+        frames = list(iter_frames(_mp3_frames(3), 15))
+        self.assertEqual([offset for offset, header in frames], [15, 432, 849])
+        self.assertEqual(frames[0][1].sample_rate, 44100)
+        self.assertEqual(frames[0][1].frame_length, 417)
+
+    def test_frame_index_and_cut_snippet(self):
+        import os
+        from fanscribed import mp3frames
+        full_mp3 = os.path.join(self.path, 'example.mp3')
+        with open(full_mp3, 'wb') as f:
+            f.write(_mp3_frames(100, xing=True))
+        index = mp3frames.frame_index(full_mp3)
+        self.assertEqual(index.frame_count, 100)
+        self.assertEqual(index.duration, 2612)
+        # The Xing frame is skipped, so frame 0 follows it.
+        self.assertEqual(index.offset_at(0), 15 + 417)
+        self.assertEqual(index.byte_range(1000, 2000), (15 + 417 * 39, 15 + 417 * 77))
+        self.assertEqual(index.offset_at(10000), 15 + 417 * 101)
+        output = os.path.join(self.path, 'snippet.mp3')
+        mp3frames.cut_snippet(full_mp3, output, 1000, 2000)
+        self.assertEqual(os.path.getsize(output), 417 * 38)
+
+    def test_replaced_index_is_closed(self):
+        import os
+        import time
+        from fanscribed import mp3frames
+        full_mp3 = os.path.join(self.path, 'example.mp3')
+        with open(full_mp3, 'wb') as f:
+            f.write(_mp3_frames(100))
+        index = mp3frames.frame_index(full_mp3)
+        self.assertTrue(mp3frames.frame_index(full_mp3) is index)
+        with open(full_mp3, 'wb') as f:
+            f.write(_mp3_frames(200))
+        later = time.time() + 10
+        os.utime(full_mp3, (later, later))
+        new_index = mp3frames.frame_index(full_mp3)
+        self.assertEqual(new_index.frame_count, 200)
+        self.assertRaises(ValueError, index.frame_offset, 0)
+
+    def test_building_one_index_does_not_block_others(self):
+        import os
+        import threading
+        from fanscribed import mp3frames
+        slow_mp3, fast_mp3 = [os.path.join(self.path, name) for name in ['slow.mp3', 'fast.mp3']]
+        for full_mp3 in [slow_mp3, fast_mp3]:
+            with open(full_mp3, 'wb') as f:
+                f.write(_mp3_frames(10))
+        build_index = mp3frames.build_index
+        release = threading.Event()
+        def slow_build_index(full_mp3):
+            if full_mp3 == slow_mp3:
+                release.wait(10)
+            return build_index(full_mp3)
+        mp3frames.build_index = slow_build_index
+        try:
+            thread = threading.Thread(target=mp3frames.frame_index, args=(slow_mp3,))
+            thread.start()
+            self.assertEqual(mp3frames.frame_index(fast_mp3).frame_count, 10)
+            self.assertTrue(thread.is_alive())
+            release.set()
+            thread.join(10)
+        finally:
+            release.set()
+            mp3frames.build_index = build_index
+        self.assertEqual(mp3frames.frame_index(slow_mp3).frame_count, 10)
+
+    def test_duration(self):
+        import os
+        import struct
+        from fanscribed import mp3frames
+        full_mp3 = os.path.join(self.path, 'example.mp3')
+        # Counted frame-by-frame, skipping a Xing tag without a frame count.
+        with open(full_mp3, 'wb') as f:
+            f.write(_mp3_frames(1000, xing=True))
+        self.assertEqual(mp3frames.duration(full_mp3), 26122)
+        # Read from the Xing tag's frame count.
+        content = _mp3_frames(1000, xing=True)
+        tag = 15 + 36
+        content = content[:tag + 4] + struct.pack('>II', 1, 2000) + content[tag + 12:]
+        with open(full_mp3, 'wb') as f:
+            f.write(content)
+        self.assertEqual(mp3frames.duration(full_mp3), 52244)
+
+
+class FileResponseTests(unittest.TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'snippet.mp3')
+        self.content = ''.join(chr(x % 256) for x in xrange(1000))
+        with open(self.filename, 'wb') as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.path)
+
+    def _get(self, **headers):
+        from pyramid.request import Request
+        from fanscribed.views import _file_response
+        request = Request.blank('/snippet.mp3', headers=headers)
+        return request.get_response(_file_response(request, self.filename, 'audio/mpeg'))
+
+    def test_whole_file(self):
+        response = self._get()
+        self.assertEqual(response.status_int, 200)
+        self.assertEqual(response.body, self.content)
+        self.assertEqual(response.content_type, 'audio/mpeg')
+        self.assertEqual(response.accept_ranges, 'bytes')
+
+    def test_file_wrapper(self):
+        from pyramid.request import Request
+        from fanscribed.views import _file_response
+        wrapped = []
+        def file_wrapper(f, block_size):
+            wrapped.append(f)
+            return iter(lambda: f.read(block_size), '')
+        request = Request.blank('/snippet.mp3', environ={'wsgi.file_wrapper': file_wrapper})
+        response = request.get_response(_file_response(request, self.filename, 'audio/mpeg'))
+        self.assertEqual(response.body, self.content)
+        self.assertEqual(len(wrapped), 1)
+
+    def test_byte_range(self):
+        response = self._get(Range='bytes=10-19')
+        self.assertEqual(response.status_int, 206)
+        self.assertEqual(response.body, self.content[10:20])
+        self.assertEqual(str(response.content_range), 'bytes 10-19/1000')
+
+    def test_suffix_range(self):
+        response = self._get(Range='bytes=-100')
+        self.assertEqual(response.status_int, 206)
+        self.assertEqual(response.body, self.content[-100:])
+        self.assertEqual(str(response.content_range), 'bytes 900-999/1000')
+
+    def test_unsatisfiable_range(self):
+        response = self._get(Range='bytes=2000-2999')
+        self.assertEqual(response.status_int, 416)
+        self.assertEqual(str(response.content_range), 'bytes */1000')
+
+    def test_etag(self):
+        etag = self._get().etag
+        self.assertEqual(self._get(**{'If-None-Match': '"{0}"'.format(etag)}).status_int, 304)
+        self.assertEqual(self._get(**{'If-None-Match': '"other"'}).status_int, 200)
+
+
+class SnippetDeliveryTests(unittest.TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        from pyramid import testing
+        from fanscribed import common
+        from fanscribed import mp3
+        from fanscribed.benchmarks.synthrepo import generate_repo
+        self.path = tempfile.mkdtemp()
+        for name in ['repos', 'audio', 'snippets']:
+            os.mkdir(os.path.join(self.path, name))
+        generate_repo(os.path.join(self.path, 'repos', 'example.com'), duration=60000, commits=0, seed=0)
+        with open(os.path.join(self.path, 'audio', 'example.com.mp3'), 'wb') as f:
+            f.write(_mp3_frames(2500))
+        self.saved = mp3.SNIPPET_CUTTER, mp3.LOW_BITRATE_AVAILABLE
+        mp3.SNIPPET_CUTTER = 'frames'
+        common._settings = None
+        self.settings = {
+            'fanscribed.repos': os.path.join(self.path, 'repos'),
+            'fanscribed.audio': os.path.join(self.path, 'audio'),
+            'fanscribed.snippet_cache': os.path.join(self.path, 'snippets'),
+            'fanscribed.snippet_url_prefix': '/static/snippets/',
+        }
+        testing.setUp(settings=self.settings)
+
+    def tearDown(self):
+        import shutil
+        from pyramid import testing
+        from fanscribed import common
+        from fanscribed import mp3
+        mp3.SNIPPET_CUTTER, mp3.LOW_BITRATE_AVAILABLE = self.saved
+        testing.tearDown()
+        common._settings = None
+        shutil.rmtree(self.path)
+
+    def _get(self, delivery, query='', **headers):
+        from pyramid.request import Request
+        from fanscribed.common import app_settings
+        from fanscribed.views import snippet_mp3
+        app_settings()['fanscribed.snippet_delivery'] = delivery
+        request = Request.blank(
+            '/snippet.mp3?starting_point=30000&length=30000&padding=0' + query,
+            headers=dict(headers, Host='example.com'))
+        return snippet_mp3(request)
+
+    def _snippets(self):
+        import os
+        return os.listdir(self.settings['fanscribed.snippet_cache'])
+
+    def test_redirect(self):
+        from pyramid.httpexceptions import HTTPFound
+        try:
+            self._get('redirect')
+        except HTTPFound as e:
+            name, = self._snippets()
+            self.assertEqual(e.location, '/static/snippets/' + name)
+        else:
+            self.fail('Not redirected')
+
+    def test_direct(self):
+        from pyramid.request import Request
+        response = self._get('direct')
+        request = Request.blank('/', headers={'Range': 'bytes=0-416'})
+        response = request.get_response(response)
+        self.assertEqual(response.status_int, 206)
+        self.assertEqual(response.body[:2], '\xff\xfb')
+        self.assertEqual(response.content_type, 'audio/mpeg')
+
+    def test_x_accel_redirect(self):
+        from fanscribed.common import app_settings
+        app_settings()['fanscribed.snippet_accel_prefix'] = '/internal/snippets/'
+        response = self._get('x-accel-redirect')
+        name, = self._snippets()
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/internal/snippets/' + name)
+        self.assertEqual(response.content_type, 'audio/mpeg')
+        self.assertEqual(response.body, '')
+
+    def test_x_sendfile(self):
+        import os
+        response = self._get('x-sendfile')
+        name, = self._snippets()
+        self.assertEqual(response.headers['X-Sendfile'],
+                         os.path.join(self.settings['fanscribed.snippet_cache'], name))
+        self.assertEqual(response.body, '')
+
+    def test_low_quality_without_lame(self):
+        from fanscribed import mp3
+        mp3.LOW_BITRATE_AVAILABLE = False
+        response = self._get('x-sendfile', '&quality=low')
+        self.assertEqual(response.headers['X-Sendfile'], self._get('x-sendfile').headers['X-Sendfile'])
+
+    def test_prefetch_variant(self):
+        from pyramid.request import Request
+        from fanscribed import mp3
+        from fanscribed.views import _prefetch_variant
+        mp3.LOW_BITRATE_AVAILABLE = True
+        self.assertEqual(_prefetch_variant(Request.blank('/lock_snippet')), None)
+        self.assertEqual(_prefetch_variant(Request.blank('/lock_snippet?quality=low')), 'low')
+        request = Request.blank('/lock_snippet', headers={'Cookie': 'low_bitrate_audio=1'})
+        self.assertEqual(_prefetch_variant(request), 'low')
+        request = Request.blank('/lock_snippet', headers={'Cookie': 'low_bitrate_audio='})
+        self.assertEqual(_prefetch_variant(request), None)
+        mp3.LOW_BITRATE_AVAILABLE = False
+        self.assertEqual(_prefetch_variant(Request.blank('/lock_snippet?quality=low')), None)
+
+
+class Mp3Tests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from fanscribed import mp3
+        self.path = tempfile.mkdtemp()
+        self.snippet_cutter = mp3.SNIPPET_CUTTER
+        mp3.SNIPPET_CUTTER = 'frames'
+
+    def tearDown(self):
+        import shutil
+        from fanscribed import mp3
+        mp3.SNIPPET_CUTTER = self.snippet_cutter
+        shutil.rmtree(self.path)
+
+    def test_low_bitrate_snippet(self):
+        import os
+        from fanscribed import mp3
+        if not mp3.lame_available():
+            self.skipTest('lame is not installed')
+        full_mp3 = os.path.join(self.path, 'example.mp3')
+        with open(full_mp3, 'wb') as f:
+            f.write(_mp3_frames(1000, xing=True))
+        kwargs = dict(full_mp3=full_mp3, duration=26122, output_path=self.path,
+                      starting_point=5000, length=10000, padding=0)
+        full = mp3.snippet_path(**kwargs)
+        low = mp3.snippet_path(variant='low', **kwargs)
+        self.assertNotEqual(low, full)
+        self.assertTrue(0 < os.path.getsize(low) < os.path.getsize(full))
+        # Cached under its own name.
+        self.assertEqual(mp3.snippet_path(variant='low', **kwargs), low)
+
+
+class AudioJobsTests(unittest.TestCase):
+    def test_concurrent_jobs_are_deduplicated(self):
+        import threading
+        from fanscribed.audiojobs import Scheduler
+        scheduler = Scheduler(workers=1)
+        release = threading.Event()
+        calls = []
+        def cut(name):
+            release.wait()
+            calls.append(name)
+            return name
+        first = scheduler.submit('a.mp3', cut, 'a.mp3')
+        second = scheduler.submit('a.mp3', cut, 'a.mp3')
+        self.assertTrue(first is second)
+        release.set()
+        self.assertEqual(first.wait(), 'a.mp3')
+        self.assertEqual(calls, ['a.mp3'])
+
+    def test_queue_limit(self):
+        import threading
+        from fanscribed.audiojobs import QueueFull, Scheduler
+        scheduler = Scheduler(workers=1, queue_limit=1, retry_after=7)
+        release = threading.Event()
+        started = threading.Event()
+        def cut():
+            started.set()
+            release.wait()
+        running = scheduler.submit('a.mp3', cut)
+        started.wait()
+        waiting = scheduler.submit('b.mp3', cut)
+        try:
+            scheduler.submit('c.mp3', cut)
+        except QueueFull as e:
+            self.assertEqual(e.retry_after, 7)
+        else:
+            self.fail('QueueFull not raised')
+        release.set()
+        running.wait()
+        waiting.wait()
+
+
+def _commit_files(repo_path, files, email='alice@example.com', date=1300000000):
+    """Commit ``files`` ({path: content, or None to delete}) with git."""
+    import os
+    import subprocess
+    env = dict(os.environ,
+               GIT_AUTHOR_NAME='Alice', GIT_AUTHOR_EMAIL=email,
+               GIT_AUTHOR_DATE='{0} +0000'.format(date),
+               GIT_COMMITTER_NAME='Alice', GIT_COMMITTER_EMAIL=email,
+               GIT_COMMITTER_DATE='{0} +0000'.format(date))
+    for path, content in files.iteritems():
+        if content is None:
+            subprocess.check_call(['git', 'rm', '-q', path], cwd=repo_path)
+        else:
+            with open(os.path.join(repo_path, path), 'wb') as f:
+                f.write(content)
+            subprocess.check_call(['git', 'add', path], cwd=repo_path)
+    subprocess.check_call(['git', 'commit', '-q', '-m', 'test'], cwd=repo_path, env=env)
+
+
+class GitLogTests(unittest.TestCase):
+    def setUp(self):
+        import subprocess
+        import tempfile
+        self.path = tempfile.mkdtemp()
+        subprocess.check_call(['git', 'init', '-q', self.path])
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.path)
+
+    def test_iter_log(self):
+        import git
+        from fanscribed.gitlog import blob_sha_at, iter_log
+        _commit_files(self.path, {'locks.json': '{}', '0000000000000000.txt': 'hello'})
+        _commit_files(self.path, {'0000000000000000.txt': None},
+                      email='bob@example.com', date=1300000060)
+        repo = git.Repo(self.path)
+        entries = list(iter_log(repo))
+        self.assertEqual([entry.author_email for entry in entries],
+                         [u'alice@example.com', u'bob@example.com'])
+        self.assertEqual(entries[1].authored_date, 1300000060)
+        first_changes = dict(entries[0].changes)
+        self.assertEqual(first_changes['0000000000000000.txt'],
+                         blob_sha_at(repo, 'master~1', '0000000000000000.txt'))
+        self.assertEqual(entries[1].changes, [('0000000000000000.txt', None)])
+        # Only commits after ``since``.
+        since = entries[0].hexsha
+        self.assertEqual([entry.hexsha for entry in iter_log(repo, since=since)],
+                         [entries[1].hexsha])
+        self.assertEqual(blob_sha_at(repo, 'master', '0000000000000000.txt'), None)
+
+
+class StatsStoreTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        from fanscribed import stats
+        for global_map in [stats.authors_map, stats.repo_infos_by_path,
+                           stats.repo_infos_by_name, stats.latest_commits]:
+            global_map.clear()
+        shutil.rmtree(self.path)
+
+    def _result(self, name, email):
+        from fanscribed import stats
+        lock = stats.Lock(type='snippet', starting_point=0, timestamp=1.5,
+                          created_at=100, created_by=email, destroyed_at=130, destroyed_by=email)
+        return stats.RepoResult(
+            name=name,
+            latest_commit='a' * 40,
+            author_names={email: set([u'Alice'])},
+            review_locks={},
+            snippet_locks={u'secret-' + name: lock},
+            snippet_actions=[(0, stats.SnippetAction(email=email, saved=130, bytes=12))],
+        )
+
+    def test_save_and_load(self):
+        import os
+        from fanscribed import stats
+        filename = os.path.join(self.path, 'stats.db')
+        store = stats.StatsStore(filename)
+        for name, email in [('one', u'alice@example.com'), ('two', u'bob@example.com')]:
+            repo_info = stats.RepoInfo(name=name, transcription={'duration': 1000})
+            store.save_repo_result('/repos/' + name, repo_info, self._result(name, email))
+        store.close()
+        store = stats.StatsStore(filename)
+        stats.load_store(store)
+        self.assertEqual(sorted(stats.repo_infos_by_path), ['/repos/one', '/repos/two'])
+        self.assertEqual(stats.latest_commits['one'], 'a' * 40)
+        self.assertEqual(stats.authors_map[u'alice@example.com'].names, set([u'Alice']))
+        self.assertEqual(len(stats.lock_events), 2)
+        self.assertEqual(list(stats.snippet_events.bytes), [12, 12])
+        stats.process_all_authors()
+        alice = stats.authors_map[u'alice@example.com']
+        self.assertEqual((alice.total_transcriptions, alice.time_spent), (1, 30))
+        # Partial loads.
+        stats.load_store(store, repo_names=['two'])
+        self.assertEqual(list(stats.repo_infos_by_name), ['two'])
+        self.assertEqual(list(stats.authors_map), [u'bob@example.com'])
+        stats.load_store(store, emails=[u'alice@example.com'])
+        self.assertEqual(sorted(stats.repo_infos_by_name), ['one', 'two'])
+        self.assertEqual(list(stats.authors_map), [u'alice@example.com'])
+        self.assertEqual(len(stats.lock_events), 1)
+        self.assertEqual(len(stats.snippet_events), 2)
+        store.close()
+
+    def test_version_mismatch(self):
+        import os
+        import sqlite3
+        from fanscribed import stats
+        filename = os.path.join(self.path, 'stats.db')
+        sqlite3.connect(filename).execute('PRAGMA user_version = 999')
+        self.assertRaises(stats.StoreVersionError, stats.StatsStore, filename)
+
+
+class StatsEventsTests(unittest.TestCase):
+    def test_author_totals(self):
+        from fanscribed.statsevents import (
+            Interner, LockEvents, SnippetEvents, author_totals)
+        authors = Interner()
+        al, bea = authors.id('al@example.com'), authors.id('bea@example.com')
+        self.assertEqual(authors.id('al@example.com'), al)
+        snippets = SnippetEvents()
+        snippets.append(0, 0, al, 160, 50)  # transcription
+        snippets.append(0, 0, bea, 400, 60)  # edit
+        snippets.append(0, 30000, bea, 500, 70)  # transcription
+        locks = LockEvents()
+        locks.append('a', 0, 0, 0, 1.0, 100, al)
+        locks.append('b', 0, 0, 30000, 1.0, 200, bea)
+        locks.append('c', 0, 1, 0, 1.0, 300, bea)
+        self.assertEqual(locks.destroy('a', 160, al), 0)
+        locks.destroy('b', 500, bea)
+        locks.destroy('c', 400, al)  # removed by someone else
+        self.assertEqual(locks.destroy('a', 170, al), None)
+        totals = [list(column) for column in author_totals(snippets, locks, len(authors))]
+        self.assertEqual(totals, [
+            [1, 2],  # total_actions
+            [1, 1],  # total_transcriptions
+            [60, 300],  # time_spent
+            [60, 300],  # time_spent_transcribing
+            [50, 70],  # total_bytes_transcribed
+        ])
+
+    def test_starting_points(self):
+        from fanscribed.statsevents import SnippetEvents
+        snippets = SnippetEvents()
+        snippets.append(0, 0, 0, 100, 50)
+        snippets.append(1, 0, 1, 200, 60)
+        snippets.append(0, 30000, 1, 300, 70)
+        self.assertEqual(snippets.starting_points(), {0: {0: [0], 30000: [1]}, 1: {0: [1]}})
+        self.assertEqual(snippets.starting_points(repo=0), {0: {0: [0], 30000: [1]}})
+        # Rows appended since are found too.
+        snippets.append(0, 0, 1, 400, 80)
+        self.assertEqual(snippets.starting_points(author=1), {0: {0: [1], 30000: [1]}, 1: {0: [1]}})
+        self.assertEqual(snippets.starting_points(repo=0, author=1), {0: {0: [1], 30000: [1]}})
+        self.assertEqual(snippets.starting_points(repo=2), {})
+
+    def test_windowed_totals(self):
+        from fanscribed.statsevents import LockEvents, SnippetEvents, windowed_totals
+        snippets = SnippetEvents()
+        snippets.append(0, 0, 0, 3500, 50)
+        snippets.append(0, 0, 1, 3700, 60)  # edit; not counted
+        snippets.append(0, 30000, 1, 3700, 70)
+        snippets.append(0, 60000, 1, 7300, 10)  # last snippet, 10s long
+        locks = LockEvents()
+        locks.append('r', 0, 1, 0, 1.0, 3000, 0)
+        locks.destroy('r', 3650, 0, completed=1)
+        locks.append('c', 0, 1, 30000, 1.0, 3000, 1)
+        locks.destroy('c', 3650, 1)  # cancelled; not counted
+        locks.append('s', 0, 1, 30000, 1.0, 3000, 1)
+        locks.destroy('s', 3650, 0)  # expired and taken by someone else; not counted
+        by_repo, by_author = windowed_totals(snippets, locks, 3600, 30000, {0: 70000})
+        self.assertEqual(by_repo, {
+            (0, 0): [1, 0, 30000],
+            (0, 3600): [1, 1, 30000],
+            (0, 7200): [1, 0, 10000],
+        })
+        self.assertEqual(by_author, {
+            (0, 0): [1, 0, 30000],
+            (0, 3600): [0, 1, 0],
+            (1, 3600): [1, 0, 30000],
+            (1, 7200): [1, 0, 10000],
+        })
+
+
+class StatsOutputTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.path)
+
+    def test_only_changed_or_missing_pages_are_written(self):
+        import os
+        from fanscribed import stats
+        def body():
+            yield '<p>one</p>'
+            yield '<p>two</p>'
+        stats.write_page(self.path, 'a.html', body(), title='A')
+        with open(os.path.join(self.path, 'a.html')) as f:
+            self.assertTrue('<p>one</p><p>two</p>' in f.read())
+        self.assertEqual(os.listdir(self.path), ['a.html'])
+        self.assertFalse(stats._page_needed(self.path, 'a.html', set(['b']), 'a'))
+        self.assertTrue(stats._page_needed(self.path, 'a.html', set(['a']), 'a'))
+        self.assertTrue(stats._page_needed(self.path, 'a.html', None, 'a'))
+        self.assertTrue(stats._page_needed(self.path, 'b.html', set(), 'b'))
+
+    def test_partial_output_only_writes_transcripts(self):
+        from fanscribed import stats
+        names = ['create_index', 'create_throughput_pages',
+                 'create_all_transcript_pages', 'create_all_author_pages']
+        saved = [getattr(stats, name) for name in names]
+        written = []
+        def recorder(name):
+            return lambda *args, **kwargs: written.append(name)
+        for name in names:
+            setattr(stats, name, recorder(name))
+        try:
+            stats.create_all_output(self.path, set(['a']), set(), partial=True)
+            self.assertEqual(written, ['create_all_transcript_pages'])
+            stats.create_all_output(self.path, set(['a']), set())
+            self.assertEqual(written[1:], names)
+        finally:
+            for name, function in zip(names, saved):
+                setattr(stats, name, function)
+
+
+class StatsLocksTests(unittest.TestCase):
+    def _result(self):
+        from fanscribed import stats
+        return stats.RepoResult(review_locks={}, snippet_locks={}, destroyed_locks=[])
+
+    def test_update_locks(self):
+        from fanscribed.stats import update_locks
+        result = self._result()
+        held = {'snippet': {'0': {'secret': 'a', 'timestamp': 1.0}},
+                'review': {'0': {'secret': 'r', 'timestamp': 1.0}}}
+        update_locks(result, 'al@example.com', 100, held, {})
+        self.assertEqual(sorted(result.snippet_locks), ['a'])
+        self.assertEqual(sorted(result.review_locks), ['r'])
+        # Same key, new secret: one lock removed and another added.
+        relocked = {'snippet': {'0': {'secret': 'b', 'timestamp': 2.0}}, 'review': {}}
+        update_locks(result, 'bea@example.com', 160, relocked, held)
+        self.assertEqual(result.snippet_locks['a'].destroyed_by, 'bea@example.com')
+        self.assertEqual(result.review_locks['r'].destroyed_at, 160)
+        self.assertEqual(result.snippet_locks['b'].created_by, 'bea@example.com')
+        self.assertEqual(result.destroyed_locks, [])
+
+    def test_locks_from_earlier_runs(self):
+        from fanscribed.stats import update_locks
+        result = self._result()
+        held = {'snippet': {'30000': {'secret': 'a', 'timestamp': 1.0}}}
+        update_locks(result, 'al@example.com', 100, {}, held)
+        self.assertEqual(result.destroyed_locks, [('snippet', 'a', 100, 'al@example.com', False)])
+
+    def test_completed_locks(self):
+        from fanscribed.stats import update_locks
+        result = self._result()
+        held = {'review': {'0': {'secret': 'r', 'timestamp': 1.0},
+                           '30000': {'secret': 's', 'timestamp': 1.0}}}
+        update_locks(result, 'al@example.com', 100, held, {})
+        # Saving removes the review from those remaining; cancelling doesn't.
+        update_locks(result, 'al@example.com', 160, {'review': {'30000': held['review']['30000']}},
+                     held, {'review': set([0])})
+        update_locks(result, 'al@example.com', 170, {}, {'review': {'30000': held['review']['30000']}}, {})
+        self.assertEqual(result.review_locks['r'].completed, True)
+        self.assertEqual(result.review_locks['s'].completed, False)
+
+    def test_reviews_counted_when_saved(self):
+        import os
+        import re
+        import tempfile
+        import shutil
+        import git
+        from fanscribed import stats
+        from fanscribed.benchmarks.synthrepo import generate_repo
+        path = tempfile.mkdtemp()
+        try:
+            repo_path = os.path.join(path, 'example.com')
+            generate_repo(repo_path, duration=600000, commits=120, seed=3)
+            messages = [commit.message for commit in git.Repo(repo_path).iter_commits('master')]
+            saved = len([m for m in messages if re.match(r'review: .*, saved by', m)])
+            cancelled = len([m for m in messages if re.match(r'review: .*, cancel by', m)])
+            self.assertTrue(saved and cancelled)
+            result = stats.process_repo((repo_path, 'example.com', None, {}))
+            completed = [lock for lock in result.review_locks.itervalues() if lock.completed]
+            self.assertEqual(len(completed), saved)
+        finally:
+            shutil.rmtree(path)
+
+
+class LiveStatsTests(unittest.TestCase):
+    def setUp(self):
+        import os
+        import subprocess
+        import tempfile
+        self.path = tempfile.mkdtemp()
+        self.repo_path = os.path.join(self.path, 'example.com')
+        subprocess.check_call(['git', 'init', '-q', self.repo_path])
+        _commit_files(self.repo_path, {
+            'transcription.json': '{"duration": 90000}',
+            'remaining_snippets.json': '[0, 30000, 60000]',
+            'remaining_reviews.json': '[0, 30000]',
+            'locks.json': '{}',
+        })
+        self.engines = []
+
+    def tearDown(self):
+        import shutil
+        # Stop polling before the repository is removed.
+        for engine in self.engines:
+            engine.stop()
+        shutil.rmtree(self.path)
+
+    def _engine(self, **kwargs):
+        from fanscribed.livestats import LiveStats
+        engine = LiveStats(self.path, **kwargs)
+        self.engines.append(engine)
+        return engine
+
+    def _transcribe(self):
+        _commit_files(self.repo_path, {
+            'locks.json': '{"snippet": {"0": {"secret": "a", "timestamp": 1.0}}}',
+        }, date=1300000100)
+        _commit_files(self.repo_path, {
+            'locks.json': '{}',
+            'remaining_snippets.json': '[30000, 60000]',
+            '0000000000000000.txt': 'hello there',
+        }, date=1300000160)
+
+    def test_incremental_updates(self):
+        import json
+        from fanscribed.statsevents import author_totals
+        engine = self._engine()
+        self.assertEqual(engine.repo_names(), ['example.com'])
+        engine.update(engine.repo_names())
+        self.assertEqual(json.loads(engine.authors_json())['authors'], [])
+        _commit_files(self.repo_path, {
+            'locks.json': '{"snippet": {"0": {"secret": "a", "timestamp": 1.0}}}',
+        }, date=1300000100)
+        engine.update(['example.com'])
+        _commit_files(self.repo_path, {
+            'locks.json': '{}',
+            'remaining_snippets.json': '[30000, 60000]',
+            '0000000000000000.txt': 'hello there',
+        }, date=1300000160)
+        engine.update(['example.com'])
+        # Running totals agree with a replay of the same events.
+        self.assertEqual(engine.totals, [[1, 1, 60, 60, 11]])
+        self.assertEqual(
+            engine.totals,
+            [[column[0] for column in author_totals(engine.snippets, engine.locks, 1)]])
+        authors = json.loads(engine.authors_json())['authors']
+        self.assertEqual(len(authors), 1)
+        self.assertEqual(authors[0]['names'], ['Alice'])
+        self.assertEqual((authors[0]['transcriptions'], authors[0]['wpm']), (1, 2.2))
+        transcript, = json.loads(engine.transcripts_json())['transcripts']
+        self.assertEqual(transcript['name'], 'example.com')
+        self.assertEqual((transcript['snippets_completed'], transcript['total_snippets']), (1, 3))
+        self.assertEqual(transcript['transcriptionists'][0]['snippets'], 1)
+
+    def test_render_failure(self):
+        import json
+        import logging
+        engine = self._engine()
+        def fail():
+            raise RuntimeError('render failed')
+        engine._render = fail
+        logging.getLogger('fanscribed.livestats').disabled = True
+        try:
+            engine.update(engine.repo_names())
+        finally:
+            logging.getLogger('fanscribed.livestats').disabled = False
+        # Readers get the last rendering.
+        self.assertEqual(json.loads(engine.authors_json())['authors'], [])
+
+    def test_warm_start_from_store(self):
+        import json
+        import os
+        import time
+        from fanscribed import stats
+        self._transcribe()
+        filename = os.path.join(self.path, 'stats.sqlite')
+        store = stats.StatsStore(filename)
+        result = stats.process_repo((self.repo_path, 'example.com', None, {}))
+        for names in result.author_names.itervalues():
+            # Only known from the store.
+            names.add('Al')
+        store.save_repo_result(self.repo_path, stats.RepoInfo(transcription={}), result)
+        store.close()
+        engine = self._engine(store=filename)
+        with engine._update_lock:
+            # Readers don't wait for the worker thread.
+            self.assertEqual(json.loads(engine.authors_json()),
+                             {'authors': [], 'updated': None, 'warming_up': True})
+        deadline = time.time() + 5
+        while json.loads(engine.authors_json())['warming_up'] and time.time() < deadline:
+            time.sleep(0.05)
+        authors = json.loads(engine.authors_json())
+        self.assertFalse(authors['warming_up'])
+        self.assertEqual(authors['authors'][0]['names'], ['Al', 'Alice'])
+        # Nothing is read twice.
+        self.assertEqual(engine.totals, [[1, 1, 60, 60, 11]])
+        self.assertEqual(engine.latest_commits, {'example.com': result.latest_commit})
+
+    def test_polls_for_commits_elsewhere(self):
+        import json
+        import time
+        engine = self._engine(poll_interval=0.05)
+        self.assertEqual(json.loads(engine.authors_json())['authors'], [])
+        # Committed by another process, without notifying this engine.
+        _commit_files(self.repo_path, {
+            'locks.json': '{}',
+            'remaining_snippets.json': '[30000, 60000]',
+            '0000000000000000.txt': 'hello there',
+        }, date=1300000160)
+        self.assertEqual(engine.changed_repo_names(), ['example.com'])
+        deadline = time.time() + 5
+        while not json.loads(engine.authors_json())['authors'] and time.time() < deadline:
+            time.sleep(0.05)
+        authors = json.loads(engine.authors_json())
+        self.assertEqual((len(authors['authors']), authors['warming_up']), (1, False))
+        self.assertEqual(engine.changed_repo_names(), [])
+        engine.stop()
+        self.assertFalse(engine._thread.is_alive())
+
+
+class BenchmarksTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.path)
+
+    def test_generate_repo(self):
+        import json
+        import os
+        import git
+        from fanscribed.benchmarks.synthrepo import generate_repo
+        from fanscribed.transcripts import dialogue_list
+        repo_path = os.path.join(self.path, 'example.com')
+        self.assertEqual(generate_repo(repo_path, duration=95000, commits=9, seed=0), 8)
+        repo = git.Repo(repo_path)
+        self.assertEqual(len(list(repo.iter_commits('master'))), 9)
+        self.assertFalse(repo.is_dirty())
+        tree = repo.tree('master')
+        self.assertEqual(json.load(tree['transcription.json'].data_stream)['duration'], 95000)
+        snippets = [blob for blob in tree.blobs if len(blob.name) == 20]
+        remaining = json.load(tree['remaining_snippets.json'].data_stream)
+        self.assertEqual(len(snippets) + len(remaining), 4)
+        for blob in snippets:
+            part = dialogue_list(blob.data_stream.read().decode('utf8'))[0]
+            self.assertTrue(part['abbreviation'] in [u's0', u's1'])
+
+    def test_compare(self):
+        from fanscribed.benchmarks.micro import compare
+        import sys
+        from StringIO import StringIO
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            regressions = compare(
+                {'a/1': 1.0, 'b/1': 1.0, 'c/1': 1.0},
+                {'a/1': 1.5, 'b/1': 1.1, 'd/1': 9.0},
+                threshold=0.25,
+            )
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(regressions, ['a/1'])
+
+
+class MetricsTests(unittest.TestCase):
+    def test_request_phases(self):
+        from fanscribed import metrics
+        lock = metrics.TimedLock('test_lock')
+        @metrics.timed('test_git')
+        def read_git(depth):
+            if depth:
+                # Nested calls are only counted once.
+                read_git(depth - 1)
+        def handler(request):
+            with lock:
+                read_git(2)
+            metrics.count_cache_lookup(hit=True)
+            metrics.count_cache_lookup(hit=False)
+            return 'response'
+        class DummyRoute(object):
+            name = 'test_route'
+        class DummyRequest(object):
+            matched_route = DummyRoute()
+        tween = metrics.metrics_tween_factory(handler, None)
+        self.assertEqual(tween(DummyRequest()), 'response')
+        # Outside a request, nothing is recorded.
+        read_git(0)
+        exposition = metrics.exposition()
+        for phase in ['test_git', 'test_lock_wait', 'test_lock_hold']:
+            self.assertTrue(
+                'fanscribed_phase_seconds_count{{route="test_route",phase="{0}"}} 1\n'.format(phase)
+                in exposition)
+        self.assertTrue('fanscribed_request_seconds_bucket{route="test_route",le="+Inf"} 1\n' in exposition)
+        self.assertTrue('fanscribed_cache_hit_ratio{route="test_route"} 0.5\n' in exposition)
+
+
+class GitAccountingTests(unittest.TestCase):
+    def setUp(self):
+        import subprocess
+        import tempfile
+        self.path = tempfile.mkdtemp()
+        subprocess.check_call(['git', 'init', '-q', self.path])
+        _commit_files(self.path, {'0000000000000000.txt': 'hello'})
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.path)
+
+    def test_counts(self):
+        import git
+        from fanscribed import gitaccounting
+        repo = gitaccounting.account(git.Repo(self.path))
+        counts = []
+        def handler(request):
+            commit = repo.commit('master')
+            gitaccounting.note_commit(commit)
+            commit.tree['0000000000000000.txt'].data_stream.read()
+            list(repo.iter_commits('master'))
+            counts.append(gitaccounting._current())
+        class DummyRequest(object):
+            matched_route = None
+            host = 'example.com'
+            GET = {}
+        gitaccounting.git_accounting_tween_factory(handler, None)(DummyRequest())
+        self.assertEqual(counts[0].processes, 1)  # rev-list
+        self.assertTrue(counts[0].object_reads >= 2)  # commit, tree, blob
+        self.assertTrue(counts[0].object_bytes >= len('hello'))
+        self.assertEqual(counts[0].commits, [repo.commit('master').hexsha])
+        self.assertEqual(gitaccounting._current(), None)
+
+
+class ProfilingTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        from fanscribed import profiling
+        self.path = tempfile.mkdtemp()
+        self.saved = profiling.directory, profiling.secret, profiling.sample, profiling.keep
+        profiling.directory = self.path
+        profiling.secret = 'sesame'
+        profiling.sample = 0
+        profiling.keep = 2
+
+    def tearDown(self):
+        import shutil
+        from fanscribed import profiling
+        profiling.directory, profiling.secret, profiling.sample, profiling.keep = self.saved
+        shutil.rmtree(self.path)
+
+    def _request(self, query='', headers={}):
+        from pyramid.request import Request
+        request = Request.blank('/?' + query, headers=headers)
+        class Route(object):
+            name = 'read'
+        request.matched_route = Route()
+        return request
+
+    def _tween(self):
+        from pyramid.response import Response
+        from fanscribed import profiling
+        return profiling.profiling_tween_factory(lambda request: Response('hi'), None)
+
+    def test_admin(self):
+        import os
+        import pstats
+        tween = self._tween()
+        # Not asked for, or without the secret.
+        tween(self._request())
+        tween(self._request('__profile=1'))
+        tween(self._request('__profile=1', {'X-Fanscribed-Profile': 'open'}))
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'read')))
+        response = tween(self._request('__profile=1', {'X-Fanscribed-Profile': 'sesame'}))
+        filename = response.headers['X-Fanscribed-Profile-File']
+        self.assertEqual(os.listdir(os.path.join(self.path, 'read')), [os.path.basename(filename)])
+        pstats.Stats(os.path.join(self.path, filename))
+
+    def test_sample(self):
+        import os
+        from fanscribed import profiling
+        profiling.sample = 1
+        tween = self._tween()
+        for x in xrange(3):
+            response = tween(self._request())
+            self.assertFalse('X-Fanscribed-Profile-File' in response.headers)
+        # Only the most recent are kept.
+        self.assertEqual(len(os.listdir(os.path.join(self.path, 'read'))), 2)
+
+
+class _CommittingTestCase(unittest.TestCase):
+    """Lets GitPython commit where there is no terminal to look up the login name of."""
+
+    def setUp(self):
+        import os
+        self.user = os.environ.get('USER')
+        os.environ['USER'] = 'fanscribed'
+
+    def tearDown(self):
+        import os
+        if self.user is None:
+            del os.environ['USER']
+        else:
+            os.environ['USER'] = self.user
+
+
+class CommitIdentityTests(_CommittingTestCase):
+    def setUp(self):
+        import subprocess
+        import tempfile
+        _CommittingTestCase.setUp(self)
+        self.path = tempfile.mkdtemp()
+        subprocess.check_call(['git', 'init', '-q', self.path])
+        subprocess.check_call(['git', 'config', 'user.name', 'Fanscribed'], cwd=self.path)
+        subprocess.check_call(['git', 'config', 'user.email', 'fanscribed@example.com'], cwd=self.path)
+        _commit_files(self.path, {'speakers.txt': ''})
+
+    def tearDown(self):
+        import shutil
+        _CommittingTestCase.tearDown(self)
+        shutil.rmtree(self.path)
+
+    def _commit(self, name, email, filename, text):
+        import os
+        import git
+        from fanscribed import repos
+        with repos.commit_lock:
+            repo = git.Repo(self.path)
+            index = repo.index
+            with open(os.path.join(self.path, filename), 'wb') as f:
+                f.write(text)
+            index.add([filename])
+            return repos.commit(repo, index, u'saved by ' + name, name, email)
+
+    def test_explicit_author(self):
+        import os
+        import git
+        environ = dict(os.environ)
+        commit = self._commit(u'Z\xf6e', u'zoe@example.com', 'speakers.txt', 'z;Zoe')
+        self.assertEqual(dict(os.environ), environ)
+        commit = git.Repo(self.path).commit('master')
+        self.assertEqual(commit.author.name, u'Z\xf6e')
+        self.assertEqual(commit.author.email, 'zoe@example.com')
+        self.assertEqual(commit.committer.name, 'Fanscribed')
+        self.assertEqual(commit.message, u'saved by Z\xf6e')
+        self.assertEqual(commit.tree['speakers.txt'].data_stream.read(), 'z;Zoe')
+
+    def test_threads(self):
+        import threading
+        import git
+        names = ['author{0}'.format(x) for x in xrange(8)]
+        def commit_as(name):
+            for x in xrange(5):
+                self._commit(name, name + '@example.com', name + '.txt', str(x))
+        threads = [threading.Thread(target=commit_as, args=(name,)) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        commits = list(git.Repo(self.path).iter_commits('master'))[:-1]
+        self.assertEqual(len(commits), 40)
+        for commit in commits:
+            name = commit.message[len('saved by '):]
+            self.assertEqual(commit.author.name, name)
+            self.assertEqual(commit.author.email, name + '@example.com')
+            self.assertEqual(commit.stats.files.keys(), [name + '.txt'])
+
+
+class WriterTests(_CommittingTestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        import threading
+        from fanscribed import common
+        from fanscribed import writer
+        from fanscribed.benchmarks.synthrepo import generate_repo
+        _CommittingTestCase.setUp(self)
+        self.path = tempfile.mkdtemp()
+        generate_repo(os.path.join(self.path, 'example.com'), duration=300000, commits=0, seed=0)
+        # Cache settings, for the writer's thread too.
+        common._settings = None
+        testing.setUp(settings={
+            'fanscribed.repos': self.path,
+            'fanscribed.snippet_seconds': '30',
+        })
+        common.app_settings()
+        self.socket_path = os.path.join(self.path, 'writer.sock')
+        self.server = writer.WriterServer(self.socket_path)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        import shutil
+        from fanscribed import common
+        self.server.shutdown()
+        self.server.server_close()
+        testing.tearDown()
+        common._settings = None
+        _CommittingTestCase.tearDown(self)
+        shutil.rmtree(self.path)
+
+    def test_operations(self):
+        import os
+        import git
+        from fanscribed import writer
+        identity = dict(identity_name=u'Z\xf6e', identity_email=u'zoe@example.com')
+        result = writer.call(self.socket_path, 'lock_snippet', 'example.com',
+                             desired_starting_point=30000, **identity)
+        self.assertEqual(result['starting_point'], 30000)
+        self.assertEqual(result['snippet_text'], u'')
+        self.assertRaises(writer.InvalidLock, writer.call, self.socket_path, 'save_snippet', 'example.com',
+                          lock_secret='wrong', starting_point=30000, snippet_text=u'hi', **identity)
+        writer.call(self.socket_path, 'save_snippet', 'example.com',
+                    lock_secret=result['lock_secret'], starting_point=30000,
+                    snippet_text=u'z;hello', **identity)
+        repo = git.Repo(os.path.join(self.path, 'example.com'))
+        commits = list(repo.iter_commits('master', max_count=2))
+        self.assertEqual([commit.message for commit in commits],
+                         [u'snippet: 0:30, saved by Z\xf6e', u'snippet: 0:30, locked by Z\xf6e'])
+        self.assertEqual(commits[0].author.name, u'Z\xf6e')
+        self.assertEqual(commits[0].tree['0000000000030000.txt'].data_stream.read(), 'z;hello')
+        # Operations run in process give the same results.
+        result = writer.run('lock_review', 'example.com', **identity)
+        self.assertEqual(result['starting_point'], None)
+
+    def test_failure(self):
+        import logging
+        from fanscribed import writer
+        # Other errors, even ValueErrors, are not mistaken for invalid locks.
+        writer.OPERATIONS['fail'] = lambda repo: int('not a number')
+        logging.getLogger('fanscribed.writer').disabled = True
+        try:
+            self.assertRaises(writer.WriterError, writer.call, self.socket_path, 'fail', 'example.com')
+        finally:
+            logging.getLogger('fanscribed.writer').disabled = False
+            del writer.OPERATIONS['fail']
+
+    def test_unavailable(self):
+        from fanscribed import writer
+        self.assertRaises(writer.WriterError, writer.call,
+                          self.socket_path + '.missing', 'lock_review', 'example.com',
+                          identity_name=u'Zoe', identity_email=u'zoe@example.com')
+
+
+class BansTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.path)
+
+    def _write(self, filename, text, mtime):
+        import os
+        path = os.path.join(self.path, filename)
+        with open(path, 'wb') as f:
+            f.write(text)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_ip_address_bans(self):
+        from fanscribed.bans import BanList
+        path = self._write('ip_address_bans.txt', '\n'.join([
+            '192.0.2.7;one address',
+            '192.0.2.0/24 ; a range',
+            '192.0.2.128/25;a narrower range',
+            '2001:db8::/32;an IPv6 range',
+            '198.51.100.0/33;not a range',
+            'not banned',
+        ]), 1300000000)
+        bans = BanList(path, ranges=True)
+        self.assertEqual(bans.reason('192.0.2.7'), 'one address')
+        self.assertEqual(bans.reason('192.0.2.8'), 'a range')
+        self.assertEqual(bans.reason('192.0.2.200'), 'a narrower range')
+        self.assertEqual(bans.reason('2001:db8:1::1'), 'an IPv6 range')
+        self.assertEqual(bans.reason('198.51.100.1'), None)
+        self.assertEqual(bans.reason('192.0.3.1'), None)
+        self.assertEqual(bans.reason('192.0.2.8, 10.0.0.1'), None)
+        # Picked up when the file changes.
+        self._write('ip_address_bans.txt', '0.0.0.0/0;everyone', 1300000060)
+        self.assertEqual(bans.reason('192.0.3.1'), 'everyone')
+        self.assertEqual(bans.reason('2001:db8::1'), None)
+
+    def test_banned_message(self):
+        import os
+        from fanscribed import bans
+        saved = bans.ip_address_bans, bans.email_bans
+        try:
+            bans.ip_address_bans = bans.BanList(os.path.join(self.path, 'missing.txt'), ranges=True)
+            bans.email_bans = bans.BanList(
+                self._write('email_bans.txt', 'a/b@example.com;spam\n', 1300000000))
+            self.assertEqual(bans.banned_message('192.0.2.1', 'a/b@example.com'), 'spam')
+            self.assertEqual(bans.banned_message('192.0.2.1', 'c@example.com'), None)
+            self.assertEqual(bans.banned_message('192.0.2.1'), None)
+        finally:
+            bans.ip_address_bans, bans.email_bans = saved
+
+
+class MaintenanceTests(_CommittingTestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        from fanscribed import maintenance
+        from fanscribed.benchmarks.synthrepo import generate_repo
+        _CommittingTestCase.setUp(self)
+        self.path = tempfile.mkdtemp()
+        self.repo_path = os.path.join(self.path, 'example.com')
+        generate_repo(self.repo_path, duration=300000, commits=20, seed=0)
+        self.saved = maintenance.loose_objects_threshold, maintenance.packs_threshold
+
+    def tearDown(self):
+        import shutil
+        from fanscribed import maintenance
+        maintenance.loose_objects_threshold, maintenance.packs_threshold = self.saved
+        _CommittingTestCase.tearDown(self)
+        shutil.rmtree(self.path)
+
+    def test_maintain(self):
+        import glob
+        import os
+        import git
+        from fanscribed import maintenance
+        from fanscribed import repos
+        repo = git.Repo(self.repo_path)
+        for x in xrange(5):
+            with open(os.path.join(self.repo_path, 'speakers.txt'), 'wb') as f:
+                f.write('s{0};Speaker'.format(x))
+            repo.index.add(['speakers.txt'])
+            repos.commit(repo, repo.index, 'speakers: save', u'Zoe', u'zoe@example.com')
+        loose = maintenance.object_counts(repo)['count']
+        self.assertTrue(loose >= 10)
+        maintenance.loose_objects_threshold = loose + 1
+        self.assertEqual(maintenance.maintain(repo), None)
+        maintenance.loose_objects_threshold = loose
+        maintenance.Scheduler(self.path, interval=60).run_once()
+        counts = maintenance.object_counts(repo)
+        self.assertEqual((counts['count'], counts['packs']), (0, 1))
+        self.assertEqual(len(glob.glob(os.path.join(self.repo_path, '.git', 'objects', 'pack', '*.bitmap'))), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.repo_path, '.git', 'objects', 'info', 'commit-graph')))
+        self.assertEqual(git.Repo(self.repo_path).commit('master').tree['speakers.txt'].data_stream.read(),
+                         's4;Speaker')
+
+    def test_only_prune_waits_for_writes(self):
+        import glob
+        import os
+        import threading
+        import time
+        import git
+        from fanscribed import maintenance
+        from fanscribed import repos
+        repo = git.Repo(self.repo_path)
+        bitmaps = os.path.join(self.repo_path, '.git', 'objects', 'pack', '*.bitmap')
+        thread = threading.Thread(target=maintenance.maintain, args=(repo, True))
+        with repos.commit_lock:
+            # A write is being made; repacking goes ahead regardless.
+            thread.start()
+            deadline = time.time() + 10
+            while not glob.glob(bitmaps) and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(len(glob.glob(bitmaps)), 1)
+            self.assertTrue(thread.is_alive())
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(maintenance.object_counts(repo)['count'], 0)
+
+
+class CompactionTests(_CommittingTestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        from fanscribed.benchmarks.synthrepo import generate_repo
+        _CommittingTestCase.setUp(self)
+        self.path = tempfile.mkdtemp()
+        self.repo_path = os.path.join(self.path, 'example.com')
+        generate_repo(self.repo_path, duration=600000, commits=200, seed=0)
+
+    def tearDown(self):
+        import shutil
+        _CommittingTestCase.tearDown(self)
+        shutil.rmtree(self.path)
+
+    def _history(self, repo):
+        from fanscribed.compaction import lock_only
+        from fanscribed.gitlog import iter_log
+        # A lock folded into the save that removes it leaves locks.json as it was.
+        return [
+            (entry.author_email, entry.authored_date,
+             sorted(change for change in entry.changes if change[0] != 'locks.json'))
+            for entry in iter_log(repo) if not lock_only(entry)
+        ]
+
+    def test_compact(self):
+        import git
+        from gitdb.util import hex_to_bin
+        from fanscribed import compaction
+        from fanscribed.gitlog import iter_log
+        from fanscribed import repos
+        from fanscribed import stats
+        repo = git.Repo(self.repo_path)
+        history = self._history(repo)
+        tree = repo.commit('master').tree.hexsha
+        entries = list(iter_log(repo))
+        lock_sha = [entry.hexsha for entry in entries[1:-1] if compaction.lock_only(entry)][0]
+        save_sha = [entry.hexsha for entry in entries[1:] if not compaction.lock_only(entry)][5]
+        since = entries[len(entries) / 2].hexsha
+        snippet_actions = stats.process_repo((self.repo_path, 'example.com', since, {})).snippet_actions
+        result = compaction.compact(repo)
+        self.assertEqual(result['before'], len(entries))
+        self.assertTrue(result['after'] < len(entries) / 2)
+        # Same tree, snippet history and authors.
+        repo = git.Repo(self.repo_path)
+        self.assertEqual(repo.commit('master').tree.hexsha, tree)
+        self.assertEqual(self._history(repo), history)
+        # Old shas lead to the commits that replaced them.
+        save_commit = repo.commit(repos.current_sha(repo, save_sha))
+        self.assertEqual(save_commit.tree, git.Commit(repo, hex_to_bin(save_sha)).tree)
+        self.assertTrue(save_commit.hexsha in [c.hexsha for c in repo.iter_commits('master')])
+        lock_commit = repo.commit(repos.current_sha(repo, lock_sha))
+        self.assertTrue(lock_commit.hexsha in [c.hexsha for c in repo.iter_commits('master')])
+        self.assertTrue(any('\nFolded: ' in c.message for c in repo.iter_commits('master')))
+        self.assertEqual(stats.process_repo((self.repo_path, 'example.com', since, {})).snippet_actions,
+                         snippet_actions)
+        # Compacting again changes nothing.
+        self.assertEqual(compaction.compact(repo)['before'], result['after'])
+        self.assertEqual(repo.commit(repos.current_sha(repo, save_sha)), save_commit)
+
+    def test_compact_while_written_to(self):
+        import git
+        from fanscribed import compaction
+        repo = git.Repo(self.repo_path)
+        rewrite = compaction._rewrite
+        written = []
+        def rewrite_then_write(repo, old_head, cutoff):
+            result = rewrite(repo, old_head, cutoff)
+            if not written:
+                # A save lands while history is being rewritten.
+                head = repo.commit('master')
+                written.append(repo.git.commit_tree(head.tree.hexsha, '-p', head.hexsha, '-m', 'Saved'))
+                repo.git.update_ref('refs/heads/master', written[0])
+            return result
+        compaction._rewrite = rewrite_then_write
+        try:
+            result = compaction.compact(repo)
+        finally:
+            compaction._rewrite = rewrite
+        # The rewrite was redone, keeping the save.
+        self.assertEqual(repo.commit('master').message, 'Saved\n')
+        self.assertNotEqual(repo.commit('master').hexsha, written[0])
+        self.assertEqual(int(repo.git.rev_list('--count', 'master')), result['after'])
@@ -12,17 +12,22 @@ import git
 
 from mako.template import Template
 
-from pyramid.httpexceptions import HTTPFound, HTTPNotFound
+from pyramid.httpexceptions import HTTPFound, HTTPNotFound, HTTPServiceUnavailable
 from pyramid.renderers import render
 from pyramid.response import Response
 from pyramid.threadlocal import get_current_registry
 from pyramid.view import view_config
 
+from fanscribed import audiojobs
+from fanscribed import bans
 from fanscribed import cache
 from fanscribed.common import app_settings
+from fanscribed import livestats
+from fanscribed import metrics
 from fanscribed import mp3
 from fanscribed import repos
 from fanscribed import transcripts
+from fanscribed import writer
 
 
 DEFAULT_KUDOS = """\
@@ -30,6 +35,14 @@ Kudos to ${author_name} for ${contributions} recent contribution${'' if contribu
 """
 
 
+# Number of snippets after a newly-locked one to cut audio for in advance.
+DEFAULT_PREFETCH_SNIPPETS = 2
+
+
+# Read files served by views in blocks of this many bytes.
+FILE_BLOCK_SIZE = 64 * 1024
+
+
 ROBOTS_TXT = """\
 User-agent: *
 Disallow: /edit
@@ -43,6 +56,32 @@ Disallow: /transcription.json
 # =================
 
 
+class _FileIter(object):
+    """An app_iter over an open file, which can also serve byte ranges of it."""
+
+    def __init__(self, f, block_size=FILE_BLOCK_SIZE):
+        self.file = f
+        self.block_size = block_size
+
+    def __iter__(self):
+        return self.app_iter_range(0, None)
+
+    def app_iter_range(self, start, stop):
+        self.file.seek(start)
+        remaining = None if stop is None else stop - start
+        while remaining is None or remaining > 0:
+            size = self.block_size if remaining is None else min(self.block_size, remaining)
+            data = self.file.read(size)
+            if not data:
+                break
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
+
+    def close(self):
+        self.file.close()
+
+
 def _anchor_from_ms(ms):
     seconds = ms / 1000
     minutes = seconds / 60
@@ -50,11 +89,32 @@ def _anchor_from_ms(ms):
     return '{0:d}m{1:02d}s'.format(minutes, seconds)
 
 
-def _label_from_ms(ms):
-    seconds = ms / 1000
-    minutes = seconds / 60
-    seconds %= 60
-    return '{0:d}:{1:02d}'.format(minutes, seconds)
+def _file_response(request, path, content_type):
+    """Return a response serving the file at ``path`` from this process.
+
+    Conditional requests and byte ranges are answered by WebOb.  Whole-file
+    responses are handed to the server's ``wsgi.file_wrapper`` when it has
+    one, so the server may use sendfile.
+    """
+    f = open(path, 'rb')
+    stat = os.fstat(f.fileno())
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if request.range is None and file_wrapper is not None:
+        app_iter = file_wrapper(f, FILE_BLOCK_SIZE)
+    else:
+        app_iter = _FileIter(f)
+    response = Response(
+        app_iter=app_iter,
+        content_type=content_type,
+        conditional_response=True,
+    )
+    response.content_length = stat.st_size
+    response.last_modified = stat.st_mtime
+    response.etag = '{0}-{1:d}-{2:d}'.format(
+        os.path.basename(path), stat.st_size, int(stat.st_mtime))
+    response.accept_ranges = 'bytes'
+    response.cache_control.max_age = 3600
+    return response
 
 
 def _ms_from_snippet_filename(filename):
@@ -65,10 +125,49 @@ def _ms_from_snippet_filename(filename):
         return None
 
 
+def _prefetch_variant(request):
+    """Return the snippet variant the player will ask for after this lock:
+    'low' if the request's quality or the player's low_bitrate_audio cookie
+    asks for it and lame can make it, otherwise None."""
+    low = request.params.get('quality') == 'low' or request.cookies.get('low_bitrate_audio')
+    return 'low' if low and mp3.LOW_BITRATE_AVAILABLE else None
+
+
+def _prefetch_snippet_audio(request, commit, starting_point, length):
+    """Queue cutting of the audio for the snippet (or review) just locked at
+    ``starting_point``, and for the ones after it on the grid, so that it is
+    ready by the time the player asks for it."""
+    settings = app_settings()
+    following = int(settings.get('fanscribed.prefetch_snippets', DEFAULT_PREFETCH_SNIPPETS))
+    full_mp3 = os.path.join(
+        settings['fanscribed.audio'],
+        '{0}.mp3'.format(request.host),
+    )
+    duration = json.load(commit.tree['transcription.json'].data_stream)['duration']
+    padding = repos.snippet_padding_ms()
+    variant = _prefetch_variant(request)
+    snippet_ms = repos.snippet_ms()
+    for x in xrange(following + 1):
+        prefetch_starting_point = starting_point + x * snippet_ms
+        if prefetch_starting_point + length - snippet_ms >= duration:
+            # Past the last snippet (or the last review).
+            break
+        mp3.prefetch_snippet(
+            full_mp3=full_mp3,
+            duration=duration,
+            output_path=settings['fanscribed.snippet_cache'],
+            starting_point=prefetch_starting_point,
+            length=length,
+            padding=padding,
+            scheduler=audiojobs.scheduler,
+            variant=variant,
+        )
+
+
 def _progress_dicts(tree, transcription_info):
     if 'duration' in transcription_info:
         duration = transcription_info['duration']
-        snippet_ms = _snippet_ms()
+        snippet_ms = repos.snippet_ms()
         snippets_total = duration / snippet_ms
         if duration % snippet_ms:
             snippets_total += 1
@@ -134,9 +233,10 @@ def _slugify(text):
     )
 
 
-def _snippet_ms():
-    snippet_seconds = int(app_settings()['fanscribed.snippet_seconds'])
-    return snippet_seconds * 1000
+def _notify_live_stats(request):
+    """Let the live stats engine, if enabled, know of a new commit."""
+    if livestats.engine is not None:
+        livestats.engine.notify(request.host)
 
 
 def _split_lines_and_expand_abbreviations(text, speakers_map):
@@ -181,6 +281,8 @@ def _standard_response(repo, commit):
         tracking_html=repos.file_at_commit(repo, 'tracking.html', commit)[0],
         transcription_info=transcription_info,
         transcription_info_json=json.dumps(transcription_info),
+        snippet_padding_ms=repos.snippet_padding_ms(),
+        low_bitrate_available=mp3.LOW_BITRATE_AVAILABLE,
     )
 
 
@@ -263,7 +365,7 @@ def read(request):
         # Go through all snippets, whether they've been transcribed or not.
         snippets = []
         speakers_map = repos.speakers_map(repo, commit)
-        for starting_point in range(0, transcription_info['duration'], _snippet_ms()):
+        for starting_point in range(0, transcription_info['duration'], repos.snippet_ms()):
             text = raw_snippets.get(starting_point, '').strip()
             lines = _split_lines_and_expand_abbreviations(text, speakers_map)
             snippets.append((starting_point, lines))
@@ -277,7 +379,8 @@ def read(request):
                 repo, 'preamble_completed.html', commit,
             )[0],
         )
-        content = render('fanscribed:templates/view.mako', data, request=request)
+        with metrics.timed('render'):
+            content = render('fanscribed:templates/view.mako', data, request=request)
         cache.cache_content(cache_key, content, mtime)
     return Response(content, date=mtime)
 
@@ -357,19 +460,10 @@ def post_speakers_txt(request):
     identity_name = request.POST.getone('identity_name')
     identity_email = request.POST.getone('identity_email')
     # Save transcription info.
-    repo, commit = repos.repo_from_request(request, rev='master')
-    with repos.commit_lock:
-        repo.heads['master'].checkout()
-        index = repo.index
-        filename = os.path.join(repo.working_dir, 'speakers.txt')
-        with open(filename, 'wb') as f:
-            f.write(text.encode('utf8'))
-        index.add(['speakers.txt'])
-        os.environ['GIT_AUTHOR_NAME'] = identity_name
-        os.environ['GIT_AUTHOR_EMAIL'] = identity_email
-        index.commit('speakers: save')
+    writer.execute(request, 'save_speakers',
+                   identity_name=identity_name, identity_email=identity_email, text=text)
     # Reload from repo and serve it up.
-    commit = repo.commit('master') # Refresh commit to match latest master.
+    repo, commit = repos.repo_from_request(request, rev='master')
     text, mtime = repos.file_at_commit(repo, 'speakers.txt', commit)
     return Response(text, content_type='text/plain', date=mtime)
 
@@ -392,7 +486,7 @@ def transcription_json(request):
     # Inject additional information into the info dict.
     settings = app_settings()
     info['snippet_ms'] = int(settings['fanscribed.snippet_seconds']) * 1000
-    info['snippet_padding_ms'] = int(float(settings['fanscribed.snippet_padding_seconds']) * 1000)
+    info['snippet_padding_ms'] = repos.snippet_padding_ms()
     return Response(body=json.dumps(info), content_type='application/json')
 
 
@@ -461,24 +555,8 @@ def snippet_info(request):
 def _banned_message(request):
     """Returns a reason why you're banned, or None if you're not banned."""
     ip_address = request.headers.get('X-Forwarded-For', request.remote_addr).strip()
-    ip_bans_filename = app_settings().get('fanscribed.ip_address_bans')
     email = request.POST.get('identity_email')
-    if ip_bans_filename:
-        with open(ip_bans_filename, 'rU') as f:
-            for line in f.readlines():
-                if ';' in line:
-                    candidate_ip_address, reason = line.strip().split(';', 1)
-                    if ip_address == candidate_ip_address:
-                        return reason.strip()
-    if email:
-        email_bans_filename = app_settings().get('fanscribed.email_bans')
-        if email_bans_filename:
-            with open(email_bans_filename, 'rU') as f:
-                for line in f.readlines():
-                    if ';' in line:
-                        candidate_email, reason = line.strip().split(';', 1)
-                        if email == candidate_email:
-                            return reason.strip()
+    return bans.banned_message(ip_address, email)
 
 
 @view_config(
@@ -502,35 +580,33 @@ def lock_snippet(request):
     desired_starting_point = request.POST.get('starting_point', None)
     if desired_starting_point is not None:
         desired_starting_point = int(desired_starting_point)
-    with repos.commit_lock:
+    # find and lock available snippet
+    result = writer.execute(request, 'lock_snippet',
+                            identity_name=identity_name, identity_email=identity_email,
+                            desired_starting_point=desired_starting_point)
+    starting_point = result['starting_point']
+    # if found,
+    if starting_point is not None:
+        _notify_live_stats(request)
+        # the player will ask for this snippet's audio next
         repo, commit = repos.repo_from_request(request, rev='master')
-        index = repo.index
-        # find and lock available snippet
-        starting_point, lock_secret_or_message = repos.lock_available_snippet(repo, index, desired_starting_point)
-        # if found,
-        if starting_point is not None:
-            # commit with identity
-            os.environ['GIT_AUTHOR_NAME'] = identity_name
-            os.environ['GIT_AUTHOR_EMAIL'] = identity_email
-            commit_message = 'snippet: %s, locked by %s' % (_label_from_ms(starting_point), identity_name)
-            index.commit(commit_message)
-            # return snippet info and text
-            snippet_text = repos.snippet_text(repo, index, starting_point)
-            body = json.dumps({
-                'lock_acquired': True,
-                'starting_point': starting_point,
-                'ending_point': starting_point + _snippet_ms(),
-                'lock_secret': lock_secret_or_message,
-                'snippet_text': snippet_text,
-            })
-            return Response(body, content_type='application/json')
-        else:
-            # return message
-            body = json.dumps({
-                'lock_acquired': False,
-                'message': lock_secret_or_message,
-            })
-            return Response(body, content_type='application/json')
+        _prefetch_snippet_audio(request, commit, starting_point, repos.snippet_ms())
+        # return snippet info and text
+        body = json.dumps({
+            'lock_acquired': True,
+            'starting_point': starting_point,
+            'ending_point': starting_point + repos.snippet_ms(),
+            'lock_secret': result['lock_secret'],
+            'snippet_text': result['snippet_text'],
+        })
+        return Response(body, content_type='application/json')
+    else:
+        # return message
+        body = json.dumps({
+            'lock_acquired': False,
+            'message': result['message'],
+        })
+        return Response(body, content_type='application/json')
 
 
 @view_config(
@@ -550,38 +626,33 @@ def lock_review(request):
     # unpack identity
     identity_name = request.POST.getone('identity_name')
     identity_email = request.POST.getone('identity_email')
-    with repos.commit_lock:
-        # Ignore commit; we want to save to master.
+    # find and lock available review
+    result = writer.execute(request, 'lock_review',
+                            identity_name=identity_name, identity_email=identity_email)
+    starting_point = result['starting_point']
+    # if found,
+    if starting_point is not None:
+        _notify_live_stats(request)
+        # the player will ask for this review's audio next
         repo, commit = repos.repo_from_request(request, rev='master')
-        index = repo.index
-        # find and lock available review
-        starting_point, lock_secret_or_message = repos.lock_available_review(repo, index)
-        # if found,
-        if starting_point is not None:
-            # commit with identity
-            os.environ['GIT_AUTHOR_NAME'] = identity_name
-            os.environ['GIT_AUTHOR_EMAIL'] = identity_email
-            commit_message = 'review: %s, locked by %s' % (_label_from_ms(starting_point), identity_name)
-            index.commit(commit_message)
-            # return review info and snippet texts
-            review_text_1 = repos.snippet_text(repo, index, starting_point)
-            review_text_2 = repos.snippet_text(repo, index, starting_point + _snippet_ms())
-            body = json.dumps({
-                'lock_acquired': True,
-                'starting_point': starting_point,
-                'ending_point': starting_point + (_snippet_ms() * 2),
-                'lock_secret': lock_secret_or_message,
-                'review_text_1': review_text_1,
-                'review_text_2': review_text_2,
-            })
-            return Response(body, content_type='application/json')
-        else:
-            # return message
-            body = json.dumps({
-                'lock_acquired': False,
-                'message': lock_secret_or_message,
-            })
-            return Response(body, content_type='application/json')
+        _prefetch_snippet_audio(request, commit, starting_point, repos.snippet_ms() * 2)
+        # return review info and snippet texts
+        body = json.dumps({
+            'lock_acquired': True,
+            'starting_point': starting_point,
+            'ending_point': starting_point + (repos.snippet_ms() * 2),
+            'lock_secret': result['lock_secret'],
+            'review_text_1': result['review_text_1'],
+            'review_text_2': result['review_text_2'],
+        })
+        return Response(body, content_type='application/json')
+    else:
+        # return message
+        body = json.dumps({
+            'lock_acquired': False,
+            'message': result['message'],
+        })
+        return Response(body, content_type='application/json')
 
 
 @view_config(
@@ -598,27 +669,11 @@ def save_snippet(request):
     snippet_text = transcripts.normalized_text(
         request.POST.getone('snippet_text').strip())
     inline = request.POST.get('inline') == '1'
-    with repos.commit_lock:
-        # find and validate the lock
-        # Ignore commit; we want to save to master.
-        repo, commit = repos.repo_from_request(request, rev='master')
-        index = repo.index
-        if not repos.lock_is_valid(repo, index, 'snippet', starting_point, lock_secret):
-            raise ValueError('Invalid lock')
-        # save the snippet text
-        repos.save_snippet_text(repo, index, starting_point, snippet_text)
-        # remove the lock
-        repos.remove_lock(repo, index, 'snippet', starting_point)
-        # remove the snippet from remaining snippets
-        if snippet_text:
-            repos.remove_snippet_from_remaining(repo, index, starting_point)
-        # commit with identity
-        os.environ['GIT_AUTHOR_NAME'] = identity_name
-        os.environ['GIT_AUTHOR_EMAIL'] = identity_email
-        commit_message = 'snippet: %s, saved by %s' % (_label_from_ms(starting_point), identity_name)
-        if inline:
-            commit_message += ' (inline)'
-        index.commit(commit_message)
+    writer.execute(request, 'save_snippet',
+                   identity_name=identity_name, identity_email=identity_email,
+                   lock_secret=lock_secret, starting_point=starting_point,
+                   snippet_text=snippet_text, inline=inline)
+    _notify_live_stats(request)
     return Response('', content_type='text/plain')
 
 
@@ -637,25 +692,11 @@ def save_review(request):
         request.POST.getone('review_text_1'))
     review_text_2 = transcripts.normalized_text(
         request.POST.getone('review_text_2'))
-    with repos.commit_lock:
-        # find and validate the lock
-        # Ignore commit; we want to save to master.
-        repo, commit = repos.repo_from_request(request, rev='master')
-        index = repo.index
-        if not repos.lock_is_valid(repo, index, 'review', starting_point, lock_secret):
-            raise ValueError('Invalid lock')
-        # save review texts
-        repos.save_snippet_text(repo, index, starting_point, review_text_1)
-        repos.save_snippet_text(repo, index, starting_point + _snippet_ms(), review_text_2)
-        # remove the lock
-        repos.remove_lock(repo, index, 'review', starting_point)
-        # remove the review from remaining reviews
-        repos.remove_review_from_remaining(repo, index, starting_point)
-        # commit with identity
-        os.environ['GIT_AUTHOR_NAME'] = identity_name
-        os.environ['GIT_AUTHOR_EMAIL'] = identity_email
-        commit_message = 'review: %s, saved by %s' % (_label_from_ms(starting_point), identity_name)
-        index.commit(commit_message)
+    writer.execute(request, 'save_review',
+                   identity_name=identity_name, identity_email=identity_email,
+                   lock_secret=lock_secret, starting_point=starting_point,
+                   review_text_1=review_text_1, review_text_2=review_text_2)
+    _notify_live_stats(request)
     # return empty indicating success
     return Response('', content_type='text/plain')
 
@@ -671,20 +712,10 @@ def cancel_snippet(request):
     starting_point = int(request.POST.getone('starting_point'))
     identity_name = request.POST.getone('identity_name')
     identity_email = request.POST.getone('identity_email')
-    with repos.commit_lock:
-        # find and validate the lock
-        # Ignore commit; we want to save to master.
-        repo, commit = repos.repo_from_request(request, rev='master')
-        index = repo.index
-        if not repos.lock_is_valid(repo, index, 'snippet', starting_point, lock_secret):
-            raise ValueError('Invalid lock')
-        # remove the lock
-        repos.remove_lock(repo, index, 'snippet', starting_point)
-        # commit with identity
-        os.environ['GIT_AUTHOR_NAME'] = identity_name
-        os.environ['GIT_AUTHOR_EMAIL'] = identity_email
-        commit_message = 'snippet: %s, cancel by %s' % (_label_from_ms(starting_point), identity_name)
-        index.commit(commit_message)
+    writer.execute(request, 'cancel_snippet',
+                   identity_name=identity_name, identity_email=identity_email,
+                   lock_secret=lock_secret, starting_point=starting_point)
+    _notify_live_stats(request)
     # return empty indicating success
     return Response('', content_type='text/plain')
 
@@ -700,20 +731,10 @@ def cancel_review(request):
     starting_point = int(request.POST.getone('starting_point'))
     identity_name = request.POST.getone('identity_name')
     identity_email = request.POST.getone('identity_email')
-    with repos.commit_lock:
-        # find and validate the lock
-        # Ignore commit; we want to save to master.
-        repo, commit = repos.repo_from_request(request, rev='master')
-        index = repo.index
-        if not repos.lock_is_valid(repo, index, 'review', starting_point, lock_secret):
-            raise ValueError('Invalid lock')
-        # remove the lock
-        repos.remove_lock(repo, index, 'review', starting_point)
-        # commit with identity
-        os.environ['GIT_AUTHOR_NAME'] = identity_name
-        os.environ['GIT_AUTHOR_EMAIL'] = identity_email
-        commit_message = 'review: %s, cancel by %s' % (_label_from_ms(starting_point), identity_name)
-        index.commit(commit_message)
+    writer.execute(request, 'cancel_review',
+                   identity_name=identity_name, identity_email=identity_email,
+                   lock_secret=lock_secret, starting_point=starting_point)
+    _notify_live_stats(request)
     # return empty indicating success
     return Response('', content_type='text/plain')
 
@@ -723,6 +744,11 @@ def cancel_review(request):
     route_name='snippet_mp3',
     context='fanscribed:resources.Root',
 )
+@view_config(
+    request_method='HEAD',
+    route_name='snippet_mp3',
+    context='fanscribed:resources.Root',
+)
 def snippet_mp3(request):
     repo, commit = repos.repo_from_request(request)
     # Get information needed from settings and repository.
@@ -740,17 +766,44 @@ def snippet_mp3(request):
     starting_point = int(request.GET.getone('starting_point'))
     length = int(request.GET.getone('length'))
     padding = int(request.GET.getone('padding'))
-    snippet_path = mp3.snippet_path(
-        full_mp3=full_mp3,
-        duration=duration,
-        output_path=snippet_cache,
-        starting_point=starting_point,
-        length=length,
-        padding=padding,
-    )
+    # quality=low selects a low-bitrate mono variant, for slow connections,
+    # if lame is installed to make it.
+    variant = 'low' if request.GET.get('quality') == 'low' and mp3.LOW_BITRATE_AVAILABLE else None
+    try:
+        snippet_path = mp3.snippet_path(
+            full_mp3=full_mp3,
+            duration=duration,
+            output_path=snippet_cache,
+            starting_point=starting_point,
+            length=length,
+            padding=padding,
+            scheduler=audiojobs.scheduler,
+            variant=variant,
+        )
+    except audiojobs.QueueFull as e:
+        # Too many new listeners at once; have them try again shortly.
+        raise HTTPServiceUnavailable(headers={'Retry-After': str(e.retry_after)})
+    # Deliver the snippet as configured.
+    delivery = settings.get('fanscribed.snippet_delivery', 'redirect')
+    if delivery == 'direct':
+        # Serve it ourselves.
+        return _file_response(request, snippet_path, 'audio/mpeg')
     relative_path = os.path.relpath(snippet_path, snippet_cache)
-    snippet_url = urlparse.urljoin(snippet_url_prefix, relative_path)
-    raise HTTPFound(location=snippet_url)
+    if delivery == 'x-accel-redirect':
+        # Have nginx serve it from an internal location.
+        accel_prefix = settings.get('fanscribed.snippet_accel_prefix', snippet_url_prefix)
+        response = Response(content_type='audio/mpeg')
+        response.headers['X-Accel-Redirect'] = urlparse.urljoin(accel_prefix, relative_path)
+        return response
+    elif delivery == 'x-sendfile':
+        # Have Apache (mod_xsendfile) or lighttpd serve it from the filesystem.
+        response = Response(content_type='audio/mpeg')
+        response.headers['X-Sendfile'] = os.path.abspath(snippet_path)
+        return response
+    else:
+        # Redirect the client to where the front-end serves static files.
+        snippet_url = urlparse.urljoin(snippet_url_prefix, relative_path)
+        raise HTTPFound(location=snippet_url)
 
 
 @view_config(
@@ -771,7 +824,7 @@ def snippets_updated(request):
     cache_key = 'updated-{0}-{1}'.format(request_commit.hexsha, since_rev)
     content, mtime = cache.get_cached_content(cache_key)
     if content is None or request.GET.has_key('nocache'):
-        since_commit = repo.commit(since_rev)
+        since_commit = repo.commit(repos.current_sha(repo, since_rev))
         files_updated = set()
         for commit in repo.iter_commits(request_commit):
             # Have we reached the end?
@@ -802,6 +855,40 @@ def snippets_updated(request):
     return Response(content, content_type='application/json', date=mtime)
 
 
+@view_config(
+    request_method='GET',
+    route_name='live_stats_authors',
+    context='fanscribed:resources.Root',
+)
+def live_stats_authors(request):
+    if livestats.engine is None:
+        raise HTTPNotFound()
+    return Response(livestats.engine.authors_json(), content_type='application/json')
+
+
+@view_config(
+    request_method='GET',
+    route_name='live_stats_transcripts',
+    context='fanscribed:resources.Root',
+)
+def live_stats_transcripts(request):
+    if livestats.engine is None:
+        raise HTTPNotFound()
+    return Response(livestats.engine.transcripts_json(), content_type='application/json')
+
+
+@view_config(
+    request_method='GET',
+    route_name='metrics',
+    context='fanscribed:resources.Root',
+)
+def metrics_view(request):
+    if not metrics.enabled:
+        raise HTTPNotFound()
+    return Response(metrics.exposition(), content_type='text/plain; version=0.0.4',
+                    cache_control='no-cache')
+
+
 @view_config(
     request_method='GET',
     route_name='rss_basic',
@@ -833,7 +920,7 @@ def rss_basic(request, max_actions=50):
             if snippets_affected:
                 earliest_ms = min(snippets_affected)
                 anchor = _anchor_from_ms(earliest_ms)
-                position = _label_from_ms(earliest_ms)
+                position = repos.label_from_ms(earliest_ms)
                 author = c.author
                 date = c.authored_date
                 kwargs = dict(
@@ -865,7 +952,8 @@ def rss_basic(request, max_actions=50):
             request=request,
             rfc822_from_time=rfc822_from_time,
         )
-        content = render('fanscribed:templates/rss_basic.xml.mako', data, request=request)
+        with metrics.timed('render'):
+            content = render('fanscribed:templates/rss_basic.xml.mako', data, request=request)
         cache.cache_content(cache_key, content, mtime)
     return Response(content, content_type='application/rss+xml', date=mtime)
 
@@ -895,7 +983,7 @@ def rss_completion(request, percentage_gap=5):
         transcription_info, _ = repos.json_file_at_commit(
             repo, 'transcription.json', commit, required=True)
         duration = transcription_info['duration']
-        snippet_ms = _snippet_ms()
+        snippet_ms = repos.snippet_ms()
         snippets_total = duration / snippet_ms
         if duration % snippet_ms:
             snippets_total += 1
@@ -936,7 +1024,8 @@ def rss_completion(request, percentage_gap=5):
             request=request,
             rfc822_from_time=rfc822_from_time,
         )
-        content = render('fanscribed:templates/rss_completion.xml.mako', data, request=request)
+        with metrics.timed('render'):
+            content = render('fanscribed:templates/rss_completion.xml.mako', data, request=request)
         cache.cache_content(cache_key, content, mtime)
     return Response(content, content_type='application/rss+xml', date=mtime)
 
@@ -1002,7 +1091,7 @@ def rss_kudos(request, max_hours=24, default_minutes=60):
                 author = c.author
                 author_actions = timegroup_authors.setdefault(author.name, dict(actions=[]))['actions']
                 anchor = _anchor_from_ms(earliest_ms)
-                position = _label_from_ms(earliest_ms)
+                position = repos.label_from_ms(earliest_ms)
                 kwargs = dict(
                     host=request.host,
                     rev=c.hexsha,
@@ -1030,13 +1119,14 @@ def rss_kudos(request, max_hours=24, default_minutes=60):
                 kudos_line = random.choice(kudos_lines).strip()
                 kudos_template = Template(text=kudos_line)
                 # Render it.
-                kudos = kudos_template.render(
-                    author_name=author_name,
-                    contributions=len(actions),
-                    latest_action=latest_action,
-                    transcription_info=transcription_info,
-                    request=request,
-                )
+                with metrics.timed('render'):
+                    kudos = kudos_template.render(
+                        author_name=author_name,
+                        contributions=len(actions),
+                        latest_action=latest_action,
+                        transcription_info=transcription_info,
+                        request=request,
+                    )
                 # Keep it with the author info.
                 author_info['kudos'] = kudos
                 author_info['latest_action'] = latest_action
@@ -1050,6 +1140,7 @@ def rss_kudos(request, max_hours=24, default_minutes=60):
             end_timestamp=end_timestamp,
             minutes_per_item=minutes_per_item,
         )
-        content = render('fanscribed:templates/rss_kudos.xml.mako', data, request=request)
+        with metrics.timed('render'):
+            content = render('fanscribed:templates/rss_kudos.xml.mako', data, request=request)
         cache.cache_content(cache_key, content, mtime)
     return Response(content, content_type='application/rss+xml', date=mtime)
@@ -0,0 +1,301 @@
+"""Write operations on transcript repositories, and a daemon to run them.
+
+Locking, saving and cancelling snippets and reviews, and saving speakers,
+are the only things that write to repositories.  Each is an operation
+here, taking a repository and JSON-compatible arguments, and returning a
+JSON-compatible result.
+
+By default, views run operations in their own process, one at a time
+under ``repos.commit_lock``.  That lock only works within one process, so
+with more than one worker, set fanscribed.writer_socket and run::
+
+    $ paster writer production.ini
+
+Workers then send each operation to the writer over a Unix socket, and
+the writer runs them one at a time, under the same lock.  Operations
+registered with ``locked=False``, such as repository maintenance, take
+the lock themselves only for what needs it, and don't hold up writes.
+"""
+
+import json
+import logging
+import os
+import socket
+import SocketServer
+
+from paste.deploy.loadwsgi import loadapp
+from paste.script.command import Command
+from pyramid.threadlocal import manager
+
+from fanscribed.common import app_settings
+from fanscribed import repos
+
+
+# Set by ``fanscribed.main`` when fanscribed.writer_socket is set.
+socket_path = None
+
+# Seconds to wait for the writer to answer.
+timeout = 30
+
+
+log = logging.getLogger(__name__)
+
+
+OPERATIONS = {
+    # name: function(repo, **kwargs),
+}
+
+
+class WriterError(Exception):
+    """The writer could not be reached, or failed unexpectedly."""
+
+
+class InvalidLock(ValueError):
+    """The lock secret given does not match the lock."""
+
+
+def operation(function=None, locked=True):
+    """Register a write operation.  Unless ``locked`` is False, it runs with
+    ``repos.commit_lock`` held."""
+    if function is None:
+        return lambda function: operation(function, locked)
+    function.locked = locked
+    OPERATIONS[function.__name__] = function
+    return function
+
+
+# ===================================================================
+# operations
+
+
+@operation
+def lock_snippet(repo, identity_name, identity_email, desired_starting_point=None):
+    index = repo.index
+    # find and lock available snippet
+    starting_point, lock_secret_or_message = repos.lock_available_snippet(repo, index, desired_starting_point)
+    if starting_point is None:
+        return dict(starting_point=None, message=lock_secret_or_message)
+    # commit with identity
+    commit_message = 'snippet: %s, locked by %s' % (repos.label_from_ms(starting_point), identity_name)
+    repos.commit(repo, index, commit_message, identity_name, identity_email)
+    return dict(
+        starting_point=starting_point,
+        lock_secret=lock_secret_or_message,
+        snippet_text=repos.snippet_text(repo, index, starting_point),
+    )
+
+
+@operation
+def lock_review(repo, identity_name, identity_email):
+    index = repo.index
+    # find and lock available review
+    starting_point, lock_secret_or_message = repos.lock_available_review(repo, index)
+    if starting_point is None:
+        return dict(starting_point=None, message=lock_secret_or_message)
+    # commit with identity
+    commit_message = 'review: %s, locked by %s' % (repos.label_from_ms(starting_point), identity_name)
+    repos.commit(repo, index, commit_message, identity_name, identity_email)
+    return dict(
+        starting_point=starting_point,
+        lock_secret=lock_secret_or_message,
+        review_text_1=repos.snippet_text(repo, index, starting_point),
+        review_text_2=repos.snippet_text(repo, index, starting_point + repos.snippet_ms()),
+    )
+
+
+@operation
+def save_snippet(repo, identity_name, identity_email, lock_secret, starting_point, snippet_text, inline=False):
+    index = repo.index
+    # find and validate the lock
+    if not repos.lock_is_valid(repo, index, 'snippet', starting_point, lock_secret):
+        raise InvalidLock('Invalid lock')
+    # save the snippet text
+    repos.save_snippet_text(repo, index, starting_point, snippet_text)
+    # remove the lock
+    repos.remove_lock(repo, index, 'snippet', starting_point)
+    # remove the snippet from remaining snippets
+    if snippet_text:
+        repos.remove_snippet_from_remaining(repo, index, starting_point)
+    # commit with identity
+    commit_message = 'snippet: %s, saved by %s' % (repos.label_from_ms(starting_point), identity_name)
+    if inline:
+        commit_message += ' (inline)'
+    repos.commit(repo, index, commit_message, identity_name, identity_email)
+
+
+@operation
+def save_review(repo, identity_name, identity_email, lock_secret, starting_point, review_text_1, review_text_2):
+    index = repo.index
+    # find and validate the lock
+    if not repos.lock_is_valid(repo, index, 'review', starting_point, lock_secret):
+        raise InvalidLock('Invalid lock')
+    # save review texts
+    repos.save_snippet_text(repo, index, starting_point, review_text_1)
+    repos.save_snippet_text(repo, index, starting_point + repos.snippet_ms(), review_text_2)
+    # remove the lock
+    repos.remove_lock(repo, index, 'review', starting_point)
+    # remove the review from remaining reviews
+    repos.remove_review_from_remaining(repo, index, starting_point)
+    # commit with identity
+    commit_message = 'review: %s, saved by %s' % (repos.label_from_ms(starting_point), identity_name)
+    repos.commit(repo, index, commit_message, identity_name, identity_email)
+
+
+def _cancel(repo, lock_type, identity_name, identity_email, lock_secret, starting_point):
+    index = repo.index
+    # find and validate the lock
+    if not repos.lock_is_valid(repo, index, lock_type, starting_point, lock_secret):
+        raise InvalidLock('Invalid lock')
+    # remove the lock
+    repos.remove_lock(repo, index, lock_type, starting_point)
+    # commit with identity
+    commit_message = '%s: %s, cancel by %s' % (lock_type, repos.label_from_ms(starting_point), identity_name)
+    repos.commit(repo, index, commit_message, identity_name, identity_email)
+
+
+@operation
+def cancel_snippet(repo, **kwargs):
+    _cancel(repo, 'snippet', **kwargs)
+
+
+@operation
+def cancel_review(repo, **kwargs):
+    _cancel(repo, 'review', **kwargs)
+
+
+@operation
+def save_speakers(repo, identity_name, identity_email, text):
+    repo.heads['master'].checkout()
+    index = repo.index
+    filename = os.path.join(repo.working_dir, 'speakers.txt')
+    with open(filename, 'wb') as f:
+        f.write(text.encode('utf8'))
+    index.add(['speakers.txt'])
+    repos.commit(repo, index, 'speakers: save', identity_name, identity_email)
+
+
+# ===================================================================
+# running operations
+
+
+def run(name, repo_name, **kwargs):
+    """Run operation ``name`` on the repository at host ``repo_name`` in this process."""
+    function = OPERATIONS[name]
+    if not function.locked:
+        return function(repos.open_repo(repo_name), **kwargs)
+    with repos.commit_lock:
+        return function(repos.open_repo(repo_name), **kwargs)
+
+
+def call(path, name, repo_name, wait=None, **kwargs):
+    """Have the writer listening at ``path`` run operation ``name``, and return
+    its result, waiting up to ``wait`` seconds (by default, ``timeout``)."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(wait if wait is not None else timeout)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(dict(operation=name, repo=repo_name, kwargs=kwargs)) + '\n')
+        sock.shutdown(socket.SHUT_WR)
+        f = sock.makefile('rb')
+        reply = f.read()
+        f.close()
+    except socket.error as e:
+        raise WriterError('Writer at {0} unavailable: {1}'.format(path, e))
+    finally:
+        sock.close()
+    if not reply:
+        raise WriterError('Writer at {0} closed the connection'.format(path))
+    reply = json.loads(reply)
+    if 'error' in reply:
+        if reply['error'] == 'InvalidLock':
+            # Raised as if the operation ran here.
+            raise InvalidLock(reply['message'])
+        raise WriterError(reply['message'])
+    return reply['result']
+
+
+def execute(request, name, **kwargs):
+    """Run operation ``name`` on the request's repository, through the
+    writer if there is one."""
+    if socket_path is None:
+        return run(name, request.host, **kwargs)
+    else:
+        return call(socket_path, name, request.host, **kwargs)
+
+
+class WriterHandler(SocketServer.StreamRequestHandler):
+
+    # Don't let a stalled client tie up a thread.
+    timeout = 10
+
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline())
+            # JSON keys are unicode; keyword argument names can't be.
+            kwargs = dict((str(key), value) for key, value in message['kwargs'].iteritems())
+            reply = dict(result=run(message['operation'], message['repo'], **kwargs))
+        except InvalidLock as e:
+            reply = dict(error='InvalidLock', message=str(e))
+        except Exception as e:
+            log.exception('Operation failed')
+            reply = dict(error=type(e).__name__, message=str(e))
+        self.wfile.write(json.dumps(reply))
+
+
+class WriterServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Runs operations sent to it, each in its own thread.  Locked operations
+    wait for ``repos.commit_lock``, so run one at a time."""
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            # Left behind by a writer that was stopped.
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, WriterHandler)
+
+
+class WriterCommand(Command):
+
+    min_args = 1
+    max_args = 1
+    usage = 'CONFIG_FILE'
+    takes_config_file = 1
+    summary = 'Run the writer for all transcript repositories'
+    description = """\
+    This command listens on the Unix socket given by fanscribed.writer_socket,
+    and runs the write operations that app workers send it, one at a time.
+    """
+    default_verbosity = 1
+
+    parser = Command.standard_parser()
+
+    def command(self):
+        logging.basicConfig()
+        # Load config file.
+        app_spec = 'config:{0}'.format(self.args[0])
+        base = os.getcwd()
+        app = loadapp(app_spec, name='main', relative_to=base, global_conf={})
+        # Read settings.
+        settings = app.registry.settings
+        path = settings.get('fanscribed.writer_socket')
+        if not path:
+            print 'fanscribed.writer_socket is not set'
+            return 1
+        # Operations read settings from the current registry, which only
+        # this thread has; caching them here shares them with the others.
+        manager.push({'registry': app.registry, 'request': None})
+        app_settings()
+        # Repository maintenance runs here, alongside writes, rather than in workers.
+        from fanscribed import maintenance
+        if maintenance.scheduler is not None:
+            maintenance.scheduler.start()
+        server = WriterServer(path)
+        print 'Writer listening on {0}'.format(path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(path)
@@ -43,10 +43,18 @@ setup(
 
         [paste.paster_command]
         cleanup = fanscribed.cleanup:CleanupCommand
+        compact = fanscribed.compaction:CompactCommand
         initrepo = fanscribed.initrepo:InitRepoCommand
+        maintain = fanscribed.maintenance:MaintainCommand
+        pregenerate = fanscribed.pregenerate:PregenerateCommand
+        writer = fanscribed.writer:WriterCommand
 
         [console_scripts]
         fanscribed-stats = fanscribed.stats:main
+        fanscribed-bench-snippets = fanscribed.benchmarks.snippets:main
+        fanscribed-bench-load = fanscribed.benchmarks.load:main
+        fanscribed-bench-micro = fanscribed.benchmarks.micro:main
+        fanscribed-synth-repo = fanscribed.benchmarks.synthrepo:main
     """,
     paster_plugins=[
         'pyramid',